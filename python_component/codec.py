@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 消息编解码器
+负责消息体的序列化，帧格式（4字节小端长度头）由IPC层处理
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import json
+from typing import Dict, Any, List
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DEFAULT_CODEC = 'json'
+
+class JsonCodec:
+    """UTF-8 JSON编解码器（默认，RimePythonWrapper.cs使用）"""
+
+    name = 'json'
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        """序列化消息体"""
+        return json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """解析消息体"""
+        # data可以是bytes或帧读取器返回的memoryview
+        return json.loads(str(data, 'utf-8'))
+
+class MsgpackCodec:
+    """MessagePack二进制编解码器，需要安装msgpack"""
+
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("msgpack模块未安装")
+        self._packer = msgpack.Packer(use_bin_type=True)
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        """序列化消息体"""
+        return self._packer.pack(message)
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """解析消息体"""
+        return msgpack.unpackb(data, raw=False)
+
+_CODEC_CLASSES = {
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+def available_codecs() -> List[str]:
+    """返回当前环境可用的编解码器名称"""
+    names = [JsonCodec.name]
+    if msgpack is not None:
+        names.append(MsgpackCodec.name)
+    return names
+
+def get_codec(name: str = DEFAULT_CODEC):
+    """
+    创建编解码器实例
+
+    Args:
+        name: 编解码器名称
+
+    Returns:
+        编解码器实例
+
+    Raises:
+        ValueError: 编解码器未知或依赖缺失
+    """
+    codec_class = _CODEC_CLASSES.get(name)
+    if codec_class is None:
+        raise ValueError(f"未知编解码器: {name}")
+    return codec_class()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 消息帧传输
+流式套接字（TCP/Unix域套接字）上的帧格式：4字节小端长度头 + 消息体
+
+服务器、客户端、基准测试和集成测试共用此模块：接收时用recv_into读入预分配的
+缓冲区并正确处理短读，发送时长度头和消息体通过一次sendmsg（不支持时为一次
+sendall）写出并处理部分写入。SocketOptions负责延迟相关的套接字选项。
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import sys
+import socket
+import struct
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<I')
+
+# 单帧消息体的最大长度，防止损坏的长度头导致分配过大的缓冲区
+MAX_FRAME_SIZE = 16 << 20
+
+# FrameReader的初始缓冲区大小，超过时按需扩大
+DEFAULT_BUFFER_SIZE = 64 << 10
+
+# 旧版本Python的socket模块没有导出SO_BUSY_POLL，Linux上的值为46
+SO_BUSY_POLL = getattr(socket, 'SO_BUSY_POLL', 46 if sys.platform.startswith('linux') else None)
+
+class FrameError(ValueError):
+    """帧格式错误"""
+
+@dataclass
+class SocketOptions:
+    """
+    已连接套接字的延迟调优选项
+
+    默认关闭Nagle算法：请求/响应模式下，小消息在前一个报文未确认时会被Nagle
+    算法扣留，与对端的延迟确认叠加可造成约40ms的停顿。缓冲区大小和忙轮询为0时
+    保持系统默认值。
+    """
+
+    # TCP_NODELAY（仅TCP套接字）
+    tcp_nodelay: bool = True
+    # SO_SNDBUF / SO_RCVBUF 字节数
+    send_buffer: int = 0
+    recv_buffer: int = 0
+    # SO_BUSY_POLL 微秒数（仅Linux，增大超过系统设置需要CAP_NET_ADMIN）
+    busy_poll: int = 0
+
+    def apply(self, sock):
+        """
+        应用到已连接的套接字
+
+        Args:
+            sock: socket.socket 或 asyncio传输层提供的套接字
+        """
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay))
+
+        if self.send_buffer > 0:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        if self.recv_buffer > 0:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+
+        if self.busy_poll > 0:
+            if SO_BUSY_POLL is None:
+                logger.warning("当前平台不支持SO_BUSY_POLL")
+                return
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, self.busy_poll)
+            except OSError as e:
+                logger.warning(f"设置SO_BUSY_POLL失败: {e}")
+
+def encode_frame(payload: bytes) -> bytes:
+    """在消息体前加上长度头（用于只接受单个缓冲区的写入接口）"""
+    return HEADER.pack(len(payload)) + payload
+
+def send_frame(sock: socket.socket, payload: bytes):
+    """
+    发送一帧消息
+
+    长度头和消息体在一次系统调用中写出，部分写入时继续发送剩余部分。
+
+    Args:
+        sock: 已连接的流式套接字
+        payload: 消息体
+    """
+    header = HEADER.pack(len(payload))
+
+    if not hasattr(sock, 'sendmsg'):
+        # Windows没有sendmsg，合并后一次sendall
+        sock.sendall(header + payload)
+        return
+
+    sent = sock.sendmsg([header, payload])
+    if sent < HEADER.size:
+        sock.sendall(header[sent:])
+        sock.sendall(payload)
+    elif sent < HEADER.size + len(payload):
+        sock.sendall(memoryview(payload)[sent - HEADER.size:])
+
+def recv_exact_into(sock: socket.socket, view: memoryview) -> bool:
+    """
+    读满view
+
+    Returns:
+        对端在读满之前关闭连接时返回False
+    """
+    received = 0
+    while received < len(view):
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return False
+        received += count
+    return True
+
+def recv_frame(sock: socket.socket) -> Optional[bytearray]:
+    """
+    接收一帧消息体（不做缓冲，适合一次性的请求/响应）
+
+    Returns:
+        消息体，连接关闭时返回None
+
+    Raises:
+        FrameError: 长度头超过MAX_FRAME_SIZE
+    """
+    header = bytearray(HEADER.size)
+    if not recv_exact_into(sock, memoryview(header)):
+        return None
+
+    length = HEADER.unpack(header)[0]
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(f"消息过大: {length} 字节")
+
+    payload = bytearray(length)
+    if not recv_exact_into(sock, memoryview(payload)):
+        return None
+    return payload
+
+class FrameReader:
+    """
+    带缓冲的帧读取器
+
+    每次recv_into尽量多读，一次系统调用可能读入多帧（流水线请求），
+    后续帧直接从缓冲区中取出。返回的是缓冲区上的memoryview，
+    只在下一次read_frame调用之前有效，调用方应立即解码。
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        """
+        Args:
+            sock: 已连接的流式套接字
+            buffer_size: 初始缓冲区大小
+        """
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        # 缓冲区中未消费数据的范围
+        self.start = 0
+        self.end = 0
+
+    def read_frame(self) -> Optional[memoryview]:
+        """
+        读取一帧消息体
+
+        Returns:
+            消息体视图，连接关闭时返回None
+
+        Raises:
+            FrameError: 长度头超过MAX_FRAME_SIZE
+        """
+        if not self._fill(HEADER.size):
+            return None
+
+        length = HEADER.unpack_from(self.buffer, self.start)[0]
+        if length > MAX_FRAME_SIZE:
+            raise FrameError(f"消息过大: {length} 字节")
+
+        if not self._fill(HEADER.size + length):
+            return None
+
+        begin = self.start + HEADER.size
+        self.start = begin + length
+        return self.view[begin:self.start]
+
+    def _fill(self, size: int) -> bool:
+        """保证缓冲区中至少有size字节未消费数据"""
+        available = self.end - self.start
+        if available >= size:
+            return True
+        if available == 0:
+            self.start = self.end = 0
+
+        if self.start + size > len(self.buffer):
+            if size > len(self.buffer):
+                # 换一块更大的缓冲区，之前返回的视图仍指向旧缓冲区
+                buffer = bytearray(max(size, 2 * len(self.buffer)))
+                buffer[:available] = self.view[self.start:self.end]
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                # 把未消费的数据移到缓冲区开头
+                self.view[:available] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = available
+
+        while self.end - self.start < size:
+            count = self.sock.recv_into(self.view[self.end:])
+            if count == 0:
+                return False
+            self.end += count
+        return True
@@ -8,44 +8,141 @@ Unity Rime输入法集成 - IPC服务器
 版本: 1.0.0
 """
 
+# 最先导入，启动计时从这里开始
+import startup
 import socket
 import json
+import asyncio
+import argparse
 import threading
 import logging
+import os
+import stat
 import signal
 import sys
 import time
-from typing import Dict, Any, Optional
+import itertools
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
 from rime_wrapper import RimeWrapper
+from session_manager import SessionManager
+from codec import DEFAULT_CODEC, available_codecs, get_codec
+from framing import MAX_FRAME_SIZE, FrameError, FrameReader, SocketOptions, encode_frame, send_frame
+from logging_setup import LOG_LEVELS, LogSampler, setup_logging
+from metrics import MetricsHTTPServer, ServerMetrics
+from tracing import RequestTrace, activate, current_trace
+import shm_transport
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('ipc_server.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+startup.lap('import')
+
+# 日志在main()中通过logging_setup配置（后台线程写入，不阻塞请求处理）
 logger = logging.getLogger(__name__)
 
+# 传输方式：tcp（默认，Unity使用）、unix（Unix域套接字）、shm（共享内存环形缓冲区，仅AsyncIPCServer）
+TRANSPORTS = ('tcp', 'unix', 'shm')
+DEFAULT_UNIX_PATH = "/tmp/unity_rime.sock"
+
+def bind_unix_socket(path: str, backlog: int) -> socket.socket:
+    """创建并监听Unix域套接字，删除上次运行遗留的套接字文件"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server_socket.bind(path)
+    server_socket.listen(backlog)
+    return server_socket
+
+def client_session_key(session_id: Any) -> tuple:
+    """
+    请求中显式指定的session_id对应的会话键
+    
+    按repr区分，类型不同的值（1与"1"、1与1.0）是不同的会话。
+    工作池按同样的repr把连接分配给工作进程（见worker_pool.worker_for）。
+    """
+    return ('client', repr(session_id))
+
+class ClientConnection:
+    """单个客户端连接的状态"""
+    
+    def __init__(self, connection_id: int):
+        """
+        初始化连接状态
+        
+        Args:
+            connection_id: 连接编号
+        """
+        self.key = ('connection', connection_id)
+        self.codec = get_codec(DEFAULT_CODEC)
+        # set_codec命令的响应仍使用旧编解码器发送，发送完成后再切换
+        self.pending_codec = None
+    
+    def apply_pending_codec(self):
+        """切换到协商好的编解码器"""
+        if self.pending_codec is not None:
+            self.codec = self.pending_codec
+            self.pending_codec = None
+
 class IPCServer:
     """IPC服务器，处理与Unity的通信"""
     
-    def __init__(self, host: str = "127.0.0.1", port: int = 9999):
+    # 需要Rime会话的命令
+    SESSION_COMMANDS = ('process_key', 'select_candidate', 'clear_composition', 'get_state',
+                        'page_up', 'page_down', 'get_page')
+    # 单独统计延迟的命令，其余命令计入unknown，避免任意命令名撑大指标
+    METRIC_COMMANDS = frozenset(('ping', 'set_codec', 'stats', 'batch') + SESSION_COMMANDS)
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 9999, max_sessions: int = 256,
+                 transport: str = "tcp", unix_path: str = DEFAULT_UNIX_PATH,
+                 socket_options: Optional[SocketOptions] = None,
+                 command_log_sampler: Optional[LogSampler] = None, metrics_port: int = 0,
+                 rime_backend: str = "auto", rime_library: Optional[str] = None,
+                 rime_dictionaries: Optional[List[str]] = None, ready_fd: Optional[int] = None,
+                 startup_profile: bool = False):
         """
         初始化IPC服务器
         
         Args:
             host: 服务器地址
             port: 服务器端口
+            max_sessions: 会话池中Rime会话的最大数量
+            transport: 传输方式（tcp/unix）
+            unix_path: Unix域套接字路径（transport为unix或shm时使用）
+            socket_options: 客户端连接的套接字选项，默认开启TCP_NODELAY
+            command_log_sampler: 每条命令日志的采样器，默认每种命令每秒最多记录10条
+            metrics_port: Prometheus指标端点的本地端口，0表示不启用
+            rime_backend: Rime引擎后端（见RimeWrapper.BACKENDS）
+            rime_library: native后端的librime_dll路径
+            rime_dictionaries: 模拟后端使用的离线词典文件（*.dict.yaml或编译后的*.trie）
+            ready_fd: 开始监听后写入就绪通知的文件描述符（见startup.notify_ready）
+            startup_profile: 就绪时是否在标准错误输出启动各阶段耗时
         """
+        if transport not in TRANSPORTS:
+            raise ValueError(f"未知传输方式: {transport}")
+        
         self.host = host
         self.port = port
+        self.max_sessions = max_sessions
+        self.transport = transport
+        self.unix_path = unix_path
+        self.socket_options = socket_options or SocketOptions()
+        self.command_log_sampler = command_log_sampler or LogSampler(max_per_second=10)
+        self.metrics = ServerMetrics(lambda: len(self.session_manager) if self.session_manager else 0)
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.rime_backend = rime_backend
+        self.rime_library = rime_library
+        self.rime_dictionaries = rime_dictionaries
+        self.ready_fd = ready_fd
+        self.startup_profile = startup_profile
         self.server_socket = None
         self.client_socket = None
         self.is_running = False
         self.rime_wrapper = None
+        self.session_manager = None
+        self.connection_ids = itertools.count(1)
         
         # 设置信号处理
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -60,22 +157,24 @@ class IPCServer:
     def start(self):
         """启动服务器"""
         try:
-            # 初始化Rime包装器
-            logger.info("初始化Rime包装器...")
-            self.rime_wrapper = RimeWrapper()
-            
-            if not self.rime_wrapper.is_initialized:
-                logger.error("Rime包装器初始化失败")
+            if not self._initialize():
                 return False
             
             # 创建服务器套接字
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(1)
+            if self.transport == 'shm':
+                logger.error("共享内存传输需要使用asyncio模式")
+                return False
+            elif self.transport == 'unix':
+                self.server_socket = self._bind_unix_socket(1)
+            else:
+                self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.server_socket.bind((self.host, self.port))
+                self.server_socket.listen(1)
             
             self.is_running = True
-            logger.info(f"IPC服务器启动成功，监听 {self.host}:{self.port}")
+            logger.info(f"IPC服务器启动成功，监听 {self._address()}")
+            self._notify_ready()
             
             # 等待客户端连接
             self._accept_connections()
@@ -86,6 +185,55 @@ class IPCServer:
             logger.error(f"启动服务器失败: {e}")
             return False
     
+    def _initialize(self) -> bool:
+        """初始化Rime包装器、会话池和指标端点，失败返回False"""
+        logger.info("初始化Rime包装器...")
+        self.rime_wrapper = RimeWrapper(backend=self.rime_backend, library_path=self.rime_library,
+                                        dictionaries=self.rime_dictionaries)
+        
+        if not self.rime_wrapper.is_initialized:
+            logger.error("Rime包装器初始化失败")
+            return False
+        
+        self.session_manager = SessionManager(self.rime_wrapper, self.max_sessions)
+        self._start_metrics_endpoint()
+        startup.lap('server')
+        return True
+    
+    def _notify_ready(self):
+        """开始监听后通知启动者，按需输出启动各阶段耗时"""
+        startup.lap('listen')
+        if self.startup_profile:
+            # 先输出再通知，启动者收到通知后可能立即结束本进程
+            profile = startup.startup_profile()
+            profile.finish()
+            print(profile.report(), file=sys.stderr, flush=True)
+        startup.notify_ready(self.ready_fd, f"监听 {self._address()}")
+    
+    def _start_metrics_endpoint(self):
+        """启用时启动Prometheus指标端点"""
+        if self.metrics_port:
+            self.metrics_server = MetricsHTTPServer(self.metrics, "127.0.0.1", self.metrics_port)
+            self.metrics_server.start()
+    
+    def _address(self) -> str:
+        """监听地址的描述"""
+        if self.transport == 'tcp':
+            return f"{self.host}:{self.port}"
+        return f"{self.transport}:{self.unix_path}"
+    
+    def _bind_unix_socket(self, backlog: int) -> socket.socket:
+        """创建并监听Unix域套接字，删除上次运行遗留的套接字文件"""
+        return bind_unix_socket(self.unix_path, backlog)
+    
+    def _unlink_unix_socket(self):
+        """删除Unix域套接字文件"""
+        if self.transport != 'tcp':
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+    
     def _accept_connections(self):
         """接受客户端连接"""
         while self.is_running:
@@ -93,6 +241,7 @@ class IPCServer:
                 logger.info("等待Unity客户端连接...")
                 client_socket, client_address = self.server_socket.accept()
                 logger.info(f"Unity客户端已连接: {client_address}")
+                self.socket_options.apply(client_socket)
                 
                 # 处理客户端连接
                 self._handle_client(client_socket)
@@ -105,107 +254,266 @@ class IPCServer:
     def _handle_client(self, client_socket):
         """处理客户端请求"""
         self.client_socket = client_socket
+        connection = ClientConnection(next(self.connection_ids))
+        reader = FrameReader(client_socket)
+        self.metrics.connection_opened()
         
         try:
             while self.is_running:
                 # 接收数据
-                data = self._receive_message(client_socket)
-                if not data:
+                message_data = reader.read_frame()
+                if message_data is None:
                     break
+                self.metrics.frames_received()
                 
                 # 处理请求
-                response = self._process_request(data)
+                response_data = self._handle_frame(connection, message_data)
                 
                 # 发送响应
-                self._send_message(client_socket, response)
+                send_frame(client_socket, response_data)
                 
         except Exception as e:
             logger.error(f"处理客户端请求失败: {e}")
         finally:
             client_socket.close()
             self.client_socket = None
+            self.metrics.connection_closed()
+            self.session_manager.release(connection.key)
             logger.info("客户端连接已关闭")
     
-    def _receive_message(self, client_socket) -> Optional[Dict[str, Any]]:
-        """接收消息"""
+    def _handle_frame(self, connection: ClientConnection, message_data: bytes) -> bytes:
+        """
+        处理一帧请求（不含长度头），返回编码后的响应消息体
+        
+        所有传输方式共用此方法，消息体按连接协商的编解码器编解码。
+        调用前需通过metrics.frames_received登记收到的帧，
+        这里记录从解码到编码完成的延迟。请求带有 "trace": true 时在响应中附加分阶段计时。
+        """
+        start_ns = time.perf_counter_ns()
+        command = 'unknown'
+        response_data = b''
+        error = True
         try:
-            # 先接收消息长度（4字节）
-            length_data = client_socket.recv(4)
-            if len(length_data) != 4:
-                return None
-            
-            message_length = int.from_bytes(length_data, byteorder='little')
-            
-            # 接收完整消息
-            message_data = b''
-            while len(message_data) < message_length:
-                chunk = client_socket.recv(message_length - len(message_data))
-                if not chunk:
-                    return None
-                message_data += chunk
-            
-            # 解析JSON
-            message_str = message_data.decode('utf-8')
-            return json.loads(message_str)
-            
-        except Exception as e:
-            logger.error(f"接收消息失败: {e}")
-            return None
+            request = connection.codec.decode(message_data)
+            if not isinstance(request, dict):
+                # JSON数组、数字等不是请求对象，返回错误响应，连接保持可用
+                response_data = connection.codec.encode(
+                    {"success": False, "error": f"请求必须是对象，收到: {type(request).__name__}"})
+                return response_data
+            command = self._metric_command(request.get('command'))
+            if request.get('trace'):
+                response, response_data = self._process_traced_request(request, connection, start_ns)
+            else:
+                response = self._process_request(request, connection)
+                response_data = connection.codec.encode(response)
+            error = 'error' in response
+            connection.apply_pending_codec()
+            return response_data
+        finally:
+            self.metrics.request_completed(command, time.perf_counter_ns() - start_ns,
+                                           len(message_data), len(response_data), error)
     
-    def _send_message(self, client_socket, message: Dict[str, Any]):
-        """发送消息"""
-        try:
-            # 序列化为JSON
-            message_str = json.dumps(message, ensure_ascii=False)
-            message_data = message_str.encode('utf-8')
-            
-            # 发送消息长度（4字节）
-            length_data = len(message_data).to_bytes(4, byteorder='little')
-            client_socket.send(length_data)
-            
-            # 发送消息内容
-            client_socket.send(message_data)
-            
-        except Exception as e:
-            logger.error(f"发送消息失败: {e}")
+    def _metric_command(self, command: Any) -> str:
+        """指标和日志采样中使用的命令名，不在METRIC_COMMANDS中的命令（包括不是字符串的）计为unknown"""
+        if isinstance(command, str) and command in self.METRIC_COMMANDS:
+            return command
+        return 'unknown'
+    
+    def _process_traced_request(self, request: Dict[str, Any], connection: ClientConnection,
+                                start_ns: int):
+        """
+        带分阶段计时地处理请求
+        
+        响应编码计时后把计时结果加入响应再编码一次，第二次编码不计入。
+        
+        Returns:
+            (响应, 编码后的响应消息体)
+        """
+        trace = RequestTrace(start_ns)
+        trace.lap('decode')
+        with activate(trace):
+            response = self._process_request(request, connection)
+        trace.lap('post_process')
+        
+        connection.codec.encode(response)
+        trace.lap('encode')
+        
+        response['trace'] = trace.to_dict()
+        return response, connection.codec.encode(response)
+    
+    def _process_request(self, request: Dict[str, Any], connection: ClientConnection = None) -> Dict[str, Any]:
+        """
+        处理请求
+        
+        请求中带有id字段时，响应带上相同的id，客户端据此在同一连接上
+        保持多个未完成的请求（流水线）。
+        
+        Args:
+            request: 请求消息
+            connection: 发出请求的连接，未显式指定session_id时使用该连接自己的会话
+        """
+        response = self._execute_request(request, connection)
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
     
-    def _process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
-        """处理请求"""
+    def _execute_request(self, request: Dict[str, Any], connection: ClientConnection = None) -> Dict[str, Any]:
+        """执行请求中的命令"""
         try:
             command = request.get('command', '')
             params = request.get('params', {})
             
-            logger.info(f"处理命令: {command}")
+            # 按指标命令名采样，任意客户端命令名都计入unknown，采样状态不会无限增长
+            self.command_log_sampler.log(logger, logging.INFO, self._metric_command(command),
+                                         "处理命令: %s", command)
             
-            if command == 'process_key':
-                # 处理按键
-                key_code = params.get('key_code', 0)
-                return self.rime_wrapper.process_key(key_code)
-                
-            elif command == 'select_candidate':
-                # 选择候选词
-                index = params.get('index', 0)
-                return self.rime_wrapper.select_candidate(index)
-                
-            elif command == 'clear_composition':
-                # 清空输入
-                return self.rime_wrapper.clear_composition()
-                
-            elif command == 'get_state':
-                # 获取当前状态
-                return self.rime_wrapper.get_current_state()
-                
-            elif command == 'ping':
+            if command == 'ping':
                 # 心跳检测
                 return {"success": True, "message": "pong"}
-                
-            else:
+            
+            elif command == 'stats':
+                # 运行指标
+                return {"success": True, "stats": self.metrics.snapshot()}
+            
+            elif command == 'set_codec':
+                # 协商编解码器，本次响应仍使用当前编解码器
+                codec_name = params.get('codec', DEFAULT_CODEC)
+                try:
+                    codec = get_codec(codec_name)
+                except ValueError as e:
+                    return {"error": str(e), "codecs": available_codecs()}
+                if connection is not None:
+                    connection.pending_codec = codec
+                return {"success": True, "codec": codec_name}
+            
+            elif command != 'batch' and command not in self.SESSION_COMMANDS:
                 return {"error": f"未知命令: {command}"}
+            
+            # 获取本次请求使用的Rime会话
+            if 'session_id' in params:
+                session_key = client_session_key(params['session_id'])
+            else:
+                session_key = connection.key if connection else None
+            session_id = self.session_manager.acquire(session_key)
+            if session_id is None:
+                return {"error": "无法创建Rime会话"}
+            
+            trace = current_trace()
+            if trace:
+                trace.lap('dispatch')
+            
+            if command == 'batch':
+                # 批量执行
+                response = self._process_batch(params, session_id)
+            else:
+                response = self._dispatch_session_command(command, params, session_id)
+            
+            if params.get('delta'):
+                self._apply_state_delta(response, session_id, params)
+            return response
                 
         except Exception as e:
             logger.error(f"处理请求失败: {e}")
             return {"error": str(e)}
     
+    def _dispatch_session_command(self, command: str, params: Dict[str, Any], session_id: int) -> Dict[str, Any]:
+        """在指定Rime会话上执行命令"""
+        if command == 'process_key':
+            # 处理按键
+            key_code = params.get('key_code', 0)
+            return self.rime_wrapper.process_key(key_code, session_id)
+            
+        elif command == 'select_candidate':
+            # 选择候选词
+            index = params.get('index', 0)
+            return self.rime_wrapper.select_candidate(index, session_id)
+            
+        elif command == 'clear_composition':
+            # 清空输入
+            return self.rime_wrapper.clear_composition(session_id)
+            
+        elif command == 'get_state':
+            # 获取当前状态
+            return self.rime_wrapper.get_current_state(session_id)
+            
+        elif command == 'page_up':
+            # 候选词上一页
+            return self.rime_wrapper.page_up(session_id)
+            
+        elif command == 'page_down':
+            # 候选词下一页
+            return self.rime_wrapper.page_down(session_id)
+            
+        elif command == 'get_page':
+            # 跳转到指定页
+            page_no = params.get('page_no', 0)
+            return self.rime_wrapper.get_page(page_no, session_id)
+            
+        else:
+            return {"error": f"未知命令: {command}"}
+    
+    def _process_batch(self, params: Dict[str, Any], session_id: int) -> Dict[str, Any]:
+        """
+        在同一会话上按顺序执行一组操作
+        
+        params:
+            operations: 操作列表，每项格式与普通请求相同（command + params），
+                        只允许process_key/select_candidate/clear_composition/get_state
+            results: "final"（默认）只返回最后一步的响应；"all" 返回每一步的响应
+            stop_on_error: 某一步失败时是否停止执行，默认True
+        """
+        operations = params.get('operations', [])
+        return_all = params.get('results', 'final') == 'all'
+        stop_on_error = params.get('stop_on_error', True)
+        
+        if not operations:
+            return {"error": "batch命令缺少operations"}
+        
+        results = []
+        response = None
+        steps = 0
+        for operation in operations:
+            steps += 1
+            command = operation.get('command', '')
+            if command not in self.SESSION_COMMANDS:
+                response = {"error": f"batch中不支持的命令: {command}"}
+            else:
+                response = self._dispatch_session_command(command, operation.get('params', {}), session_id)
+            
+            if return_all:
+                results.append(response)
+            if stop_on_error and 'error' in response:
+                break
+        
+        if return_all:
+            return {"success": all('error' not in r for r in results), "steps": steps, "results": results}
+        
+        response['steps'] = steps
+        return response
+    
+    def _apply_state_delta(self, response: Dict[str, Any], session_id: int, params: Dict[str, Any]):
+        """
+        将响应中的完整状态替换为相对客户端已确认版本的增量
+        
+        客户端在params中提供base_version（已确认的版本号），响应中的delta只包含
+        发生变化的字段，客户端用它更新本地状态即可得到version对应的状态。
+        指定full或base_version未知、已过期时保留完整的state作为快照，并设置full为True。
+        """
+        if 'state' not in response:
+            return
+        
+        base_version = params.get('base_version')
+        delta = None
+        if base_version is not None and not params.get('full'):
+            delta = self.rime_wrapper.get_state_delta(session_id, base_version)
+        if delta is None:
+            response['full'] = True
+            return
+        
+        del response['state']
+        response['base_version'] = base_version
+        response['delta'] = delta
+    
     def stop(self):
         """停止服务器"""
         self.is_running = False
@@ -221,104 +529,581 @@ class IPCServer:
                 self.server_socket.close()
             except:
                 pass
+            self._unlink_unix_socket()
+        
+        if self.metrics_server:
+            self.metrics_server.stop()
+        
+        if self.session_manager:
+            self.session_manager.close()
+        
+        logger.info("IPC服务器已停止")
+
+class AsyncIPCServer(IPCServer):
+    """
+    基于asyncio的IPC服务器
+    
+    在单个事件循环中并发服务多个Unity客户端，消息格式与IPCServer完全相同
+    （4字节小端长度头 + UTF-8 JSON），因此与RimePythonWrapper.cs保持兼容。
+    除tcp和unix外还支持shm（共享内存环形缓冲区）传输。
+    """
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 9999, max_sessions: int = 256,
+                 transport: str = "tcp", unix_path: str = DEFAULT_UNIX_PATH, backlog: int = 512,
+                 socket_options: Optional[SocketOptions] = None,
+                 command_log_sampler: Optional[LogSampler] = None, metrics_port: int = 0,
+                 rime_backend: str = "auto", rime_library: Optional[str] = None,
+                 rime_dictionaries: Optional[List[str]] = None, ready_fd: Optional[int] = None,
+                 startup_profile: bool = False):
+        """
+        初始化异步IPC服务器
+        
+        Args:
+            host: 服务器地址
+            port: 服务器端口
+            max_sessions: 会话池中Rime会话的最大数量
+            transport: 传输方式（tcp/unix/shm）
+            unix_path: Unix域套接字路径（transport为unix或shm时使用）
+            backlog: 监听队列长度
+            socket_options: 客户端连接的套接字选项（shm传输不使用）
+            command_log_sampler: 每条命令日志的采样器
+            metrics_port: Prometheus指标端点的本地端口，0表示不启用
+            rime_backend: Rime引擎后端（见RimeWrapper.BACKENDS）
+            rime_library: native后端的librime_dll路径
+            rime_dictionaries: 模拟后端使用的离线词典文件（*.dict.yaml或编译后的*.trie）
+            ready_fd: 开始监听后写入就绪通知的文件描述符（见startup.notify_ready）
+            startup_profile: 就绪时是否在标准错误输出启动各阶段耗时
+        """
+        super().__init__(host, port, max_sessions, transport, unix_path, socket_options,
+                         command_log_sampler, metrics_port, rime_backend, rime_library,
+                         rime_dictionaries, ready_fd, startup_profile)
+        self.backlog = backlog
+        self.loop = None
+        self.server = None
+        self.stopped = None
+        self.client_writers = set()
+        # ShmChannel -> ClientConnection
+        self.shm_channels = {}
+    
+    def start(self):
+        """启动服务器（阻塞直到服务器停止）"""
+        try:
+            asyncio.run(self._serve())
+            return True
+        except Exception as e:
+            logger.error(f"启动服务器失败: {e}")
+            return False
+    
+    def _initialize(self) -> bool:
+        """在事件循环中初始化Rime包装器、会话池和指标端点，失败返回False"""
+        if not super()._initialize():
+            return False
+        self.loop = asyncio.get_running_loop()
+        return True
+    
+    async def _serve(self):
+        """创建监听套接字并运行事件循环"""
+        if not self._initialize():
+            return
+        
+        if self.transport == 'shm':
+            if not shm_transport.is_supported():
+                logger.error("当前平台不支持共享内存传输")
+                return
+            await self._serve_shm()
+            return
+        
+        if self.transport == 'unix':
+            self.server = await asyncio.start_unix_server(
+                self._handle_connection, sock=self._bind_unix_socket(self.backlog)
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port,
+                reuse_address=True, backlog=self.backlog
+            )
+        
+        self.is_running = True
+        logger.info(f"异步IPC服务器启动成功，监听 {self._address()}")
+        self._notify_ready()
+        
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._unlink_unix_socket()
+    
+    async def _serve_shm(self):
+        """通过共享内存环形缓冲区服务客户端，Unix域套接字只用于握手和检测断开"""
+        listen_socket = self._bind_unix_socket(self.backlog)
+        listen_socket.setblocking(False)
+        self.stopped = self.loop.create_future()
+        self.loop.add_reader(listen_socket, self._accept_shm_connection, listen_socket)
+        
+        self.is_running = True
+        logger.info(f"异步IPC服务器启动成功，监听 {self._address()}")
+        self._notify_ready()
+        
+        try:
+            await self.stopped
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.remove_reader(listen_socket)
+            listen_socket.close()
+            for channel in list(self.shm_channels):
+                self._close_shm_connection(channel)
+            self._unlink_unix_socket()
+    
+    def _accept_shm_connection(self, listen_socket: socket.socket):
+        """接受共享内存连接并完成握手"""
+        try:
+            control_socket, _ = listen_socket.accept()
+        except BlockingIOError:
+            return
+        
+        try:
+            control_socket.setblocking(True)
+            channel = shm_transport.ShmChannel.accept(control_socket)
+            control_socket.setblocking(False)
+        except Exception as e:
+            logger.error(f"共享内存握手失败: {e}")
+            control_socket.close()
+            return
+        
+        connection = ClientConnection(next(self.connection_ids))
+        self.shm_channels[channel] = connection
+        self.metrics.connection_opened()
+        self.loop.add_reader(channel.recv_event, self._on_shm_request, channel, connection)
+        self.loop.add_reader(control_socket, self._on_shm_control, channel)
+        logger.info(f"Unity客户端已通过共享内存连接: {connection.key}")
+    
+    def _on_shm_request(self, channel: shm_transport.ShmChannel, connection: ClientConnection):
+        """处理环形缓冲区中的所有请求，全部写入响应后只唤醒客户端一次"""
+        responded = False
+        messages = channel.drain()
+        self.metrics.frames_received(len(messages))
+        # 已交给_handle_frame的帧数，其余的帧在关闭连接时登记为丢弃
+        handled = 0
+        try:
+            for message_data in messages:
+                handled += 1
+                try:
+                    response_data = self._handle_frame(connection, message_data)
+                except Exception as e:
+                    logger.error(f"处理客户端请求失败: {e}")
+                    self._close_shm_connection(channel)
+                    return
+                
+                if len(response_data) > shm_transport.MAX_MESSAGE_SIZE:
+                    logger.error(f"响应过大（{len(response_data)} 字节），超出共享内存环形缓冲区容量")
+                    response_data = self._oversized_shm_response(connection, message_data, len(response_data))
+                
+                if not channel.try_send(response_data):
+                    logger.error("共享内存响应缓冲区已满，关闭连接")
+                    self._close_shm_connection(channel)
+                    return
+                responded = True
+            
+            if responded:
+                channel.notify()
+        finally:
+            self.metrics.frames_dropped(len(messages) - handled)
+    
+    def _oversized_shm_response(self, connection: ClientConnection, message_data: bytes, size: int) -> bytes:
+        """代替放不进环形缓冲区的响应的错误响应，带上请求的id以便流水线客户端匹配"""
+        response = {"success": False,
+                    "error": f"响应过大（{size} 字节），超出共享内存环形缓冲区容量"}
+        try:
+            request = connection.codec.decode(message_data)
+            if isinstance(request, dict) and 'id' in request:
+                response['id'] = request['id']
+        except Exception:
+            pass
+        return connection.codec.encode(response)
+    
+    def _on_shm_control(self, channel: shm_transport.ShmChannel):
+        """控制套接字可读表示客户端已断开"""
+        try:
+            data = channel.control_socket.recv(1)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        
+        if not data:
+            self._close_shm_connection(channel)
+    
+    def _close_shm_connection(self, channel: shm_transport.ShmChannel):
+        """关闭共享内存连接并释放其会话"""
+        connection = self.shm_channels.pop(channel, None)
+        if connection is None:
+            return
+        
+        self.loop.remove_reader(channel.recv_event)
+        self.loop.remove_reader(channel.control_socket)
+        channel.close()
+        self.metrics.connection_closed()
+        self.session_manager.release(connection.key)
+        logger.info(f"客户端连接已关闭: {connection.key}")
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理单个客户端连接"""
+        client_address = writer.get_extra_info('peername')
+        logger.info(f"Unity客户端已连接: {client_address}")
+        self.socket_options.apply(writer.get_extra_info('socket'))
+        self.client_writers.add(writer)
+        connection = ClientConnection(next(self.connection_ids))
+        self.metrics.connection_opened()
+        
+        try:
+            while self.is_running:
+                # 接收数据
+                message_data = await self._receive_frame_async(reader)
+                if message_data is None:
+                    break
+                self.metrics.frames_received()
+                
+                # 处理请求
+                response_data = await self._handle_frame_async(connection, message_data)
+                
+                # 发送响应
+                writer.write(encode_frame(response_data))
+                await writer.drain()
+                
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.error(f"处理客户端请求失败: {e}")
+        finally:
+            self.client_writers.discard(writer)
+            self.metrics.connection_closed()
+            self.session_manager.release(connection.key)
+            writer.close()
+            logger.info(f"客户端连接已关闭: {client_address}")
+    
+    async def _handle_frame_async(self, connection: ClientConnection, message_data: bytes) -> bytes:
+        """
+        在事件循环中处理一帧请求
+        
+        默认直接调用_handle_frame；子类需要在处理前等待其他I/O（例如工作进程查询
+        整个工作池的统计）时重写此方法，等待期间不阻塞其他连接。
+        """
+        return self._handle_frame(connection, message_data)
+    
+    async def _receive_frame_async(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """
+        接收一帧消息体
+        
+        Raises:
+            FrameError: 长度头超过MAX_FRAME_SIZE（调用者关闭连接）
+        """
+        try:
+            length_data = await reader.readexactly(4)
+            message_length = int.from_bytes(length_data, byteorder='little')
+            if message_length > MAX_FRAME_SIZE:
+                raise FrameError(f"消息过大: {message_length} 字节")
+            return await reader.readexactly(message_length)
+        except asyncio.IncompleteReadError:
+            return None
+        except FrameError:
+            raise
+        except Exception as e:
+            logger.error(f"接收消息失败: {e}")
+            return None
+    
+    def stop(self):
+        """停止服务器"""
+        self.is_running = False
+        
+        if self.loop:
+            def _close():
+                if self.server:
+                    self.server.close()
+                for writer in list(self.client_writers):
+                    writer.close()
+                if self.stopped and not self.stopped.done():
+                    self.stopped.set_result(None)
+            
+            try:
+                self.loop.call_soon_threadsafe(_close)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+        
+        if self.metrics_server:
+            self.metrics_server.stop()
+        
+        if self.session_manager:
+            self.session_manager.close()
         
         logger.info("IPC服务器已停止")
 
 class IPCClient:
     """IPC客户端，用于测试与服务器的通信"""
     
-    def __init__(self, host: str = "127.0.0.1", port: int = 9999):
+    def __init__(self, host: str = "127.0.0.1", port: int = 9999, pipelined: bool = False,
+                 timeout: float = 30.0, transport: str = "tcp", unix_path: str = DEFAULT_UNIX_PATH,
+                 socket_options: Optional[SocketOptions] = None):
         """
         初始化IPC客户端
         
         Args:
             host: 服务器地址
             port: 服务器端口
+            pipelined: 是否启用流水线模式（请求带id，由后台线程接收响应）
+            timeout: 流水线模式下send_request等待响应的超时时间（秒），也是shm传输
+                等待请求缓冲区空间的超时时间
+            transport: 传输方式（tcp/unix/shm），需与服务器一致
+            unix_path: Unix域套接字路径（transport为unix或shm时使用）
+            socket_options: 套接字选项，默认开启TCP_NODELAY
         """
+        if transport not in TRANSPORTS:
+            raise ValueError(f"未知传输方式: {transport}")
+        
         self.host = host
         self.port = port
+        self.transport = transport
+        self.unix_path = unix_path
+        self.socket_options = socket_options or SocketOptions()
         self.socket = None
+        self.reader = None
+        self.shm_channel = None
         self.is_connected = False
+        self.codec = get_codec(DEFAULT_CODEC)
+        self.receive_codec = self.codec
+        self.pipelined = pipelined
+        self.timeout = timeout
+        self.request_ids = itertools.count(1)
+        self.pending_requests = {}
+        self.pending_codecs = {}
+        self.pending_lock = threading.Lock()
+        self.send_lock = threading.RLock()
+        self.receive_thread = None
     
     def connect(self) -> bool:
         """连接到服务器"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            if self.transport == 'shm':
+                self.shm_channel = shm_transport.ShmChannel.connect(self.unix_path)
+                self.socket = self.shm_channel.control_socket
+                address = f"shm:{self.unix_path}"
+            elif self.transport == 'unix':
+                self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.socket.connect(self.unix_path)
+                address = f"unix:{self.unix_path}"
+            else:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.connect((self.host, self.port))
+                address = f"{self.host}:{self.port}"
+            if self.shm_channel is None:
+                self.socket_options.apply(self.socket)
+            self.reader = FrameReader(self.socket)
             self.is_connected = True
-            logger.info(f"已连接到服务器 {self.host}:{self.port}")
+            logger.info(f"已连接到服务器 {address}")
+            
+            if self.pipelined:
+                self.receive_thread = threading.Thread(target=self._receive_loop, daemon=True)
+                self.receive_thread.start()
             return True
         except Exception as e:
             logger.error(f"连接服务器失败: {e}")
             return False
     
-    def send_request(self, command: str, params: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
-        """发送请求"""
+    def send_request(self, command: str, params: Dict[str, Any] = None,
+                     trace: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        发送请求
+        
+        Args:
+            command: 命令名
+            params: 命令参数
+            trace: 是否请求服务器在响应的trace字段中返回分阶段计时
+        """
         if not self.is_connected:
             return None
         
         try:
+            if self.pipelined:
+                return self.submit(command, params, trace).result(self.timeout)
+            
             # 构建请求
             request = {
                 "command": command,
                 "params": params or {}
             }
+            if trace:
+                request["trace"] = True
             
-            # 发送请求
-            self._send_message(request)
-            
-            # 接收响应
-            return self._receive_message()
+            with self.send_lock:
+                # 发送请求
+                self._send_message(request)
+                
+                # 接收响应
+                return self._receive_message()
             
         except Exception as e:
             logger.error(f"发送请求失败: {e}")
             return None
     
+    def submit(self, command: str, params: Dict[str, Any] = None, trace: bool = False) -> Future:
+        """
+        发送请求但不等待响应（仅流水线模式）
+        
+        Returns:
+            响应到达后完成的Future
+        """
+        return self._submit(next(self.request_ids), command, params, trace)
+    
+    def _submit(self, request_id: int, command: str, params: Dict[str, Any] = None,
+                trace: bool = False) -> Future:
+        """以指定id发送请求"""
+        future = Future()
+        if not self.pipelined or not self.is_connected:
+            future.set_exception(ConnectionError("未以流水线模式连接到服务器"))
+            return future
+        
+        request = {
+            "id": request_id,
+            "command": command,
+            "params": params or {}
+        }
+        if trace:
+            request["trace"] = True
+        
+        with self.pending_lock:
+            self.pending_requests[request_id] = future
+        
+        try:
+            with self.send_lock:
+                self._send_message(request)
+        except Exception as e:
+            with self.pending_lock:
+                self.pending_requests.pop(request_id, None)
+            future.set_exception(e)
+        
+        return future
+    
+    def _receive_loop(self):
+        """流水线模式下的响应接收线程，按id完成对应的Future"""
+        try:
+            while self.is_connected:
+                response = self._receive_message()
+                if response is None:
+                    break
+                
+                request_id = response.get('id')
+                with self.pending_lock:
+                    future = self.pending_requests.pop(request_id, None)
+                    codec = self.pending_codecs.pop(request_id, None)
+                
+                # 服务器在发送set_codec响应之后才切换编解码器
+                if codec is not None and response.get('success'):
+                    self.receive_codec = codec
+                
+                if future is not None:
+                    future.set_result(response)
+        except Exception as e:
+            if self.is_connected:
+                logger.error(f"接收响应失败: {e}")
+        finally:
+            with self.pending_lock:
+                pending = list(self.pending_requests.values())
+                self.pending_requests.clear()
+            for future in pending:
+                future.set_exception(ConnectionError("连接已断开"))
+    
+    def send_batch(self, operations: List[Dict[str, Any]], results: str = "final") -> Optional[Dict[str, Any]]:
+        """
+        在一次往返中按顺序执行一组操作
+        
+        Args:
+            operations: 操作列表，例如 [{"command": "process_key", "params": {"key_code": 110}}]
+            results: "final" 只返回最后一步的响应，"all" 返回每一步的响应
+        """
+        return self.send_request("batch", {"operations": operations, "results": results})
+    
+    def set_codec(self, codec_name: str) -> bool:
+        """
+        与服务器协商消息编解码器，成功后本连接的后续消息均使用该编解码器
+        
+        Args:
+            codec_name: 编解码器名称（json/msgpack）
+        """
+        codec = get_codec(codec_name)
+        
+        # 协商完成前不能发送其他请求，否则服务器会用错误的编解码器解析它们
+        with self.send_lock:
+            if self.pipelined:
+                request_id = next(self.request_ids)
+                with self.pending_lock:
+                    self.pending_codecs[request_id] = codec
+                try:
+                    response = self._submit(request_id, "set_codec", {"codec": codec_name}).result(self.timeout)
+                except Exception as e:
+                    logger.error(f"协商编解码器失败: {e}")
+                    return False
+            else:
+                response = self.send_request("set_codec", {"codec": codec_name})
+                if response and response.get('success'):
+                    self.receive_codec = codec
+            
+            if not response or not response.get('success'):
+                logger.error(f"协商编解码器失败: {response}")
+                return False
+            
+            self.codec = codec
+            return True
+    
     def _send_message(self, message: Dict[str, Any]):
         """发送消息"""
-        message_str = json.dumps(message, ensure_ascii=False)
-        message_data = message_str.encode('utf-8')
+        message_data = self.codec.encode(message)
         
-        # 发送消息长度
-        length_data = len(message_data).to_bytes(4, byteorder='little')
-        self.socket.send(length_data)
+        if self.shm_channel is not None:
+            # 服务器长时间不读取请求时抛出TimeoutError，与过大的请求一样由调用者作为发送失败处理
+            self.shm_channel.send(message_data, self.timeout)
+            return
         
-        # 发送消息内容
-        self.socket.send(message_data)
+        send_frame(self.socket, message_data)
     
     def _receive_message(self) -> Optional[Dict[str, Any]]:
         """接收消息"""
-        # 接收消息长度
-        length_data = self.socket.recv(4)
-        if len(length_data) != 4:
-            return None
-        
-        message_length = int.from_bytes(length_data, byteorder='little')
+        if self.shm_channel is not None:
+            message_data = self.shm_channel.recv()
+            return self.receive_codec.decode(message_data) if message_data is not None else None
         
-        # 接收完整消息
-        message_data = b''
-        while len(message_data) < message_length:
-            chunk = self.socket.recv(message_length - len(message_data))
-            if not chunk:
-                return None
-            message_data += chunk
+        message_data = self.reader.read_frame()
+        if message_data is None:
+            return None
         
-        # 解析JSON
-        message_str = message_data.decode('utf-8')
-        return json.loads(message_str)
+        return self.receive_codec.decode(message_data)
     
     def disconnect(self):
         """断开连接"""
         if self.socket:
-            self.socket.close()
             self.is_connected = False
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            if self.receive_thread is not None:
+                self.receive_thread.join(timeout=1.0)
+                self.receive_thread = None
+            if self.shm_channel is not None:
+                self.shm_channel.close()
+                self.shm_channel = None
+            self.socket.close()
             logger.info("已断开与服务器的连接")
 
-def test_client():
+def test_client(host: str = "127.0.0.1", port: int = 9999, transport: str = "tcp",
+                unix_path: str = DEFAULT_UNIX_PATH, socket_options: Optional[SocketOptions] = None):
     """测试客户端功能"""
     logger.info("启动IPC客户端测试")
     
-    client = IPCClient()
+    client = IPCClient(host, port, transport=transport, unix_path=unix_path,
+                       socket_options=socket_options)
     
     # 连接到服务器
     if not client.connect():
@@ -346,12 +1131,93 @@ def test_client():
 
 def main():
     """主函数"""
-    if len(sys.argv) > 1 and sys.argv[1] == "test":
+    parser = argparse.ArgumentParser(description="Unity Rime输入法集成 - IPC服务器")
+    parser.add_argument("mode", nargs="?", default="server", choices=["server", "test"],
+                        help="server: 启动服务器（默认）；test: 运行测试客户端")
+    parser.add_argument("--host", default="127.0.0.1", help="服务器地址")
+    parser.add_argument("--port", type=int, default=9999, help="服务器端口")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="使用asyncio事件循环并发服务多个客户端")
+    parser.add_argument("--max-sessions", type=int, default=256,
+                        help="会话池中Rime会话的最大数量")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="tcp",
+                        help="传输方式：tcp（默认）、unix（Unix域套接字）、shm（共享内存，需要--asyncio）")
+    parser.add_argument("--unix-path", default=DEFAULT_UNIX_PATH,
+                        help="Unix域套接字路径（unix/shm传输使用）")
+    parser.add_argument("--no-tcp-nodelay", action="store_true",
+                        help="不设置TCP_NODELAY（保留Nagle算法）")
+    parser.add_argument("--sndbuf", type=int, default=0,
+                        help="SO_SNDBUF字节数，0表示系统默认值")
+    parser.add_argument("--rcvbuf", type=int, default=0,
+                        help="SO_RCVBUF字节数，0表示系统默认值")
+    parser.add_argument("--busy-poll", type=int, default=0,
+                        help="SO_BUSY_POLL微秒数（仅Linux），0表示关闭")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="日志级别")
+    parser.add_argument("--log-file", default="ipc_server.log", help="日志文件路径，空字符串表示不写文件")
+    parser.add_argument("--log-sample-every", type=int, default=1,
+                        help="每种命令每N次请求记录一条命令日志")
+    parser.add_argument("--log-rate", type=float, default=10.0,
+                        help="每种命令每秒最多记录的命令日志条数，0表示不限速")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="在127.0.0.1的该端口上以Prometheus文本格式导出指标（/metrics），0表示不启用")
+    parser.add_argument("--backend", choices=RimeWrapper.BACKENDS, default="auto",
+                        help="Rime引擎后端：auto（默认，pyrime不可用时使用模拟实现）、pyrime、"
+                             "native（进程内通过ctypes调用librime_dll）、mock")
+    parser.add_argument("--native-library", default=None,
+                        help="native后端的librime_dll路径，默认使用dll_component/build中的库")
+    parser.add_argument("--dict", nargs="+", default=None, metavar="PATH",
+                        help="模拟后端使用的Rime词典文件（*.dict.yaml）或一个用rime_dict.py编译的词典文件（*.trie），"
+                             "默认使用内置的小词典")
+    parser.add_argument("--ready-fd", type=int, default=None, metavar="FD",
+                        help="开始监听后向该文件描述符（例如启动者创建的管道）写入READY=1并关闭，"
+                             "1表示输出到标准输出；设置了NOTIFY_SOCKET时同时按sd_notify协议通知")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="就绪时在标准错误输出启动各阶段（导入、日志、引擎、词典、监听等）的耗时")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="启动N个工作进程（每个进程一个asyncio服务器，按会话分配连接，仅Unix），"
+                             "0表示单进程（默认）")
+    args = parser.parse_args()
+    startup.lap('arguments')
+    
+    setup_logging(args.log_file or None, args.log_level)
+    startup.lap('logging')
+    command_log_sampler = LogSampler(args.log_sample_every, args.log_rate)
+    
+    socket_options = SocketOptions(
+        tcp_nodelay=not args.no_tcp_nodelay,
+        send_buffer=args.sndbuf,
+        recv_buffer=args.rcvbuf,
+        busy_poll=args.busy_poll
+    )
+    
+    if args.mode == "test":
         # 测试模式
-        test_client()
+        test_client(args.host, args.port, args.transport, args.unix_path, socket_options)
+    elif args.workers > 0:
+        # 多进程工作池模式（导入放在这里，worker_pool依赖本模块）
+        from worker_pool import WorkerPool
+        pool = WorkerPool(args.workers, args.host, args.port, args.transport, args.unix_path,
+                          metrics_port=args.metrics_port,
+                          server_options=dict(max_sessions=args.max_sessions, socket_options=socket_options,
+                                              rime_backend=args.backend, rime_library=args.native_library,
+                                              rime_dictionaries=args.dict),
+                          log_file=args.log_file or None, log_level=args.log_level,
+                          log_sample_every=args.log_sample_every, log_rate=args.log_rate,
+                          ready_fd=args.ready_fd, startup_profile=args.startup_profile)
+        pool.start()
+    elif args.asyncio:
+        # 异步服务器模式
+        server = AsyncIPCServer(args.host, args.port, args.max_sessions, args.transport, args.unix_path,
+                                socket_options=socket_options, command_log_sampler=command_log_sampler,
+                                metrics_port=args.metrics_port, rime_backend=args.backend,
+                                rime_library=args.native_library, rime_dictionaries=args.dict,
+                                ready_fd=args.ready_fd, startup_profile=args.startup_profile)
+        server.start()
     else:
         # 服务器模式
-        server = IPCServer()
+        server = IPCServer(args.host, args.port, args.max_sessions, args.transport, args.unix_path,
+                           socket_options, command_log_sampler, args.metrics_port, args.backend,
+                           args.native_library, args.dict, args.ready_fd, args.startup_profile)
         server.start()
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 日志配置
+日志记录通过队列交给后台线程格式化并写入文件和标准输出，
+请求处理线程（或事件循环）只做一次入队，不做任何阻塞I/O
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import sys
+import time
+import atexit
+import logging
+import threading
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Hashable, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+_listener = None
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    不在调用线程中格式化的QueueHandler
+
+    标准QueueHandler.prepare会在入队前格式化消息，这里原样入队，
+    由QueueListener线程中的处理器格式化。因此日志参数在记录之后不能再被修改，
+    热点路径只传入字符串、数字等不可变值。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def setup_logging(log_file: Optional[str] = None, level='INFO', console: bool = True) -> QueueListener:
+    """
+    配置根日志记录器
+
+    重复调用时替换之前的配置。进程退出时自动停止后台线程并写出剩余日志。
+
+    Args:
+        log_file: 日志文件路径，None表示不写文件
+        level: 日志级别（名称或数值）
+        console: 是否同时输出到标准输出
+
+    Returns:
+        后台写日志的QueueListener
+    """
+    global _listener
+    shutdown_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if log_file:
+        # 第一条日志写入时才打开文件
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8', delay=True))
+    if console:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue = SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def shutdown_logging():
+    """停止后台线程，写出队列中剩余的日志并关闭处理器"""
+    global _listener
+    if _listener is None:
+        return
+
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+atexit.register(shutdown_logging)
+
+class LogSampler:
+    """
+    按键（例如命令名）对高频日志采样和限速
+
+    每个键每sample_every次记录一次，并且每秒最多记录max_per_second次，
+    被跳过的次数附加在下一条记录中。最多跟踪max_keys个键，超出时丢弃最早出现的键的状态。
+    """
+
+    def __init__(self, sample_every: int = 1, max_per_second: float = 0.0, max_keys: int = 1024):
+        """
+        Args:
+            sample_every: 每N次记录一次，1表示不采样
+            max_per_second: 每个键每秒最多记录的条数，0表示不限速
+            max_keys: 最多跟踪的键数
+        """
+        self.sample_every = max(sample_every, 1)
+        self.max_per_second = max_per_second
+        self.max_keys = max(max_keys, 1)
+        # 键 -> [调用次数, 跳过次数, 当前秒的开始时间, 当前秒已记录条数]
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key: Hashable) -> Optional[int]:
+        """
+        判断这一次是否记录
+
+        Returns:
+            记录时返回自上次记录以来跳过的次数，不记录时返回None
+        """
+        with self.lock:
+            state = self.states.get(key)
+            if state is None:
+                if len(self.states) >= self.max_keys:
+                    # 被丢弃的键之前跳过的次数不再报告
+                    del self.states[next(iter(self.states))]
+                state = self.states[key] = [0, 0, 0.0, 0]
+
+            state[0] += 1
+            if (state[0] - 1) % self.sample_every:
+                state[1] += 1
+                return None
+
+            if self.max_per_second > 0:
+                now = time.monotonic()
+                if now - state[2] >= 1.0:
+                    state[2] = now
+                    state[3] = 0
+                if state[3] >= self.max_per_second:
+                    state[1] += 1
+                    return None
+                state[3] += 1
+
+            skipped, state[1] = state[1], 0
+            return skipped
+
+    def log(self, logger: logging.Logger, level: int, key: Hashable, message: str, *args):
+        """
+        按采样和限速规则记录一条日志（消息按%格式延迟格式化）
+
+        Args:
+            logger: 日志记录器
+            level: 日志级别
+            key: 采样键
+            message: %格式的消息
+            args: 消息参数
+        """
+        if not logger.isEnabledFor(level):
+            return
+
+        skipped = self.allow(key)
+        if skipped is None:
+            return
+        if skipped:
+            logger.log(level, message + "（省略 %d 条）", *args, skipped)
+        else:
+            logger.log(level, message, *args)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 服务器指标
+按命令统计请求延迟直方图、请求数与错误数，以及收发字节数、连接数、会话数和队列深度，
+通过stats命令或可选的Prometheus文本格式HTTP端点导出
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 导出的分位数
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+class LatencyHistogram:
+    """
+    HDR风格的对数-线性直方图（纳秒）
+
+    每个2的幂区间再等分为若干子桶，内存固定，相对误差不超过1/half_count
+    （默认约1.6%）。超过最大可记录值的样本计入最后一个桶。
+    """
+
+    def __init__(self, significant_bits: int = 6, max_value_ns: int = 60 * 10**9):
+        """
+        Args:
+            significant_bits: 子桶精度位数
+            max_value_ns: 最大可记录值（纳秒）
+        """
+        self.sub_bucket_count = 1 << significant_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.significant_bits = significant_bits
+        self.counts = [0] * (self._index(max_value_ns) + 1)
+        self.total = 0
+        self.sum = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        """值所在桶的下标"""
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.significant_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + (value >> shift) - self.half_count
+
+    def _highest_value(self, index: int) -> int:
+        """桶内的最大值（与HDR Histogram一样按桶上界报告）"""
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index - self.sub_bucket_count) // self.half_count + 1
+        mantissa = (index - self.sub_bucket_count) % self.half_count + self.half_count
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value_ns: int):
+        """记录一个样本"""
+        value_ns = max(int(value_ns), 0)
+        self.counts[min(self._index(value_ns), len(self.counts) - 1)] += 1
+        if self.total == 0 or value_ns < self.min:
+            self.min = value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+        self.total += 1
+        self.sum += value_ns
+
+    def percentile(self, quantile: float) -> int:
+        """
+        分位数（纳秒）
+
+        Args:
+            quantile: 0到1之间的分位
+        """
+        if self.total == 0:
+            return 0
+
+        target = max(int(quantile * self.total + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+    def export(self) -> Dict[str, Any]:
+        """导出可合并的原始数据（只包含非零的桶）"""
+        return {
+            'counts': {index: count for index, count in enumerate(self.counts) if count},
+            'total': self.total,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    def merge(self, data: Dict[str, Any]):
+        """合并export导出的数据（例如其他进程中的直方图），分位数与把样本记录在一起时相同"""
+        if not data['total']:
+            return
+        last = len(self.counts) - 1
+        for index, count in data['counts'].items():
+            self.counts[min(int(index), last)] += count
+        if self.total == 0 or data['min'] < self.min:
+            self.min = data['min']
+        if data['max'] > self.max:
+            self.max = data['max']
+        self.total += data['total']
+        self.sum += data['sum']
+
+    def snapshot(self) -> Dict[str, float]:
+        """导出统计值（毫秒）"""
+        result = {
+            'count': self.total,
+            'mean_ms': self.sum / self.total / 1e6 if self.total else 0.0,
+            'min_ms': self.min / 1e6,
+            'max_ms': self.max / 1e6,
+        }
+        for quantile in QUANTILES:
+            result[f"p{_quantile_label(quantile)}_ms"] = self.percentile(quantile) / 1e6
+        return result
+
+def _quantile_label(quantile: float) -> str:
+    """0.5 -> '50'，0.999 -> '999'"""
+    return f"{quantile * 100:g}".replace('.', '')
+
+class ServerMetrics:
+    """
+    IPC服务器的运行指标
+
+    记录方法由请求处理线程（或事件循环）调用，导出方法可以在其他线程中调用。
+    """
+
+    def __init__(self, session_count: Optional[Callable[[], int]] = None):
+        """
+        Args:
+            session_count: 返回当前Rime会话数量的函数
+        """
+        self.session_count = session_count
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        # 命令 -> LatencyHistogram
+        self.latencies = {}
+        # 命令 -> 错误数
+        self.errors = {}
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.connections_total = 0
+        # 已接收但尚未发出响应的请求数
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def connection_opened(self):
+        """登记新连接"""
+        with self.lock:
+            self.connections += 1
+            self.connections_total += 1
+
+    def connection_closed(self):
+        """登记连接关闭"""
+        with self.lock:
+            self.connections -= 1
+
+    def frames_received(self, count: int = 1):
+        """登记已接收、等待处理的请求帧"""
+        with self.lock:
+            self.queue_depth += count
+            if self.queue_depth > self.max_queue_depth:
+                self.max_queue_depth = self.queue_depth
+
+    def frames_dropped(self, count: int):
+        """登记因连接关闭而不再处理的请求帧"""
+        with self.lock:
+            self.queue_depth -= count
+
+    def request_completed(self, command: str, duration_ns: int, bytes_in: int, bytes_out: int, error: bool):
+        """
+        登记一个处理完成的请求
+
+        Args:
+            command: 命令名
+            duration_ns: 从开始解码请求到响应编码完成的耗时
+            bytes_in: 请求消息体字节数
+            bytes_out: 响应消息体字节数
+            error: 响应是否为错误
+        """
+        with self.lock:
+            histogram = self.latencies.get(command)
+            if histogram is None:
+                histogram = self.latencies[command] = LatencyHistogram()
+                self.errors[command] = 0
+            histogram.record(duration_ns)
+            if error:
+                self.errors[command] += 1
+            self.bytes_received += bytes_in
+            self.bytes_sent += bytes_out
+            self.queue_depth -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出所有指标（stats命令的返回值）"""
+        with self.lock:
+            commands = {
+                command: dict(histogram.snapshot(), errors=self.errors[command])
+                for command, histogram in self.latencies.items()
+            }
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'requests_total': sum(item['count'] for item in commands.values()),
+                'errors_total': sum(self.errors.values()),
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'connections': self.connections,
+                'connections_total': self.connections_total,
+                'sessions': self.session_count() if self.session_count else 0,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'commands': commands,
+            }
+
+    def export_state(self) -> Dict[str, Any]:
+        """导出可以在其他进程中合并的原始数据（见from_states）"""
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'latencies': {command: histogram.export() for command, histogram in self.latencies.items()},
+                'errors': dict(self.errors),
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'connections': self.connections,
+                'connections_total': self.connections_total,
+                'sessions': self.session_count() if self.session_count else 0,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+            }
+
+    @classmethod
+    def from_states(cls, states: List[Dict[str, Any]]) -> 'ServerMetrics':
+        """
+        合并多个export_state导出的数据（例如工作池中的各个工作进程）
+
+        计数、直方图和当前值相加，运行时间从最早启动的进程算起；
+        max_queue_depth为各进程最大值之和，是合并后队列深度最大值的上界。
+        """
+        sessions = sum(state['sessions'] for state in states)
+        metrics = cls(lambda: sessions)
+        for state in states:
+            metrics.started_at = min(metrics.started_at, state['started_at'])
+            for command, data in state['latencies'].items():
+                histogram = metrics.latencies.get(command)
+                if histogram is None:
+                    histogram = metrics.latencies[command] = LatencyHistogram()
+                    metrics.errors[command] = 0
+                histogram.merge(data)
+                metrics.errors[command] += state['errors'].get(command, 0)
+            for key in ('bytes_received', 'bytes_sent', 'connections', 'connections_total',
+                        'queue_depth', 'max_queue_depth'):
+                setattr(metrics, key, getattr(metrics, key) + state[key])
+        return metrics
+
+    def render_prometheus(self) -> str:
+        """导出Prometheus文本格式"""
+        with self.lock:
+            lines = [
+                "# HELP unity_rime_requests_total 已处理的请求数",
+                "# TYPE unity_rime_requests_total counter",
+            ]
+            for command, histogram in self.latencies.items():
+                lines.append(f'unity_rime_requests_total{{command="{command}"}} {histogram.total}')
+
+            lines += [
+                "# HELP unity_rime_request_errors_total 返回错误的请求数",
+                "# TYPE unity_rime_request_errors_total counter",
+            ]
+            for command, count in self.errors.items():
+                lines.append(f'unity_rime_request_errors_total{{command="{command}"}} {count}')
+
+            lines += [
+                "# HELP unity_rime_request_duration_seconds 服务器端请求处理延迟",
+                "# TYPE unity_rime_request_duration_seconds summary",
+            ]
+            for command, histogram in self.latencies.items():
+                for quantile in QUANTILES:
+                    value = histogram.percentile(quantile) / 1e9
+                    lines.append(f'unity_rime_request_duration_seconds{{command="{command}",quantile="{quantile}"}} {value:.9f}')
+                lines.append(f'unity_rime_request_duration_seconds_sum{{command="{command}"}} {histogram.sum / 1e9:.9f}')
+                lines.append(f'unity_rime_request_duration_seconds_count{{command="{command}"}} {histogram.total}')
+
+            lines += [
+                "# TYPE unity_rime_bytes_received_total counter",
+                f"unity_rime_bytes_received_total {self.bytes_received}",
+                "# TYPE unity_rime_bytes_sent_total counter",
+                f"unity_rime_bytes_sent_total {self.bytes_sent}",
+                "# TYPE unity_rime_connections gauge",
+                f"unity_rime_connections {self.connections}",
+                "# TYPE unity_rime_queue_depth gauge",
+                f"unity_rime_queue_depth {self.queue_depth}",
+            ]
+
+        sessions = self.session_count() if self.session_count else 0
+        lines += [
+            "# TYPE unity_rime_sessions gauge",
+            f"unity_rime_sessions {sessions}",
+        ]
+        return "\n".join(lines) + "\n"
+
+class MetricsHTTPServer:
+    """在本地端口上以Prometheus文本格式导出指标（GET /metrics）"""
+
+    def __init__(self, metrics: ServerMetrics, host: str = "127.0.0.1", port: int = 9100):
+        """
+        Args:
+            metrics: 要导出的指标
+            host: 监听地址
+            port: 监听端口
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        """在后台线程中启动HTTP服务"""
+        # 只在启用端点时导入（http.server会连带导入email等模块，拖慢服务器启动）
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 抓取请求很频繁，不写入服务器日志
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info("Prometheus指标端点: http://%s:%d/metrics", self.host, self.port)
+
+    def stop(self):
+        """停止HTTP服务"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
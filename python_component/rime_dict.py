@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 离线词典
+读取Rime的 *.dict.yaml 词典并构建紧凑的前缀树，供没有pyrime时的离线引擎查询候选词
+
+前缀树的节点和词条都存放在array和一整块UTF-8字节中，而不是每个节点一个dict，
+百万词条的词典也只占用几十MB内存。词条按编码排序，每个节点对应排序后词条中的一段
+连续区间，因此一个前缀的所有补全就是一段区间。
+前缀树可以编译为一个文件（python rime_dict.py 词典.dict.yaml -o 词典.trie），
+之后用mmap直接打开，不再解析YAML。
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import os
+import sys
+import mmap
+import heapq
+import struct
+import logging
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rime词典正文的默认列
+DEFAULT_COLUMNS = ('text', 'code', 'weight')
+
+# 每次查询默认返回的最大候选词数
+DEFAULT_MAX_CANDIDATES = 100
+
+# (文字, 编码, 权重)，编码中的音节以空格分隔
+DictEntry = Tuple[str, str, float]
+
+# 编译后词典文件的扩展名、标识和格式版本
+COMPILED_SUFFIX = '.trie'
+COMPILED_MAGIC = b'RIMETRIE'
+COMPILED_VERSION = 1
+
+# 文件头：标识、格式版本、字节序（1小端/2大端）、max_candidates、词条数、节点数
+_HEADER = struct.Struct('<8sIIIII')
+# 文件头之后每个数据段的(偏移, 长度)
+_SECTION = struct.Struct('<QQ')
+# 数据段对应的属性和array类型码（None为字节块），数据段按8字节对齐
+_SECTIONS = (
+    ('weights', 'd'),
+    ('text_offsets', 'I'),
+    ('code_offsets', 'I'),
+    ('entry_lo', 'I'),
+    ('entry_hi', 'I'),
+    ('exact_hi', 'I'),
+    ('first_child', 'I'),
+    ('child_count', 'I'),
+    ('top_slots', 'i'),
+    ('top_entries', 'I'),
+    ('text_blob', None),
+    ('code_blob', None),
+    ('labels', None),
+)
+
+def _parse_header(lines: Iterator[str], path: str) -> Dict[str, object]:
+    """
+    解析 --- 与 ... 之间的YAML头
+
+    只支持Rime词典头中用到的写法：标量 "key: value" 和字符串列表 "key:" + "  - item"。
+    """
+    header = {}
+    current_list = None
+
+    for line in lines:
+        stripped = line.split('#', 1)[0].rstrip()
+        if stripped == '...':
+            return header
+        if not stripped.strip():
+            continue
+
+        item = stripped.strip()
+        if item.startswith('- ') and current_list is not None:
+            current_list.append(item[2:].strip().strip('"\''))
+            continue
+
+        key, _, value = item.partition(':')
+        value = value.strip().strip('"\'')
+        if value:
+            header[key.strip()] = value
+            current_list = None
+        else:
+            current_list = header[key.strip()] = []
+
+    raise ValueError(f"{path}: 词典头缺少结束标记 '...'")
+
+def _parse_weight(value: str) -> float:
+    """解析权重列，无法解析时为0"""
+    try:
+        return float(value.rstrip('%'))
+    except ValueError:
+        return 0.0
+
+def read_dict_yaml(path: str, _seen: Optional[set] = None) -> List[DictEntry]:
+    """
+    读取一个Rime词典文件及其import_tables
+
+    没有编码列的词条按其中每个字的编码（取权重最高的读音）拼接，
+    含有词典中没有的字时跳过。
+
+    Args:
+        path: *.dict.yaml 文件路径
+
+    Returns:
+        词条列表
+
+    Raises:
+        OSError: 文件无法读取
+        ValueError: 文件格式错误
+    """
+    seen = _seen if _seen is not None else set()
+    path = os.path.abspath(path)
+    if path in seen:
+        return []
+    seen.add(path)
+
+    entries = []
+    uncoded = []
+    # 单字 -> (权重, 编码)
+    char_codes = {}
+
+    with open(path, encoding='utf-8-sig') as f:
+        lines = iter(f)
+        for line in lines:
+            if line.rstrip() == '---':
+                break
+        else:
+            raise ValueError(f"{path}: 缺少词典头 '---'")
+
+        header = _parse_header(lines, path)
+        columns = header.get('columns') or DEFAULT_COLUMNS
+        text_column = columns.index('text') if 'text' in columns else 0
+        code_column = columns.index('code') if 'code' in columns else None
+        weight_column = columns.index('weight') if 'weight' in columns else None
+
+        for line in lines:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\r\n').split('\t')
+            text = fields[text_column].strip() if text_column < len(fields) else ''
+            if not text:
+                continue
+            code = fields[code_column].strip() if code_column is not None and code_column < len(fields) else ''
+            weight = (_parse_weight(fields[weight_column].strip())
+                      if weight_column is not None and weight_column < len(fields) else 0.0)
+
+            if not code:
+                uncoded.append((text, weight))
+                continue
+
+            entries.append((text, code, weight))
+            if len(text) == 1 and weight >= char_codes.get(text, (float('-inf'),))[0]:
+                char_codes[text] = (weight, code)
+
+    for text, weight in uncoded:
+        codes = [char_codes.get(char) for char in text]
+        if all(codes):
+            entries.append((text, ' '.join(code for _, code in codes), weight))
+
+    directory = os.path.dirname(path)
+    for table in header.get('import_tables') or ():
+        entries.extend(read_dict_yaml(os.path.join(directory, f"{table}.dict.yaml"), seen))
+
+    return entries
+
+class PrefixTrie:
+    """
+    只读的紧凑前缀树
+
+    词条按(编码, -权重)排序后存放：文字是一整块UTF-8字节加偏移数组，编码同样如此。
+    节点按层序编号，同一节点的子节点编号连续，子节点的边标签拼成一个字符串，
+    前进一个字母只需在至多字母表大小的一段标签中查找。每个节点记录：
+    以该前缀开头的词条区间[entry_lo, entry_hi)，其中编码恰好等于该前缀的词条在区间开头
+    [entry_lo, exact_hi)。
+
+    查询时编码完全匹配的词条在前（按权重），其余按权重排列的补全在后。
+    区间大于max_candidates的节点预先计算了区间内权重最高的max_candidates个词条，
+    其余节点的区间本身不超过max_candidates，因此每次查询的代价与词典大小和编码长度无关。
+    线程安全（构建后不再修改）。
+    """
+
+    def __init__(self, entries: Iterable[DictEntry], max_candidates: int = DEFAULT_MAX_CANDIDATES):
+        """
+        Args:
+            entries: (文字, 编码, 权重) 词条，编码中的空格会被去掉
+            max_candidates: 每次查询返回的最大候选词数
+        """
+        self.max_candidates = max_candidates
+
+        rows = sorted(((code.replace(' ', ''), -weight, text) for text, code, weight in entries if code))
+        keys = [row[0] for row in rows]
+
+        self.weights = array('d', (-row[1] for row in rows))
+        self.text_blob, self.text_offsets = self._pack(row[2] for row in rows)
+        self.code_blob, self.code_offsets = self._pack(keys)
+        del rows
+
+        self._build(keys)
+        self._build_top()
+
+    @staticmethod
+    def _pack(strings: Iterable[str]) -> Tuple[bytes, array]:
+        """把字符串拼成一块UTF-8字节，返回(字节, 偏移数组)，第i个字符串为[offsets[i], offsets[i+1])"""
+        chunks = []
+        offsets = array('I', [0])
+        position = 0
+        for value in strings:
+            data = value.encode('utf-8')
+            chunks.append(data)
+            position += len(data)
+            offsets.append(position)
+        return b''.join(chunks), offsets
+
+    def _build(self, keys: List[str]):
+        """按层序构建节点"""
+        # 根节点没有边标签，用占位字符保持labels[i]与节点i对应
+        labels = ['\0']
+        entry_lo = [0]
+        entry_hi = [len(keys)]
+        depths = [0]
+        exact_hi = []
+        first_child = []
+        child_count = []
+
+        node = 0
+        while node < len(entry_lo):
+            lo, hi, depth = entry_lo[node], entry_hi[node], depths[node]
+            prefix = keys[lo][:depth] if lo < hi else ''
+
+            # 编码等于前缀的词条排在区间最前面
+            position = bisect_right(keys, prefix, lo, hi)
+            exact_hi.append(position)
+            first_child.append(len(entry_lo))
+
+            count = 0
+            while position < hi:
+                label = keys[position][depth]
+                end = bisect_left(keys, prefix + chr(ord(label) + 1), position, hi)
+                labels.append(label)
+                entry_lo.append(position)
+                entry_hi.append(end)
+                depths.append(depth + 1)
+                count += 1
+                position = end
+            child_count.append(count)
+            node += 1
+
+        self.labels = ''.join(labels)
+        self.entry_lo = array('I', entry_lo)
+        self.entry_hi = array('I', entry_hi)
+        self.exact_hi = array('I', exact_hi)
+        self.first_child = array('I', first_child)
+        self.child_count = array('I', child_count)
+
+    def _build_top(self):
+        """
+        为区间大于max_candidates的节点预先计算区间内按权重排列的前max_candidates个词条
+
+        按编号倒序处理（子节点先于父节点），父节点的结果由自身完全匹配的词条和各子节点的
+        结果（或不超过max_candidates的整个区间）合并得到，不需要扫描整个区间。
+        稳定排序保证权重相同时编号小的在前，与heapq.nlargest扫描区间的结果一致。
+        """
+        k = self.max_candidates
+        weight = self.weights.__getitem__
+        entry_lo, entry_hi, exact_hi = self.entry_lo, self.entry_hi, self.exact_hi
+        first_child, child_count = self.first_child, self.child_count
+
+        # 节点 -> 在top_entries中的槽位（每个槽位k个词条），-1表示没有预先计算
+        slots = array('i', [-1]) * self.node_count
+        top_entries = array('I')
+        for node in range(self.node_count - 1, -1, -1):
+            lo, hi = entry_lo[node], entry_hi[node]
+            if hi - lo <= k:
+                continue
+
+            merged = list(range(lo, min(exact_hi[node], lo + k)))
+            start = first_child[node]
+            for child in range(start, start + child_count[node]):
+                slot = slots[child]
+                if slot < 0:
+                    merged.extend(range(entry_lo[child], entry_hi[child]))
+                else:
+                    merged.extend(top_entries[slot * k:(slot + 1) * k])
+            merged.sort(key=weight, reverse=True)
+
+            slots[node] = len(top_entries) // k
+            top_entries.extend(merged[:k])
+
+        self.top_slots = slots
+        self.top_entries = top_entries
+
+    @classmethod
+    def from_dict_yaml(cls, paths: Sequence[str], max_candidates: int = DEFAULT_MAX_CANDIDATES) -> 'PrefixTrie':
+        """从一个或多个Rime词典文件构建"""
+        entries = []
+        seen = set()
+        for path in paths:
+            entries.extend(read_dict_yaml(path, seen))
+        trie = cls(entries, max_candidates)
+        logger.info(f"离线词典加载完成: {len(trie)} 个词条, {trie.node_count} 个节点")
+        return trie
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, Sequence[str]],
+                     max_candidates: int = DEFAULT_MAX_CANDIDATES) -> 'PrefixTrie':
+        """从 {编码: [文字, ...]} 构建，列表中靠前的文字权重更高"""
+        return cls(((text, code, float(len(words) - rank))
+                    for code, words in mapping.items()
+                    for rank, text in enumerate(words)), max_candidates)
+
+    def save(self, path: str):
+        """
+        把前缀树写成编译后的词典文件，供from_compiled用mmap打开
+
+        数组按本机字节序原样写出，边标签按UTF-32写出。
+        """
+        sections = []
+        for name, typecode in _SECTIONS:
+            value = getattr(self, name)
+            if name == 'labels':
+                sections.append(value.encode('utf-32-le'))
+            elif isinstance(value, array) or typecode is None:
+                sections.append(bytes(value))
+            else:
+                sections.append(array(typecode, value).tobytes())
+
+        position = _HEADER.size + _SECTION.size * len(sections)
+        table = []
+        for data in sections:
+            position += -position % 8
+            table.append((position, len(data)))
+            position += len(data)
+
+        header = _HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, 1 if sys.byteorder == 'little' else 2,
+                              self.max_candidates, len(self), self.node_count)
+        with open(path, 'wb') as f:
+            f.write(header)
+            for offset, length in table:
+                f.write(_SECTION.pack(offset, length))
+            for (offset, _), data in zip(table, sections):
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(data)
+
+    @classmethod
+    def from_compiled(cls, path: str) -> 'PrefixTrie':
+        """
+        用mmap打开编译后的词典文件
+
+        数组和字节块直接是映射内存上的memoryview，不复制也不解析，打开的耗时与词典大小无关；
+        多个进程打开同一个文件时共享操作系统页缓存中的同一份数据。
+        只有边标签（每个节点一个字符）被解码为字符串。
+
+        Raises:
+            OSError: 文件无法读取
+            ValueError: 不是编译后的词典文件、格式版本或字节序不匹配
+        """
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        trie = cls.__new__(cls)
+        trie._mmap = mapped
+        try:
+            if len(mapped) < _HEADER.size:
+                raise ValueError(f"{path}: 文件过短")
+            magic, version, byteorder, max_candidates, entry_count, node_count = _HEADER.unpack_from(mapped)
+            if magic != COMPILED_MAGIC:
+                raise ValueError(f"{path}: 不是编译后的词典文件")
+            if version != COMPILED_VERSION:
+                raise ValueError(f"{path}: 不支持的格式版本 {version}")
+            if byteorder != (1 if sys.byteorder == 'little' else 2):
+                raise ValueError(f"{path}: 字节序与本机不同，请在本机重新编译")
+
+            trie.max_candidates = max_candidates
+            with memoryview(mapped) as view:
+                for index, (name, typecode) in enumerate(_SECTIONS):
+                    offset, length = _SECTION.unpack_from(mapped, _HEADER.size + _SECTION.size * index)
+                    if offset + length > len(mapped):
+                        raise ValueError(f"{path}: 数据段 {name} 超出文件范围")
+                    # 用with释放中间的切片，出错时close才能关闭映射
+                    with view[offset:offset + length] as section:
+                        if name == 'labels':
+                            value = str(section, 'utf-32-le')
+                        else:
+                            value = section.cast(typecode) if typecode else section[:]
+                    setattr(trie, name, value)
+
+            if len(trie) != entry_count or trie.node_count != node_count:
+                raise ValueError(f"{path}: 词条数或节点数与文件头不一致")
+        except (ValueError, TypeError, struct.error) as e:
+            trie.close()
+            if isinstance(e, ValueError):
+                raise
+            raise ValueError(f"{path}: 词典文件损坏: {e}") from e
+
+        logger.info(f"离线词典映射完成: {path}, {entry_count} 个词条, {node_count} 个节点")
+        return trie
+
+    def close(self):
+        """释放from_compiled映射的文件（之后不能再查询），对直接构建的前缀树没有作用"""
+        mapped = getattr(self, '_mmap', None)
+        if mapped is None:
+            return
+        for name, _ in _SECTIONS:
+            value = getattr(self, name, None)
+            if isinstance(value, memoryview):
+                value.release()
+        self._mmap = None
+        mapped.close()
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    @property
+    def node_count(self) -> int:
+        """节点数"""
+        return len(self.entry_lo)
+
+    @property
+    def nbytes(self) -> int:
+        """词条和节点数据占用的字节数"""
+        arrays = (self.weights, self.text_offsets, self.code_offsets, self.entry_lo, self.entry_hi,
+                  self.exact_hi, self.first_child, self.child_count, self.top_slots, self.top_entries)
+        return (sum(values.itemsize * len(values) for values in arrays) + len(self.text_blob)
+                + len(self.code_blob) + sys.getsizeof(self.labels))
+
+    def child(self, node: int, label: str) -> int:
+        """节点沿label前进一步后的节点，不存在时返回-1"""
+        start = self.first_child[node]
+        return self.labels.find(label, start, start + self.child_count[node])
+
+    def find(self, key: str) -> int:
+        """编码前缀对应的节点，不存在时返回-1"""
+        node = 0
+        for label in key:
+            node = self.child(node, label)
+            if node < 0:
+                return -1
+        return node
+
+    def text(self, entry: int) -> str:
+        """词条的文字"""
+        return str(self.text_blob[self.text_offsets[entry]:self.text_offsets[entry + 1]], 'utf-8')
+
+    def code(self, entry: int) -> str:
+        """词条的编码（不含空格）"""
+        return str(self.code_blob[self.code_offsets[entry]:self.code_offsets[entry + 1]], 'utf-8')
+
+    def node_entries(self, node: int, limit: Optional[int] = None) -> List[int]:
+        """
+        节点的候选词条
+
+        Args:
+            node: 节点
+            limit: 最大数量，默认为max_candidates
+
+        Returns:
+            词条编号列表：完全匹配的词条（按权重）在前，补全（按权重）在后
+        """
+        limit = self.max_candidates if limit is None else limit
+        lo, exact, hi = self.entry_lo[node], self.exact_hi[node], self.entry_hi[node]
+
+        result = list(range(lo, min(exact, lo + limit)))
+        remaining = limit - len(result)
+        if remaining <= 0 or exact >= hi:
+            return result
+
+        k = self.max_candidates
+        slot = self.top_slots[node]
+        if slot >= 0 and limit <= k:
+            # 预先计算的前k个词条中至多有len(result)个完全匹配的词条，剩下的补全足够填满
+            completions = [entry for entry in self.top_entries[slot * k:(slot + 1) * k] if entry >= exact]
+            result.extend(completions[:remaining])
+        else:
+            result.extend(heapq.nlargest(remaining, range(exact, hi), key=self.weights.__getitem__))
+        return result
+
+    def lookup(self, key: str, limit: Optional[int] = None) -> List[int]:
+        """查询编码或编码前缀的候选词条，没有时返回空列表"""
+        node = self.find(key)
+        if node < 0:
+            return []
+        return self.node_entries(node, limit)
+
+def load_dictionary(paths: Sequence[str], max_candidates: int = DEFAULT_MAX_CANDIDATES) -> PrefixTrie:
+    """
+    加载离线词典
+
+    Args:
+        paths: 一个编译后的词典文件（*.trie，max_candidates以编译时为准），
+               或一个或多个Rime词典文件（*.dict.yaml）
+
+    Raises:
+        OSError: 文件无法读取
+        ValueError: 文件格式错误，或编译后的词典与其他文件混用
+    """
+    compiled = [path for path in paths if path.endswith(COMPILED_SUFFIX)]
+    if not compiled:
+        return PrefixTrie.from_dict_yaml(paths, max_candidates)
+    if len(paths) > 1:
+        raise ValueError("编译后的词典只能单独使用，请把所有词典编译为一个文件")
+    return PrefixTrie.from_compiled(compiled[0])
+
+def compile_dictionary(sources: Sequence[str], output: str,
+                       max_candidates: int = DEFAULT_MAX_CANDIDATES) -> PrefixTrie:
+    """
+    把Rime词典文件编译为一个词典文件
+
+    先写入临时文件再改名，正在映射旧文件的进程不受影响。
+
+    Returns:
+        构建的前缀树
+    """
+    trie = PrefixTrie.from_dict_yaml(sources, max_candidates)
+    temporary = f"{output}.tmp{os.getpid()}"
+    try:
+        trie.save(temporary)
+        os.replace(temporary, output)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return trie
+
+class TrieCursor:
+    """
+    输入中的编码在前缀树上的位置
+
+    每输入一个字母压入一帧（节点, 候选词），退格弹出一帧，
+    因此输入时每次按键只在前缀树上前进一步，退格不再查询。
+    """
+
+    def __init__(self, trie: PrefixTrie, convert: Optional[Callable[[PrefixTrie, List[int]], Any]] = None):
+        """
+        Args:
+            trie: 前缀树
+            convert: 把节点的候选词条编号转换为候选词的函数，结果随帧缓存；默认保留词条编号
+        """
+        self.trie = trie
+        self.convert = convert
+        empty = [] if convert is None else convert(trie, [])
+        # (节点, 候选词)，第一帧为根节点（没有输入时没有候选词），节点为-1表示前缀不在词典中
+        self.frames = [(0, empty)]
+
+    def __len__(self) -> int:
+        """已输入的字母数"""
+        return len(self.frames) - 1
+
+    @property
+    def node(self) -> int:
+        """当前节点"""
+        return self.frames[-1][0]
+
+    @property
+    def candidates(self):
+        """当前节点的候选词"""
+        return self.frames[-1][1]
+
+    def push(self, label: str):
+        """输入一个字母，返回新的候选词"""
+        node = self.frames[-1][0]
+        if node >= 0:
+            node = self.trie.child(node, label)
+        entries = self.trie.node_entries(node) if node >= 0 else []
+        candidates = entries if self.convert is None else self.convert(self.trie, entries)
+        self.frames.append((node, candidates))
+        return candidates
+
+    def pop(self):
+        """删除最后一个字母，返回删除后的候选词"""
+        if len(self.frames) > 1:
+            self.frames.pop()
+        return self.frames[-1][1]
+
+    def reset(self):
+        """清空输入"""
+        del self.frames[1:]
+
+def main():
+    """命令行：编译词典"""
+    parser = argparse.ArgumentParser(description="把Rime词典（*.dict.yaml）编译为可以mmap打开的词典文件")
+    parser.add_argument("sources", nargs="+", help="Rime词典文件（import_tables会一并导入）")
+    parser.add_argument("-o", "--output", required=True, help=f"输出文件（{COMPILED_SUFFIX}）")
+    parser.add_argument("--max-candidates", type=int, default=DEFAULT_MAX_CANDIDATES,
+                        help="每次查询返回的最大候选词数（预先计算的前K个词条）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        trie = compile_dictionary(args.sources, args.output, args.max_candidates)
+    except (OSError, ValueError) as e:
+        logger.error(f"编译失败: {e}")
+        sys.exit(1)
+    logger.info(f"已写入 {args.output}: {len(trie)} 个词条, {trie.node_count} 个节点, "
+                f"{os.path.getsize(args.output) / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 原生引擎后端
+通过ctypes在进程内调用dll_component编译出的librime_dll（rime_dll.h中的C接口），
+对外提供与pyrime相同的会话接口，供RimeWrapper使用
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import os
+import sys
+import ctypes
+import ctypes.util
+import threading
+from typing import Dict, Any, Optional
+
+# dll_component/build中的默认库文件名
+if sys.platform.startswith('win'):
+    LIBRARY_NAME = 'rime_dll.dll'
+elif sys.platform == 'darwin':
+    LIBRARY_NAME = 'librime_dll.dylib'
+else:
+    LIBRARY_NAME = 'librime_dll.so'
+
+DEFAULT_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dll_component',
+                                    'build', LIBRARY_NAME)
+
+class RimeCandidate(ctypes.Structure):
+    """对应rime_dll.h中的RimeCandidate"""
+    _fields_ = [
+        ('text', ctypes.c_char * 256),
+        ('comment', ctypes.c_char * 256),
+        ('index', ctypes.c_int),
+    ]
+
+class RimeInputState(ctypes.Structure):
+    """对应rime_dll.h中的RimeInputState"""
+    _fields_ = [
+        ('composition', ctypes.c_char * 512),
+        ('candidates', ctypes.POINTER(RimeCandidate)),
+        ('candidate_count', ctypes.c_int),
+        ('page_size', ctypes.c_int),
+        ('page_no', ctypes.c_int),
+        ('is_last_page', ctypes.c_int),
+    ]
+
+class RimeResult(ctypes.Structure):
+    """对应rime_dll.h中的RimeResult"""
+    _fields_ = [
+        ('success', ctypes.c_int),
+        ('error_message', ctypes.c_char * 512),
+        ('selected_text', ctypes.c_char * 256),
+        ('state', RimeInputState),
+    ]
+
+def _text(value: bytes) -> str:
+    # C端用strncpy截断，可能截在多字节字符中间
+    return value.decode('utf-8', errors='replace')
+
+def find_library(path: Optional[str] = None) -> Optional[str]:
+    """
+    查找librime_dll
+
+    依次尝试：指定的路径、dll_component/build中的默认位置、系统库搜索路径。
+
+    Returns:
+        库文件路径，找不到时返回None
+    """
+    if path:
+        return path
+    if os.path.exists(DEFAULT_LIBRARY_PATH):
+        return DEFAULT_LIBRARY_PATH
+    return ctypes.util.find_library('rime_dll')
+
+class NativeRime:
+    """
+    librime_dll的ctypes绑定，接口与pyrime模块一致
+
+    ctypes在调用C函数期间释放GIL，引擎计算时其他线程（套接字读写、日志）可以继续运行。
+    librime_dll的会话表是没有加锁的全局std::map，因此所有调用通过一把锁串行化。
+    每次调用返回的RimeResult已包含完整的输入状态，按会话缓存下来，
+    紧随其后的get_context不再调用RimeGetCurrentState。
+    """
+
+    def __init__(self, library_path: Optional[str] = None, user_data_dir: str = "",
+                 shared_data_dir: str = ""):
+        """
+        Args:
+            library_path: 库文件路径，默认在dll_component/build和系统路径中查找
+            user_data_dir: 传给RimeInitialize的用户数据目录
+            shared_data_dir: 传给RimeInitialize的共享数据目录
+
+        Raises:
+            OSError: 找不到或无法加载库
+        """
+        path = find_library(library_path)
+        if path is None:
+            raise OSError(f"找不到{LIBRARY_NAME}，请先运行dll_component/build.sh")
+
+        self.library_path = path
+        self.lib = ctypes.CDLL(path)
+        self._declare_functions()
+
+        self.user_data_dir = user_data_dir.encode('utf-8')
+        self.shared_data_dir = shared_data_dir.encode('utf-8')
+        self.lock = threading.Lock()
+        # 调用之间复用的结果结构（只在持有锁时使用）
+        self.result = RimeResult()
+        # 会话ID -> 最近一次调用后的上下文
+        self.contexts = {}
+
+        if not self.lib.RimeIsAvailable():
+            raise OSError(f"{path} 报告Rime引擎不可用")
+
+    def _declare_functions(self):
+        """声明C函数的参数和返回类型"""
+        lib = self.lib
+        result_pointer = ctypes.POINTER(RimeResult)
+
+        lib.RimeInitialize.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+        lib.RimeInitialize.restype = ctypes.c_int
+        lib.RimeDestroy.argtypes = [ctypes.c_int]
+        lib.RimeDestroy.restype = None
+        lib.RimeProcessKey.argtypes = [ctypes.c_int, ctypes.c_int, result_pointer]
+        lib.RimeProcessKey.restype = None
+        lib.RimeSelectCandidate.argtypes = [ctypes.c_int, ctypes.c_int, result_pointer]
+        lib.RimeSelectCandidate.restype = None
+        lib.RimeClearComposition.argtypes = [ctypes.c_int, result_pointer]
+        lib.RimeClearComposition.restype = None
+        lib.RimeGetCurrentState.argtypes = [ctypes.c_int, result_pointer]
+        lib.RimeGetCurrentState.restype = None
+        lib.RimeFreeResult.argtypes = [result_pointer]
+        lib.RimeFreeResult.restype = None
+        lib.RimeGetVersion.argtypes = []
+        lib.RimeGetVersion.restype = ctypes.c_char_p
+        lib.RimeIsAvailable.argtypes = []
+        lib.RimeIsAvailable.restype = ctypes.c_int
+
+    def version(self) -> str:
+        """库的版本字符串"""
+        return _text(self.lib.RimeGetVersion() or b"")
+
+    def _call(self, function, session_id: int, *args) -> bytes:
+        """
+        调用一个填充RimeResult的函数，并把结果中的状态转换为上下文缓存起来
+
+        Returns:
+            结果中的selected_text
+
+        Raises:
+            RuntimeError: 调用失败（例如会话不存在）
+        """
+        with self.lock:
+            result = self.result
+            function(session_id, *args, ctypes.byref(result))
+            try:
+                if not result.success:
+                    self.contexts.pop(session_id, None)
+                    raise RuntimeError(_text(result.error_message) or "Rime调用失败")
+                self.contexts[session_id] = self._context(result.state)
+                selected_text = result.selected_text
+            finally:
+                self.lib.RimeFreeResult(ctypes.byref(result))
+        return selected_text
+
+    @staticmethod
+    def _context(state: RimeInputState) -> Dict[str, Any]:
+        """把RimeInputState转换为pyrime格式的上下文"""
+        candidates = state.candidates
+        return {
+            'composition': {
+                'preedit': _text(state.composition)
+            },
+            'menu': {
+                'candidates': [
+                    {'text': _text(candidate.text), 'comment': _text(candidate.comment), 'index': candidate.index}
+                    for candidate in (candidates[i] for i in range(state.candidate_count))
+                ],
+                'page_size': state.page_size,
+                'page_no': state.page_no,
+                'is_last_page': bool(state.is_last_page)
+            }
+        }
+
+    def create_session(self) -> int:
+        """创建会话，失败返回0"""
+        with self.lock:
+            return self.lib.RimeInitialize(self.user_data_dir, self.shared_data_dir)
+
+    def destroy_session(self, session_id: int):
+        """销毁会话"""
+        with self.lock:
+            self.contexts.pop(session_id, None)
+            self.lib.RimeDestroy(session_id)
+
+    def process_key(self, session_id: int, key_code: int) -> bool:
+        """处理按键（C接口不返回按键是否被引擎处理，总是返回True）"""
+        self._call(self.lib.RimeProcessKey, session_id, key_code)
+        return True
+
+    def get_context(self, session_id: int) -> Dict[str, Any]:
+        """当前上下文"""
+        context = self.contexts.get(session_id)
+        if context is None:
+            self._call(self.lib.RimeGetCurrentState, session_id)
+            context = self.contexts[session_id]
+        return context
+
+    def select_candidate(self, session_id: int, index: int) -> Optional[str]:
+        """选择候选词，返回上屏的文字，索引无效时返回None"""
+        selected_text = self._call(self.lib.RimeSelectCandidate, session_id, index)
+        return _text(selected_text) or None
+
+    def clear_composition(self, session_id: int):
+        """清空输入"""
+        self._call(self.lib.RimeClearComposition, session_id)
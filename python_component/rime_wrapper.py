@@ -9,95 +9,235 @@ Rime输入法引擎的Python包装器
 """
 
 import os
-import sys
 import json
+import time
 import logging
+import itertools
+from collections import OrderedDict
 from typing import List, Dict, Optional, Any
-from dataclasses import dataclass, asdict
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('rime_wrapper.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+import startup
+from logging_setup import setup_logging
+from tracing import current_trace
+
+# 日志由调用方（ipc_server.main或本模块的main）通过logging_setup配置
 logger = logging.getLogger(__name__)
 
-@dataclass
-class CandidateWord:
-    """候选词数据结构"""
-    text: str
-    comment: str = ""
-    index: int = 0
+# 未指定离线词典时模拟引擎使用的内置词典（列表中靠前的候选词权重更高）
+MOCK_DICT = {
+    "ni": ["你", "尼", "泥"],
+    "hao": ["好", "号", "豪"],
+    "nihao": ["你好"],
+    "shi": ["是", "时", "事"],
+    "jie": ["界", "接", "街"],
+    "shijie": ["世界"],
+    "zhong": ["中", "钟", "重"],
+    "guo": ["国", "果", "过"],
+    "zhongguo": ["中国"],
+    "yi": ["一", "以", "已", "意", "议", "义", "亿", "易", "医", "艺", "依", "移"]
+}
+
+# 所有会话共用的版本号来源，会话被回收后重新创建时版本号也不会与之前的重复。
+# 从当前时间（微秒）开始，重启后的进程（例如工作池重启的工作进程）不会重新发出旧的版本号
+_state_versions = itertools.count(time.time_ns() // 1000)
 
-@dataclass
-class InputState:
-    """输入状态数据结构"""
-    composition: str = ""  # 当前输入的拼音
-    candidates: List[CandidateWord] = None
-    page_size: int = 5
-    page_no: int = 0
-    is_last_page: bool = True
-    
-    def __post_init__(self):
-        if self.candidates is None:
-            self.candidates = []
+class StateHistory:
+    """
+    单个会话的输入状态版本历史
+    
+    状态发生变化时取一个新的版本号（进程内单调递增，不保证连续），保留最近若干个版本的快照，
+    用于计算相对客户端已确认版本的增量。dirty表示引擎状态可能已经
+    与最新快照不一致，为False时可以直接返回最新快照而不必重新查询引擎。
+    """
+    
+    def __init__(self, max_versions: int = 16):
+        """
+        初始化版本历史
+        
+        Args:
+            max_versions: 保留的快照数量
+        """
+        self.version = 0
+        self.max_versions = max_versions
+        self.snapshots = OrderedDict()
+        self.dirty = True
+    
+    def record(self, state: Dict[str, Any]) -> int:
+        """
+        记录最新状态
+        
+        Args:
+            state: 输入状态字典
+            
+        Returns:
+            最新状态的版本号
+        """
+        self.dirty = False
+        if self.snapshots and self.snapshots[self.version] == state:
+            return self.version
+        
+        self.version = next(_state_versions)
+        self.snapshots[self.version] = state
+        if len(self.snapshots) > self.max_versions:
+            self.snapshots.popitem(last=False)
+        return self.version
+    
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """
+        返回仍然有效的最新快照
+        
+        Returns:
+            最新状态字典，没有快照或状态可能已变化时返回None
+        """
+        if self.dirty or not self.snapshots:
+            return None
+        return self.snapshots[self.version]
+    
+    def diff(self, base_version: int) -> Optional[Dict[str, Any]]:
+        """
+        计算从base_version到最新版本发生变化的字段
+        
+        Args:
+            base_version: 客户端已确认的版本号
+            
+        Returns:
+            变化字段组成的字典，base_version已不在历史中时返回None
+        """
+        base = self.snapshots.get(base_version)
+        if base is None:
+            return None
+        
+        latest = self.snapshots[self.version]
+        return {key: value for key, value in latest.items() if base.get(key) != value}
 
 class RimeWrapper:
     """Rime输入法引擎包装器"""
     
-    def __init__(self, user_data_dir: str = None, shared_data_dir: str = None):
+    # 翻页按键（X11 keysym）
+    PAGE_UP_KEY = 65365
+    PAGE_DOWN_KEY = 65366
+    # 引擎自己分页时一次翻页请求最多发送的翻页键数
+    MAX_PAGE_KEYS = 100
+    
+    # 可选的引擎后端
+    BACKENDS = ('auto', 'pyrime', 'native', 'mock')
+    
+    def __init__(self, user_data_dir: str = None, shared_data_dir: str = None, backend: str = 'auto',
+                 library_path: Optional[str] = None, dictionaries: Optional[List[str]] = None):
         """
         初始化Rime引擎
         
         Args:
             user_data_dir: 用户数据目录
             shared_data_dir: 共享数据目录
+            backend: 引擎后端：auto（pyrime，导入失败时使用模拟实现）、pyrime、
+                     native（通过ctypes调用librime_dll）或mock
+            library_path: native后端的库文件路径，默认在dll_component/build中查找
+            dictionaries: 模拟引擎使用的Rime词典文件（*.dict.yaml）或一个编译后的词典文件（*.trie），
+                          默认使用内置的小词典
         """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"未知引擎后端: {backend}")
+        
         self.user_data_dir = user_data_dir or os.path.expanduser("~/.config/rime")
         self.shared_data_dir = shared_data_dir or "/usr/share/rime-data"
         self.session_id = None
         self.is_initialized = False
+        self.dictionaries = dictionaries
+        # 会话ID -> StateHistory
+        self.state_histories = {}
+        # 会话ID -> 当前候选词页码（由包装器分页时使用）
+        self.session_pages = {}
         
-        # 尝试导入pyrime
-        try:
-            import pyrime
-            self.pyrime = pyrime
-            logger.info("PyRime模块导入成功")
-        except ImportError as e:
-            logger.error(f"PyRime模块导入失败: {e}")
-            # 创建一个模拟的pyrime模块用于测试
-            self.pyrime = self._create_mock_pyrime()
-            logger.warning("使用模拟PyRime模块进行测试")
+        self.pyrime = self._load_backend(backend, library_path)
+        startup.lap('rime_backend')
+        if self.pyrime is not None:
+            self._initialize_rime()
+            startup.lap('rime_session')
+    
+    def _load_backend(self, backend: str, library_path: Optional[str]):
+        """
+        加载引擎后端，设置self.backend为实际使用的后端
+        
+        Returns:
+            提供pyrime会话接口的对象，明确指定的后端加载失败时返回None
+        """
+        self.backend = backend
+        
+        if backend == 'native':
+            try:
+                from rime_native import NativeRime
+                native = NativeRime(library_path, self.user_data_dir, self.shared_data_dir)
+            except OSError as e:
+                logger.error(f"加载原生Rime引擎失败: {e}")
+                return None
+            logger.info(f"原生Rime引擎加载成功: {native.library_path} ({native.version()})")
+            return native
+        
+        if backend in ('auto', 'pyrime'):
+            # 尝试导入pyrime
+            try:
+                import pyrime
+                self.backend = 'pyrime'
+                logger.info("PyRime模块导入成功")
+                return pyrime
+            except ImportError as e:
+                logger.error(f"PyRime模块导入失败: {e}")
+                if backend == 'pyrime':
+                    return None
         
-        self._initialize_rime()
+        # 创建一个模拟的pyrime模块用于测试
+        self.backend = 'mock'
+        logger.warning("使用模拟PyRime模块进行测试")
+        return self._create_mock_pyrime()
     
     def _create_mock_pyrime(self):
-        """创建模拟的PyRime模块用于测试"""
+        """
+        创建模拟的PyRime模块用于测试
+        
+        候选词来自离线前缀树词典（rime_dict.PrefixTrie），输入完整编码或编码前缀
+        都能得到按权重排列的候选词。
+        
+        Returns:
+            模拟模块，词典加载失败时返回None
+        """
+        from rime_dict import PrefixTrie, TrieCursor, load_dictionary
+        
+        if self.dictionaries:
+            try:
+                dictionary = load_dictionary(self.dictionaries)
+            except (OSError, ValueError) as e:
+                logger.error(f"加载离线词典失败: {e}")
+                return None
+        else:
+            dictionary = PrefixTrie.from_mapping(MOCK_DICT)
+        startup.lap('dictionary')
+        
         class MockRime:
-            def __init__(self):
+            def __init__(self, dictionary):
                 self.composition = ""
-                self.candidates = []
-                self.mock_dict = {
-                    "ni": ["你", "尼", "泥"],
-                    "hao": ["好", "号", "豪"],
-                    "nihao": ["你好"],
-                    "shi": ["是", "时", "事"],
-                    "jie": ["界", "接", "街"],
-                    "shijie": ["世界"],
-                    "zhong": ["中", "钟", "重"],
-                    "guo": ["国", "果", "过"],
-                    "zhongguo": ["中国"]
-                }
+                self.set_dictionary(dictionary)
+            
+            def set_dictionary(self, dictionary):
+                """更换词典并清空输入"""
+                self.dictionary = dictionary
+                # 每个已输入的字母一帧，按键只在前缀树上前进一步，退格直接取回上一帧的候选词
+                self.cursor = TrieCursor(dictionary, self._make_candidates)
+                self.composition = ""
+                self.candidates = self.cursor.candidates
+            
+            @staticmethod
+            def _make_candidates(dictionary, entries):
+                return [
+                    {'text': dictionary.text(entry), 'comment': f"拼音: {dictionary.code(entry)}", 'index': i}
+                    for i, entry in enumerate(entries)
+                ]
             
             def process_key(self, key_code):
                 if key_code == 65288:  # Backspace
                     if self.composition:
                         self.composition = self.composition[:-1]
-                        self._update_candidates()
+                        self.candidates = self.cursor.pop()
                     return True
                 elif key_code == 65293:  # Enter
                     if self.candidates:
@@ -106,20 +246,10 @@ class RimeWrapper:
                 elif 97 <= key_code <= 122:  # a-z
                     char = chr(key_code)
                     self.composition += char
-                    self._update_candidates()
+                    self.candidates = self.cursor.push(char)
                     return True
                 return False
             
-            def _update_candidates(self):
-                self.candidates = []
-                if self.composition in self.mock_dict:
-                    for i, word in enumerate(self.mock_dict[self.composition]):
-                        self.candidates.append({
-                            'text': word,
-                            'comment': f"拼音: {self.composition}",
-                            'index': i
-                        })
-            
             def get_candidates(self):
                 return self.candidates
             
@@ -129,35 +259,41 @@ class RimeWrapper:
             def select_candidate(self, index):
                 if 0 <= index < len(self.candidates):
                     selected = self.candidates[index]['text']
-                    self.composition = ""
-                    self.candidates = []
+                    self.clear_composition()
                     return selected
                 return None
             
             def clear_composition(self):
                 self.composition = ""
-                self.candidates = []
+                self.cursor.reset()
+                self.candidates = self.cursor.candidates
         
         class MockPyRime:
-            def __init__(self):
-                self.rime = MockRime()
+            def __init__(self, dictionary):
+                self.dictionary = dictionary
+                self.sessions = {}
+                self.next_session_id = 1
             
             def create_session(self):
-                return 1
+                session_id = self.next_session_id
+                self.next_session_id += 1
+                self.sessions[session_id] = MockRime(self.dictionary)
+                return session_id
             
             def destroy_session(self, session_id):
-                pass
+                self.sessions.pop(session_id, None)
             
             def process_key(self, session_id, key_code):
-                return self.rime.process_key(key_code)
+                return self.sessions[session_id].process_key(key_code)
             
             def get_context(self, session_id):
+                rime = self.sessions[session_id]
                 return {
                     'composition': {
-                        'preedit': self.rime.get_composition()
+                        'preedit': rime.get_composition()
                     },
                     'menu': {
-                        'candidates': self.rime.get_candidates(),
+                        'candidates': rime.get_candidates(),
                         'page_size': 5,
                         'page_no': 0,
                         'is_last_page': True
@@ -165,18 +301,19 @@ class RimeWrapper:
                 }
             
             def select_candidate(self, session_id, index):
-                return self.rime.select_candidate(index)
+                return self.sessions[session_id].select_candidate(index)
             
             def clear_composition(self, session_id):
-                self.rime.clear_composition()
+                self.sessions[session_id].clear_composition()
         
-        return MockPyRime()
+        return MockPyRime(dictionary)
     
     def _initialize_rime(self):
         """初始化Rime引擎"""
         try:
-            # 确保数据目录存在
-            os.makedirs(self.user_data_dir, exist_ok=True)
+            # 确保数据目录存在（模拟引擎不使用数据目录）
+            if self.backend != 'mock':
+                os.makedirs(self.user_data_dir, exist_ok=True)
             
             # 创建会话
             self.session_id = self.pyrime.create_session()
@@ -188,12 +325,82 @@ class RimeWrapper:
         except Exception as e:
             logger.error(f"Rime引擎初始化失败: {e}")
     
-    def process_key(self, key_code: int) -> Dict[str, Any]:
+    def create_session(self) -> Optional[int]:
+        """
+        在已初始化的引擎上创建额外的会话
+        
+        Returns:
+            新会话ID，失败返回None
+        """
+        if not self.is_initialized:
+            return None
+        
+        try:
+            return self.pyrime.create_session() or None
+        except Exception as e:
+            logger.error(f"创建Rime会话失败: {e}")
+            return None
+    
+    def destroy_session(self, session_id: int):
+        """
+        销毁由create_session创建的会话
+        
+        Args:
+            session_id: 会话ID
+        """
+        self.state_histories.pop(session_id, None)
+        self.session_pages.pop(session_id, None)
+        try:
+            self.pyrime.destroy_session(session_id)
+        except Exception as e:
+            logger.error(f"销毁Rime会话失败: {e}")
+    
+    def get_state_delta(self, session_id: Optional[int], base_version: int) -> Optional[Dict[str, Any]]:
+        """
+        获取会话状态相对某个版本的增量
+        
+        Args:
+            session_id: 会话ID，默认使用包装器自身的会话
+            base_version: 客户端已确认的版本号
+            
+        Returns:
+            变化字段组成的字典，无法计算增量（需要完整快照）时返回None
+        """
+        history = self.state_histories.get(session_id or self.session_id)
+        if history is None:
+            return None
+        return history.diff(base_version)
+    
+    def _cached_state(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """
+        返回会话仍然有效的缓存状态，没有时返回None
+        
+        缓存的是状态字典而不是编码后的字节：省去查询引擎和构建字典，但响应仍由
+        IPC层按连接的编解码器完整编码（响应中还有version、id、trace等逐次变化的字段）
+        """
+        history = self.state_histories.get(session_id)
+        return history.latest() if history is not None else None
+    
+    def _mark_dirty(self, session_id: int):
+        """引擎状态可能已变化，使缓存的状态失效"""
+        history = self.state_histories.get(session_id)
+        if history is not None:
+            history.dirty = True
+    
+    def _record_state(self, session_id: int, state: Dict[str, Any]) -> int:
+        """记录会话的最新状态，返回版本号"""
+        history = self.state_histories.get(session_id)
+        if history is None:
+            history = self.state_histories[session_id] = StateHistory()
+        return history.record(state)
+    
+    def process_key(self, key_code: int, session_id: Optional[int] = None) -> Dict[str, Any]:
         """
         处理按键输入
         
         Args:
             key_code: 按键码
+            session_id: 会话ID，默认使用包装器自身的会话
             
         Returns:
             包含处理结果的字典
@@ -201,31 +408,62 @@ class RimeWrapper:
         if not self.is_initialized:
             return {"error": "Rime引擎未初始化"}
         
+        session_id = session_id or self.session_id
+        trace = current_trace()
+        
         try:
             # 处理按键
-            result = self.pyrime.process_key(self.session_id, key_code)
+            result = self.pyrime.process_key(session_id, key_code)
+            if trace:
+                trace.lap('engine_process_key')
+            
+            if not result:
+                # 引擎未处理该按键，状态不会变化，直接返回缓存的状态字典（仍会重新编码）
+                state = self._cached_state(session_id)
+                if state is not None:
+                    if trace:
+                        trace.lap('state_cache')
+                    return {
+                        "success": True,
+                        "processed": False,
+                        "state": state,
+                        "version": self.state_histories[session_id].version
+                    }
+            else:
+                self._mark_dirty(session_id)
+                self.session_pages.pop(session_id, None)
             
             # 获取当前状态
-            context = self.pyrime.get_context(self.session_id)
+            context = self.pyrime.get_context(session_id)
+            if trace:
+                trace.lap('engine_get_context')
             
             # 构建返回结果
-            input_state = self._build_input_state(context)
+            state = self._build_state_dict(context, self.session_pages.get(session_id, 0))
+            if trace:
+                trace.lap('build_state')
+            
+            version = self._record_state(session_id, state)
+            if trace:
+                trace.lap('record_state')
             
             return {
                 "success": True,
                 "processed": bool(result),
-                "state": asdict(input_state)
+                "state": state,
+                "version": version
             }
         except Exception as e:
             logger.error(f"处理按键失败: {e}")
             return {"error": str(e)}
     
-    def select_candidate(self, index: int) -> Dict[str, Any]:
+    def select_candidate(self, index: int, session_id: Optional[int] = None) -> Dict[str, Any]:
         """
         选择候选词
         
         Args:
-            index: 候选词索引
+            index: 候选词在当前页中的位置（与状态中候选词的index相同）
+            session_id: 会话ID，默认使用包装器自身的会话
             
         Returns:
             包含选择结果的字典
@@ -233,117 +471,283 @@ class RimeWrapper:
         if not self.is_initialized:
             return {"error": "Rime引擎未初始化"}
         
+        session_id = session_id or self.session_id
+        trace = current_trace()
+        
         try:
+            self._mark_dirty(session_id)
+            page_no = self.session_pages.pop(session_id, 0)
+            if page_no:
+                # 由包装器分页时引擎的候选列表是完整的，换算成在完整列表中的位置
+                context = self.pyrime.get_context(session_id)
+                if context and context.get('menu') and not self._is_engine_paged(context):
+                    index += page_no * context['menu'].get('page_size', 5)
+            
             # 选择候选词
-            selected_text = self.pyrime.select_candidate(self.session_id, index)
+            selected_text = self.pyrime.select_candidate(session_id, index)
+            if trace:
+                trace.lap('engine_select_candidate')
             
             # 获取更新后的状态
-            context = self.pyrime.get_context(self.session_id)
-            input_state = self._build_input_state(context)
+            context = self.pyrime.get_context(session_id)
+            if trace:
+                trace.lap('engine_get_context')
+            state = self._build_state_dict(context)
+            if trace:
+                trace.lap('build_state')
+            
+            version = self._record_state(session_id, state)
+            if trace:
+                trace.lap('record_state')
             
             return {
                 "success": True,
                 "selected_text": selected_text,
-                "state": asdict(input_state)
+                "state": state,
+                "version": version
             }
         except Exception as e:
             logger.error(f"选择候选词失败: {e}")
             return {"error": str(e)}
     
-    def clear_composition(self) -> Dict[str, Any]:
+    def clear_composition(self, session_id: Optional[int] = None) -> Dict[str, Any]:
         """
         清空当前输入
         
+        Args:
+            session_id: 会话ID，默认使用包装器自身的会话
+        
         Returns:
             包含清空结果的字典
         """
         if not self.is_initialized:
             return {"error": "Rime引擎未初始化"}
         
+        session_id = session_id or self.session_id
+        trace = current_trace()
+        
         try:
-            self.pyrime.clear_composition(self.session_id)
+            self._mark_dirty(session_id)
+            self.session_pages.pop(session_id, None)
+            self.pyrime.clear_composition(session_id)
+            if trace:
+                trace.lap('engine_clear_composition')
+            state = self._build_state_dict(None)
             
             return {
                 "success": True,
-                "state": asdict(InputState())
+                "state": state,
+                "version": self._record_state(session_id, state)
             }
         except Exception as e:
             logger.error(f"清空输入失败: {e}")
             return {"error": str(e)}
     
-    def get_current_state(self) -> Dict[str, Any]:
+    def get_current_state(self, session_id: Optional[int] = None) -> Dict[str, Any]:
         """
         获取当前输入状态
         
+        Args:
+            session_id: 会话ID，默认使用包装器自身的会话
+        
         Returns:
             包含当前状态的字典
         """
         if not self.is_initialized:
             return {"error": "Rime引擎未初始化"}
         
+        session_id = session_id or self.session_id
+        trace = current_trace()
+        
         try:
-            context = self.pyrime.get_context(self.session_id)
-            input_state = self._build_input_state(context)
+            state = self._cached_state(session_id)
+            if state is not None:
+                if trace:
+                    trace.lap('state_cache')
+                return {
+                    "success": True,
+                    "state": state,
+                    "version": self.state_histories[session_id].version
+                }
+            
+            context = self.pyrime.get_context(session_id)
+            if trace:
+                trace.lap('engine_get_context')
+            state = self._build_state_dict(context, self.session_pages.get(session_id, 0))
+            if trace:
+                trace.lap('build_state')
             
             return {
                 "success": True,
-                "state": asdict(input_state)
+                "state": state,
+                "version": self._record_state(session_id, state)
             }
         except Exception as e:
             logger.error(f"获取状态失败: {e}")
             return {"error": str(e)}
     
-    def _build_input_state(self, context: Dict) -> InputState:
+    def page_down(self, session_id: Optional[int] = None) -> Dict[str, Any]:
         """
-        从Rime上下文构建输入状态
+        候选词翻到下一页
+        
+        Args:
+            session_id: 会话ID，默认使用包装器自身的会话
+        
+        Returns:
+            包含翻页后状态的字典，已是最后一页时状态不变
+        """
+        return self._turn_page(session_id or self.session_id, step=1)
+    
+    def page_up(self, session_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        候选词翻到上一页
+        
+        Args:
+            session_id: 会话ID，默认使用包装器自身的会话
+        
+        Returns:
+            包含翻页后状态的字典，已是第一页时状态不变
+        """
+        return self._turn_page(session_id or self.session_id, step=-1)
+    
+    def get_page(self, page_no: int, session_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        跳转到指定的候选词页
+        
+        引擎返回完整候选列表时由包装器分页；引擎自己分页时（菜单只包含当前页）
+        通过发送Page_Up/Page_Down按键让引擎翻页。
+        
+        Args:
+            page_no: 目标页码（从0开始），超出范围时停在第一页或最后一页
+            session_id: 会话ID，默认使用包装器自身的会话
+            
+        Returns:
+            包含翻页后状态的字典
+        """
+        return self._turn_page(session_id or self.session_id, page_no=page_no)
+    
+    def _turn_page(self, session_id: int, page_no: Optional[int] = None, step: int = 0) -> Dict[str, Any]:
+        """
+        翻页的实现
+        
+        page_no为None时目标页为当前页加step。引擎自己分页时当前页取自引擎菜单
+        （按键后引擎通常回到第一页，包装器记录的页码此时已被清除）。
+        """
+        if not self.is_initialized:
+            return {"error": "Rime引擎未初始化"}
+        
+        try:
+            self._mark_dirty(session_id)
+            context = self.pyrime.get_context(session_id)
+            engine_paged = self._is_engine_paged(context)
+            
+            if page_no is None:
+                if engine_paged:
+                    current = context['menu'].get('page_no', 0)
+                else:
+                    current = self.session_pages.get(session_id, 0)
+                page_no = current + step
+            page_no = max(page_no, 0)
+            
+            if engine_paged:
+                # 逐页发送翻页键，直到到达目标页、引擎不再翻页或达到按键次数上限
+                for _ in range(self.MAX_PAGE_KEYS):
+                    menu = (context or {}).get('menu') or {}
+                    current = menu.get('page_no', 0)
+                    if current < page_no and not menu.get('is_last_page', True):
+                        key_code = self.PAGE_DOWN_KEY
+                    elif current > page_no:
+                        key_code = self.PAGE_UP_KEY
+                    else:
+                        break
+                    if not self.pyrime.process_key(session_id, key_code):
+                        break
+                    context = self.pyrime.get_context(session_id)
+                    if ((context or {}).get('menu') or {}).get('page_no', 0) == current:
+                        # 引擎处理了按键但页码没有变化
+                        break
+            
+            state = self._build_state_dict(context, page_no)
+            self.session_pages[session_id] = state['page_no']
+            
+            return {
+                "success": True,
+                "state": state,
+                "version": self._record_state(session_id, state)
+            }
+        except Exception as e:
+            logger.error(f"翻页失败: {e}")
+            return {"error": str(e)}
+    
+    @staticmethod
+    def _is_engine_paged(context: Optional[Dict]) -> bool:
+        """引擎返回的菜单是否已经只包含当前页"""
+        menu = context.get('menu') if context else None
+        if not menu:
+            return False
+        return len(menu.get('candidates') or ()) <= menu.get('page_size', 5)
+    
+    def _build_state_dict(self, context: Optional[Dict], page_no: int = 0) -> Dict[str, Any]:
+        """
+        从Rime上下文直接构建可序列化的状态字典
+        
+        不创建中间的数据类对象，也不经过asdict的递归深拷贝，每个候选词只构建
+        一次字典。引擎返回的候选词多于page_size时只构建page_no指定的一页
+        （超出范围时取最后一页），否则使用引擎菜单中的页码。两种情况下
+        候选词的index都是在当前页中的位置，可直接传给select_candidate。
         
         Args:
             context: Rime上下文
+            page_no: 由包装器分页时要构建的页码
             
         Returns:
-            InputState对象
+            状态字典
         """
         composition = ""
         candidates = []
         page_size = 5
-        page_no = 0
         is_last_page = True
         
         if context:
-            # 获取当前输入的拼音
-            if 'composition' in context and context['composition']:
-                composition = context['composition'].get('preedit', '')
-            
-            # 获取候选词列表
-            if 'menu' in context and context['menu']:
-                menu = context['menu']
-                if 'candidates' in menu:
-                    for i, candidate in enumerate(menu['candidates']):
-                        if isinstance(candidate, dict):
-                            candidates.append(CandidateWord(
-                                text=candidate.get('text', ''),
-                                comment=candidate.get('comment', ''),
-                                index=i
-                            ))
-                        else:
-                            # 处理简单字符串格式的候选词
-                            candidates.append(CandidateWord(
-                                text=str(candidate),
-                                comment='',
-                                index=i
-                            ))
-                
+            composition_info = context.get('composition')
+            if composition_info:
+                composition = composition_info.get('preedit', '')
+            
+            menu = context.get('menu')
+            if menu:
+                all_candidates = menu.get('candidates') or ()
                 page_size = menu.get('page_size', 5)
-                page_no = menu.get('page_no', 0)
-                is_last_page = menu.get('is_last_page', True)
+                
+                if len(all_candidates) > page_size:
+                    # 引擎返回了完整的候选列表，只物化当前页
+                    last_page = (len(all_candidates) - 1) // page_size
+                    page_no = min(max(page_no, 0), last_page)
+                    start = page_no * page_size
+                    visible = all_candidates[start:start + page_size]
+                    is_last_page = page_no == last_page
+                else:
+                    visible = all_candidates
+                    page_no = menu.get('page_no', 0)
+                    is_last_page = menu.get('is_last_page', True)
+                
+                candidates = [
+                    {'text': candidate.get('text', ''), 'comment': candidate.get('comment', ''), 'index': i}
+                    if isinstance(candidate, dict) else
+                    {'text': str(candidate), 'comment': '', 'index': i}
+                    for i, candidate in enumerate(visible)
+                ]
+            else:
+                page_no = 0
+        else:
+            page_no = 0
         
-        return InputState(
-            composition=composition,
-            candidates=candidates,
-            page_size=page_size,
-            page_no=page_no,
-            is_last_page=is_last_page
-        )
+        return {
+            'composition': composition,
+            'candidates': candidates,
+            'page_size': page_size,
+            'page_no': page_no,
+            'is_last_page': is_last_page
+        }
     
     def __del__(self):
         """析构函数，清理资源"""
@@ -356,6 +760,7 @@ class RimeWrapper:
 
 def main():
     """主函数，用于测试"""
+    setup_logging('rime_wrapper.log')
     logger.info("启动Rime包装器测试")
     
     # 创建Rime包装器实例
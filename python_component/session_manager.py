@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 会话管理器
+为每个客户端连接（或请求中显式指定的session_id）分配独立的Rime会话
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from rime_wrapper import RimeWrapper
+
+logger = logging.getLogger(__name__)
+
+class SessionManager:
+    """
+    Rime会话池
+
+    所有会话共享同一个RimeWrapper（即同一个已初始化的引擎），
+    按需惰性创建，超过上限或空闲超时后按LRU顺序通过destroy_session回收。
+    """
+
+    def __init__(self, rime_wrapper: RimeWrapper, max_sessions: int = 256,
+                 idle_timeout: float = 600.0):
+        """
+        初始化会话管理器
+
+        Args:
+            rime_wrapper: 已初始化的Rime包装器
+            max_sessions: 最大会话数量
+            idle_timeout: 会话空闲超时时间（秒），0表示不按时间回收
+        """
+        self.rime_wrapper = rime_wrapper
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        # 会话键 -> [Rime会话ID, 最后使用时间]，按最近使用顺序排列
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, key: Hashable) -> Optional[int]:
+        """
+        获取会话键对应的Rime会话，不存在时创建
+
+        Args:
+            key: 会话键（连接标识或客户端提供的session_id）
+
+        Returns:
+            Rime会话ID，创建失败返回None
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.sessions.get(key)
+            if entry is not None:
+                entry[1] = now
+                self.sessions.move_to_end(key)
+                return entry[0]
+
+            self._evict_idle(now)
+            while len(self.sessions) >= self.max_sessions:
+                old_key, (old_session_id, _) = self.sessions.popitem(last=False)
+                logger.warning(f"会话数量达到上限 {self.max_sessions}，回收最久未使用的会话: {old_key}")
+                self.rime_wrapper.destroy_session(old_session_id)
+
+            session_id = self.rime_wrapper.create_session()
+            if session_id is None:
+                return None
+
+            self.sessions[key] = [session_id, now]
+            logger.info(f"创建Rime会话 {session_id}: {key}")
+            return session_id
+
+    def release(self, key: Hashable):
+        """
+        销毁会话键对应的Rime会话
+
+        Args:
+            key: 会话键
+        """
+        with self.lock:
+            entry = self.sessions.pop(key, None)
+
+        if entry is not None:
+            self.rime_wrapper.destroy_session(entry[0])
+            logger.info(f"释放Rime会话 {entry[0]}: {key}")
+
+    def _evict_idle(self, now: float):
+        """回收空闲超时的会话（调用方需持有锁）"""
+        if self.idle_timeout <= 0:
+            return
+
+        while self.sessions:
+            key, (session_id, last_used) = next(iter(self.sessions.items()))
+            if now - last_used < self.idle_timeout:
+                break
+
+            del self.sessions[key]
+            self.rime_wrapper.destroy_session(session_id)
+            logger.info(f"回收空闲Rime会话 {session_id}: {key}")
+
+    def close(self):
+        """销毁所有会话"""
+        with self.lock:
+            entries = list(self.sessions.values())
+            self.sessions.clear()
+
+        for session_id, _ in entries:
+            self.rime_wrapper.destroy_session(session_id)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 共享内存传输
+同一主机上通过内存映射的单生产者单消费者（SPSC）环形缓冲区传递消息帧，
+用eventfd唤醒对端，仅支持Linux
+
+建立连接时客户端连接服务器的Unix域套接字（控制套接字），服务器创建memfd共享内存
+和两个eventfd并通过SCM_RIGHTS传给客户端。之后控制套接字只用于检测断开。
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import os
+import mmap
+import time
+import select
+import socket
+import struct
+from typing import List, Optional
+
+# 每个方向环形缓冲区的数据区大小（必须是2的幂）
+RING_CAPACITY = 1 << 20
+
+# 环形缓冲区布局：head（生产者写入位置）和tail（消费者读取位置）都是单调递增的
+# 64位计数器，分别放在不同的缓存行上，之后是数据区
+_HEAD_OFFSET = 0
+_TAIL_OFFSET = 64
+_DATA_OFFSET = 128
+_RING_SIZE = _DATA_OFFSET + RING_CAPACITY
+
+_COUNTER = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+
+# 一条消息体的最大长度（加上长度头必须能放进环形缓冲区）
+MAX_MESSAGE_SIZE = RING_CAPACITY - _LENGTH.size
+
+# 阻塞等待前自旋检查的时间，低负载下避免一次eventfd往返的唤醒延迟
+_SPIN_SECONDS = 50e-6
+
+# 发送缓冲区已满时等待对端读取的最长退避间隔
+_MAX_SEND_BACKOFF = 1e-3
+
+def is_supported() -> bool:
+    """当前平台是否支持共享内存传输"""
+    return hasattr(os, 'eventfd') and hasattr(os, 'memfd_create') and hasattr(socket, 'send_fds')
+
+class RingBuffer:
+    """
+    单生产者单消费者环形缓冲区
+
+    消息格式与套接字传输相同：4字节小端长度头 + 消息体。
+    生产者先写数据再更新head，消费者先读数据再更新tail。
+    """
+
+    def __init__(self, buffer: memoryview):
+        """
+        Args:
+            buffer: 大小为_RING_SIZE的共享内存视图
+        """
+        self.buffer = buffer
+        self.mask = RING_CAPACITY - 1
+
+    def write(self, data: bytes) -> bool:
+        """
+        写入一条消息
+
+        Returns:
+            缓冲区空间不足时返回False
+        """
+        head = _COUNTER.unpack_from(self.buffer, _HEAD_OFFSET)[0]
+        tail = _COUNTER.unpack_from(self.buffer, _TAIL_OFFSET)[0]
+
+        size = _LENGTH.size + len(data)
+        if size > RING_CAPACITY - (head - tail):
+            return False
+
+        self._copy_in(head, _LENGTH.pack(len(data)))
+        self._copy_in(head + _LENGTH.size, data)
+        _COUNTER.pack_into(self.buffer, _HEAD_OFFSET, head + size)
+        return True
+
+    def read(self) -> Optional[bytes]:
+        """
+        读取一条消息
+
+        Returns:
+            缓冲区为空时返回None
+        """
+        tail = _COUNTER.unpack_from(self.buffer, _TAIL_OFFSET)[0]
+        head = _COUNTER.unpack_from(self.buffer, _HEAD_OFFSET)[0]
+        if head == tail:
+            return None
+
+        length = _LENGTH.unpack(self._copy_out(tail, _LENGTH.size))[0]
+        data = self._copy_out(tail + _LENGTH.size, length)
+        _COUNTER.pack_into(self.buffer, _TAIL_OFFSET, tail + _LENGTH.size + length)
+        return data
+
+    def _copy_in(self, position: int, data: bytes):
+        """从position开始写入数据，必要时绕回数据区开头"""
+        offset = position & self.mask
+        first = min(len(data), RING_CAPACITY - offset)
+        start = _DATA_OFFSET + offset
+        self.buffer[start:start + first] = data[:first]
+        if first < len(data):
+            self.buffer[_DATA_OFFSET:_DATA_OFFSET + len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        """从position开始读取数据，必要时绕回数据区开头"""
+        offset = position & self.mask
+        first = min(length, RING_CAPACITY - offset)
+        start = _DATA_OFFSET + offset
+        data = bytes(self.buffer[start:start + first])
+        if first < length:
+            data += bytes(self.buffer[_DATA_OFFSET:_DATA_OFFSET + length - first])
+        return data
+
+class ShmChannel:
+    """一条共享内存连接的一端"""
+
+    def __init__(self, control_socket: socket.socket, memory: mmap.mmap,
+                 send_region: int, send_event: int, recv_event: int):
+        """
+        Args:
+            control_socket: 控制套接字
+            memory: 映射的共享内存（两个环形缓冲区）
+            send_region: 本端发送使用的环形缓冲区编号（0: 请求，1: 响应）
+            send_event: 通知对端有新消息的eventfd
+            recv_event: 对端通知本端有新消息的eventfd
+        """
+        self.control_socket = control_socket
+        self.memory = memory
+        self.view = memoryview(memory)
+        recv_region = 1 - send_region
+        self.send_view = self.view[send_region * _RING_SIZE:(send_region + 1) * _RING_SIZE]
+        self.recv_view = self.view[recv_region * _RING_SIZE:(recv_region + 1) * _RING_SIZE]
+        self.send_ring = RingBuffer(self.send_view)
+        self.recv_ring = RingBuffer(self.recv_view)
+        self.send_event = send_event
+        self.recv_event = recv_event
+        self.is_closed = False
+
+    @classmethod
+    def accept(cls, control_socket: socket.socket) -> 'ShmChannel':
+        """
+        服务器端：创建共享内存和eventfd并发送给客户端
+
+        服务器端的接收eventfd为非阻塞模式，便于注册到事件循环。
+        """
+        memory_fd = os.memfd_create('unity_rime_ipc')
+        try:
+            os.ftruncate(memory_fd, 2 * _RING_SIZE)
+            memory = mmap.mmap(memory_fd, 2 * _RING_SIZE)
+            request_event = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            response_event = os.eventfd(0, os.EFD_CLOEXEC)
+            socket.send_fds(control_socket, [b'shm'], [memory_fd, request_event, response_event])
+        finally:
+            os.close(memory_fd)
+
+        return cls(control_socket, memory, 1, response_event, request_event)
+
+    @classmethod
+    def connect(cls, path: str, timeout: float = 5.0) -> 'ShmChannel':
+        """客户端：连接服务器的控制套接字并映射共享内存"""
+        control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        control_socket.settimeout(timeout)
+        control_socket.connect(path)
+
+        _, fds, _, _ = socket.recv_fds(control_socket, 16, 3)
+        if len(fds) != 3:
+            control_socket.close()
+            raise ConnectionError("共享内存握手失败")
+        control_socket.settimeout(None)
+
+        memory_fd, request_event, response_event = fds
+        try:
+            memory = mmap.mmap(memory_fd, 2 * _RING_SIZE)
+        finally:
+            os.close(memory_fd)
+
+        return cls(control_socket, memory, 0, request_event, response_event)
+
+    def try_send(self, data: bytes) -> bool:
+        """写入一条消息但不通知对端，缓冲区已满时返回False"""
+        if len(data) > MAX_MESSAGE_SIZE:
+            raise ValueError(f"消息过大: {len(data)} 字节")
+        return self.send_ring.write(data)
+
+    def notify(self):
+        """通知对端有新消息"""
+        os.eventfd_write(self.send_event, 1)
+
+    def send(self, data: bytes, timeout: float = 5.0):
+        """
+        写入一条消息并通知对端
+
+        缓冲区已满时按指数退避等待对端读取，等待期间检测对端断开。
+
+        Args:
+            data: 消息体
+            timeout: 缓冲区一直没有空间时最多等待的秒数
+
+        Raises:
+            ValueError: 消息超过MAX_MESSAGE_SIZE
+            ConnectionError: 连接已关闭或对端已断开
+            TimeoutError: 超过timeout秒缓冲区仍然已满
+        """
+        deadline = time.monotonic() + timeout
+        backoff = 0.0
+        while not self.try_send(data):
+            if self.is_closed:
+                raise ConnectionError("连接已关闭")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"共享内存发送缓冲区已满，等待{timeout}秒后放弃")
+
+            # 对端只在断开时使控制套接字可读，可以代替sleep在等待期间检测断开
+            readable, _, _ = select.select([self.control_socket], [], [], min(backoff, remaining))
+            if readable and not self.control_socket.recv(1, socket.MSG_PEEK):
+                raise ConnectionError("连接已断开")
+            backoff = min(max(backoff * 2, _SPIN_SECONDS), _MAX_SEND_BACKOFF)
+        self.notify()
+
+    def recv(self) -> Optional[bytes]:
+        """
+        阻塞读取一条消息
+
+        Returns:
+            连接断开时返回None
+        """
+        deadline = time.perf_counter() + _SPIN_SECONDS
+        while True:
+            data = self.recv_ring.read()
+            if data is not None:
+                return data
+
+            if time.perf_counter() < deadline:
+                continue
+
+            # eventfd是计数器，检查与阻塞之间写入的通知不会丢失
+            readable, _, _ = select.select([self.recv_event, self.control_socket], [], [])
+            if self.control_socket in readable and not self.control_socket.recv(1):
+                return self.recv_ring.read()
+            if self.recv_event in readable:
+                os.eventfd_read(self.recv_event)
+
+    def drain(self) -> List[bytes]:
+        """非阻塞读取当前所有消息（服务器端在eventfd可读时调用）"""
+        try:
+            os.eventfd_read(self.recv_event)
+        except BlockingIOError:
+            pass
+
+        messages = []
+        while True:
+            data = self.recv_ring.read()
+            if data is None:
+                return messages
+            messages.append(data)
+
+    def close(self):
+        """关闭连接并释放共享内存"""
+        if self.is_closed:
+            return
+        self.is_closed = True
+
+        try:
+            self.control_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.control_socket.close()
+
+        for fd in (self.send_event, self.recv_event):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+        # 共享内存的所有视图释放后才能关闭映射
+        self.send_ring = self.recv_ring = None
+        self.send_view.release()
+        self.recv_view.release()
+        self.view.release()
+        self.memory.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 启动计时与就绪通知
+服务器启动过程按阶段计时（导入、参数解析、日志、引擎后端、词典、会话、监听），
+监听套接字就绪后通知启动者，启动者不必固定等待或反复尝试连接
+
+就绪通知有两种方式，可以同时使用：
+- 启动参数--ready-fd指定的文件描述符（通常是启动者创建的管道）写入READY=1后关闭，
+  传1时把这一行输出到标准输出
+- 环境变量NOTIFY_SOCKET存在时按sd_notify协议发送READY=1（systemd Type=notify）
+
+启动者可以使用start_server()：创建管道、启动服务器并等待就绪通知。
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import os
+import sys
+import time
+import socket
+import select
+# ipc_server导入asyncio时已经导入了subprocess，这里不增加启动时间
+import subprocess
+from typing import Dict, Any, List, Optional, Tuple
+
+# 就绪时写入--ready-fd的内容（与sd_notify的格式相同）
+READY_MESSAGE = b"READY=1\n"
+
+class StartupProfile:
+    """
+    启动阶段计时器
+
+    每次lap记录从上一次lap（或开始）到现在的耗时，阶段之间的所有时间都计入下一个阶段，
+    因此各阶段之和等于总耗时。就绪后不再记录（之后创建的RimeWrapper等不计入）。
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        """
+        Args:
+            start: 开始时间（time.perf_counter），默认为当前时间
+        """
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        # 阶段名 -> 秒数，按首次出现的顺序排列
+        self.stages = {}
+        self.finished = False
+
+    def lap(self, stage: str):
+        """结束一个阶段"""
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, stage: str = 'ready'):
+        """结束最后一个阶段并停止记录"""
+        self.lap(stage)
+        self.finished = True
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出各阶段耗时（毫秒）"""
+        return {
+            'stages_ms': {stage: seconds * 1000 for stage, seconds in self.stages.items()},
+            'total_ms': (self.last - self.start) * 1000
+        }
+
+    def report(self) -> str:
+        """各阶段耗时的文本表格"""
+        total = self.last - self.start
+        lines = ["启动耗时（从导入ipc_server开始，不含解释器启动）:"]
+        for stage, seconds in self.stages.items():
+            share = seconds / total if total > 0 else 0.0
+            lines.append(f"  {stage:<14} {seconds * 1000:9.2f} ms  {share:6.1%}")
+        lines.append(f"  {'total':<14} {total * 1000:9.2f} ms")
+        return "\n".join(lines)
+
+# 本进程的启动计时，从第一次导入本模块开始
+_profile = StartupProfile()
+
+def lap(stage: str):
+    """结束本进程启动过程中的一个阶段，就绪后调用不做任何事"""
+    _profile.lap(stage)
+
+def startup_profile() -> StartupProfile:
+    """本进程的启动计时器"""
+    return _profile
+
+def notify_ready(ready_fd: Optional[int] = None, status: str = ""):
+    """
+    通知启动者服务器已就绪，并结束启动计时
+
+    Args:
+        ready_fd: 写入READY=1的文件描述符，写入后关闭（0、1、2除外），None表示不写
+        status: sd_notify的STATUS字段
+    """
+    _profile.finish()
+
+    if ready_fd is not None:
+        try:
+            if ready_fd in (1, 2):
+                (sys.stdout if ready_fd == 1 else sys.stderr).flush()
+            os.write(ready_fd, READY_MESSAGE)
+        except OSError:
+            # 启动者已经不再等待
+            pass
+        finally:
+            if ready_fd > 2:
+                try:
+                    os.close(ready_fd)
+                except OSError:
+                    pass
+
+    notify_socket = os.environ.get('NOTIFY_SOCKET')
+    if notify_socket and hasattr(socket, 'AF_UNIX'):
+        # '@'开头表示Linux抽象命名空间
+        address = '\0' + notify_socket[1:] if notify_socket.startswith('@') else notify_socket
+        message = f"READY=1\nMAINPID={os.getpid()}\nSTATUS={status}"
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.sendto(message.encode('utf-8'), address)
+        except OSError:
+            pass
+
+def wait_ready(read_fd: int, timeout: float = 10.0) -> bool:
+    """
+    等待管道中的就绪通知
+
+    Returns:
+        收到READY=1时返回True；超时或管道关闭（服务器退出或启动失败）时返回False
+    """
+    data = b''
+    deadline = time.monotonic() + timeout
+    while READY_MESSAGE not in data:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        readable, _, _ = select.select([read_fd], [], [], remaining)
+        if not readable:
+            return False
+        chunk = os.read(read_fd, 64)
+        if not chunk:
+            return False
+        data += chunk
+    return True
+
+def start_server(args: List[str], timeout: float = 10.0, **popen_kwargs) -> Tuple[subprocess.Popen, bool]:
+    """
+    启动服务器子进程并等待其就绪（仅Unix，需要向子进程传递管道）
+
+    Args:
+        args: 服务器命令行（不含--ready-fd）
+        timeout: 等待就绪的最长时间（秒）
+        popen_kwargs: 传给subprocess.Popen的其他参数
+
+    Returns:
+        (进程, 是否就绪)；未就绪时进程可能仍在运行，由调用者结束
+    """
+    read_fd, write_fd = os.pipe()
+    try:
+        process = subprocess.Popen([*args, '--ready-fd', str(write_fd)], pass_fds=(write_fd,), **popen_kwargs)
+    finally:
+        os.close(write_fd)
+    try:
+        return process, wait_ready(read_fd, timeout)
+    finally:
+        os.close(read_fd)
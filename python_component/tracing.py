@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 请求分阶段计时
+请求带有 "trace": true 时，服务器在处理过程中逐段计时并把结果附加到响应中
+
+当前请求的计时器保存在contextvars中，RimeWrapper等下层代码通过current_trace()获取，
+未开启时为None，热点路径上只多一次ContextVar读取。
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+_current_trace = ContextVar('unity_rime_trace', default=None)
+
+class RequestTrace:
+    """
+    分段计时器
+
+    每次lap记录从上一次lap（或开始）到现在的耗时（单调时钟纳秒），
+    同名阶段多次出现时累加（例如batch中的多个按键）。
+    """
+
+    __slots__ = ('start_ns', 'last_ns', 'stages')
+
+    def __init__(self, start_ns: Optional[int] = None):
+        """
+        Args:
+            start_ns: 开始时间（time.perf_counter_ns），默认为当前时间
+        """
+        self.start_ns = start_ns if start_ns is not None else time.perf_counter_ns()
+        self.last_ns = self.start_ns
+        # 阶段名 -> 累计纳秒数，按首次出现的顺序排列
+        self.stages = {}
+
+    def lap(self, stage: str):
+        """结束一个阶段"""
+        now = time.perf_counter_ns()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self.last_ns
+        self.last_ns = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为响应中的trace字段"""
+        return {
+            'stages_ns': dict(self.stages),
+            'total_ns': self.last_ns - self.start_ns
+        }
+
+def current_trace() -> Optional[RequestTrace]:
+    """当前请求的计时器，未开启计时时返回None"""
+    return _current_trace.get()
+
+@contextmanager
+def activate(trace: RequestTrace):
+    """在with块内把trace设为当前请求的计时器"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
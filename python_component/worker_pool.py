@@ -0,0 +1,718 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Unity Rime输入法集成 - 多进程工作池
+前端进程监听端口并接受连接，按会话把连接分配给N个工作进程，
+每个工作进程运行自己的AsyncIPCServer和Rime会话，从而绕过单个GIL的限制
+
+前端读取连接上的第一帧（不解码之后的数据），请求中带session_id时交给
+worker_for(session_id)对应的工作进程，否则轮询分配。连接的文件描述符和已读取的
+字节通过SCM_RIGHTS交给工作进程，之后前端不再转发任何数据。
+同一会话的所有连接总在同一个工作进程中；一个连接中使用属于其他工作进程的
+session_id时返回错误。
+
+监督线程在工作进程退出后按指数退避重启它（会话状态随进程丢失）。
+stats命令和Prometheus端点返回合并所有工作进程后的指标。仅支持Unix（需要socket.send_fds）。
+
+作者: Manus AI
+版本: 1.0.0
+"""
+
+import os
+import sys
+import time
+import zlib
+import signal
+import socket
+import struct
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+from typing import Dict, Any, List, Optional
+
+import startup
+from codec import DEFAULT_CODEC, get_codec
+from ipc_server import DEFAULT_UNIX_PATH, AsyncIPCServer, bind_unix_socket
+from logging_setup import LogSampler, setup_logging
+from metrics import MetricsHTTPServer, ServerMetrics
+
+logger = logging.getLogger(__name__)
+
+# 前端为了路由最多读取的字节数，第一帧更大时不再等待，直接轮询分配
+MAX_INITIAL_BYTES = 64 * 1024
+# 等待第一帧的时间，超时的连接（例如连接后暂不发送请求的客户端）轮询分配
+ROUTE_TIMEOUT = 5.0
+# 向工作进程传递连接的超时时间（通道在事件循环上等待可写，工作进程卡住时放弃这个工作进程）
+HANDOFF_TIMEOUT = 1.0
+# 从工作进程收集指标的超时时间
+EXPORT_TIMEOUT = 1.0
+# 工作进程等待整个工作池统计的超时时间
+STATS_TIMEOUT = 2.0
+# 重启的退避时间：从最小值开始每次翻倍；存活超过STABLE_SECONDS后重置
+RESTART_BACKOFF_MIN = 0.5
+RESTART_BACKOFF_MAX = 30.0
+STABLE_SECONDS = 5.0
+# 关闭时等待工作进程退出的时间，超时后强制结束
+SHUTDOWN_TIMEOUT = 5.0
+
+# 传递连接的消息：4字节小端长度 + 前端已读取的字节，连接的文件描述符作为辅助数据
+_HANDOFF = struct.Struct('<I')
+# 第一帧中没有session_id（与显式的"session_id": null区分）
+_NO_SESSION = object()
+
+def is_supported() -> bool:
+    """当前平台是否支持工作池（需要通过Unix域套接字传递文件描述符）"""
+    return hasattr(socket, 'send_fds') and hasattr(socket, 'AF_UNIX')
+
+def worker_for(session_id, workers: int) -> int:
+    """
+    会话所属的工作进程编号，在所有进程中结果相同（不受哈希随机化影响）
+
+    与client_session_key一样按repr区分session_id，1和"1"是不同的会话，可能在不同的工作进程中
+    """
+    return zlib.crc32(repr(session_id).encode('utf-8')) % workers
+
+class PoolWorkerServer(AsyncIPCServer):
+    """
+    工作池中的工作进程
+
+    不监听端口，从通道套接字接收前端传来的连接；控制管道用于前端收集指标，
+    工作池管道用于向前端查询整个工作池的统计。
+    """
+
+    def __init__(self, index: int, workers: int, channel: socket.socket, control, pool, **kwargs):
+        """
+        Args:
+            index: 工作进程编号
+            workers: 工作进程总数
+            channel: 接收连接的SOCK_SEQPACKET套接字
+            control: 控制管道（前端 -> 工作进程）
+            pool: 工作池管道（工作进程 -> 前端），就绪后发送一次ready
+            kwargs: AsyncIPCServer的参数
+        """
+        super().__init__(**kwargs)
+        self.index = index
+        self.workers = workers
+        self.channel = channel
+        self.control = control
+        self.pool = pool
+        self.pool_requests = itertools.count(1)
+        # 请求编号 -> 等待前端回复整个工作池统计的Future
+        self.pool_replies = {}
+        # 正在处理的stats请求对应的整个工作池统计（见_handle_frame_async）
+        self.pool_stats = None
+        self.connection_tasks = set()
+
+    async def _serve(self):
+        """等待前端传来连接，直到通道关闭"""
+        if not self._initialize():
+            return
+
+        self.is_running = True
+        self.stopped = self.loop.create_future()
+        self.channel.setblocking(False)
+        threading.Thread(target=self._serve_control, daemon=True).start()
+        self.loop.add_reader(self.channel, self._receive_connection)
+        self.loop.add_reader(self.pool.fileno(), self._receive_pool_reply)
+        self.pool.send(('ready', 0))
+        logger.info(f"工作进程{self.index}已就绪（pid {os.getpid()}）")
+
+        try:
+            await self.stopped
+        finally:
+            self.loop.remove_reader(self.pool.fileno())
+            self.loop.remove_reader(self.channel)
+            self.channel.close()
+
+    def _receive_connection(self):
+        """从通道接收一个连接及前端已读取的字节"""
+        try:
+            data, fds, _, _ = socket.recv_fds(self.channel, _HANDOFF.size + MAX_INITIAL_BYTES, 1)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.error(f"接收连接失败: {e}")
+            data, fds = b'', []
+
+        if not data:
+            # 前端关闭了通道
+            for fd in fds:
+                os.close(fd)
+            logger.info(f"工作进程{self.index}的通道已关闭")
+            self.stop()
+            return
+        if not fds:
+            logger.warning("通道消息中没有连接")
+            return
+
+        sock = socket.socket(fileno=fds[0])
+        (length,) = _HANDOFF.unpack_from(data)
+        initial = data[_HANDOFF.size:_HANDOFF.size + length]
+        task = self.loop.create_task(self._serve_connection(sock, initial))
+        self.connection_tasks.add(task)
+        task.add_done_callback(self.connection_tasks.discard)
+
+    async def _serve_connection(self, sock: socket.socket, initial: bytes):
+        """在本进程的事件循环中服务前端传来的连接"""
+        sock.setblocking(False)
+        reader = asyncio.StreamReader()
+        if initial:
+            reader.feed_data(initial)
+        try:
+            transport, protocol = await self.loop.connect_accepted_socket(
+                lambda: asyncio.StreamReaderProtocol(reader), sock
+            )
+        except OSError as e:
+            logger.error(f"接管连接失败: {e}")
+            sock.close()
+            return
+        writer = asyncio.StreamWriter(transport, protocol, reader, self.loop)
+        await self._handle_connection(reader, writer)
+
+    def _serve_control(self):
+        """在后台线程中响应前端的指标收集请求"""
+        while True:
+            try:
+                command, request_id = self.control.recv()
+            except (EOFError, OSError):
+                break
+            if command == 'export':
+                state = {'index': self.index, 'pid': os.getpid(), 'metrics': self.metrics.export_state()}
+                try:
+                    self.control.send((request_id, state))
+                except OSError:
+                    break
+
+    async def _handle_frame_async(self, connection, message_data: bytes) -> bytes:
+        """stats请求先在事件循环上等待前端回复整个工作池的统计，再按普通请求处理"""
+        if b'stats' in message_data:
+            try:
+                request = connection.codec.decode(message_data)
+            except Exception:
+                request = None
+            if isinstance(request, dict) and request.get('command') == 'stats':
+                self.pool_stats = await self._query_pool_stats()
+                try:
+                    return self._handle_frame(connection, message_data)
+                finally:
+                    self.pool_stats = None
+        return self._handle_frame(connection, message_data)
+
+    def _execute_request(self, request: Dict[str, Any], connection=None) -> Dict[str, Any]:
+        """stats返回整个工作池的指标；拒绝属于其他工作进程的会话"""
+        command = request.get('command', '')
+        params = request.get('params', {})
+
+        if command == 'stats':
+            if self.pool_stats is not None:
+                return dict(self.pool_stats, success=True, worker=self.index)
+            return {"success": True, "worker": self.index, "stats": self.metrics.snapshot()}
+
+        if isinstance(params, dict) and 'session_id' in params:
+            owner = worker_for(params['session_id'], self.workers)
+            if owner != self.index:
+                return {"error": f"会话{params['session_id']}属于工作进程{owner}，"
+                                 f"当前连接在工作进程{self.index}，请为该会话使用单独的连接"}
+
+        return super()._execute_request(request, connection)
+
+    async def _query_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """向前端查询合并后的指标，超时或失败时返回None（只返回本进程的指标）"""
+        request_id = next(self.pool_requests)
+        reply = self.pool_replies[request_id] = self.loop.create_future()
+        try:
+            self.pool.send(('stats', request_id))
+            return await asyncio.wait_for(reply, STATS_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("查询工作池统计超时，只返回本进程的指标")
+        except (EOFError, OSError) as e:
+            logger.error(f"查询工作池统计失败: {e}")
+        finally:
+            self.pool_replies.pop(request_id, None)
+        return None
+
+    def _receive_pool_reply(self):
+        """前端回复了整个工作池的统计（工作池管道可读时在事件循环中调用）"""
+        try:
+            reply_id, stats = self.pool.recv()
+        except (EOFError, OSError):
+            # 前端已关闭管道，等待中的查询会超时
+            self.loop.remove_reader(self.pool.fileno())
+            return
+        reply = self.pool_replies.get(reply_id)
+        if reply is not None and not reply.done():
+            reply.set_result(stats)
+
+def _worker_main(index: int, workers: int, channel: socket.socket, control, pool, options: Dict[str, Any]):
+    """工作进程入口（spawn启动，参数都可以pickle）"""
+    setup_logging(options['log_file'], options['log_level'])
+    command_log_sampler = LogSampler(options['log_sample_every'], options['log_rate'])
+    server = PoolWorkerServer(index, workers, channel, control, pool,
+                              command_log_sampler=command_log_sampler, **options['server'])
+    # Ctrl+C会发给整个进程组，由前端按顺序关闭工作进程
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server.start()
+
+class WorkerHandle:
+    """前端中一个工作进程的状态"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        # 传递连接的通道（前端一端）、控制管道和工作池管道，工作进程退出后为None
+        self.channel = None
+        self.control = None
+        self.pool = None
+        # 同一通道同时只有一个路由任务等待可写（add_writer每个文件描述符只有一个回调）
+        self.hand_off_lock = asyncio.Lock()
+        self.started_at = 0.0
+        # 工作进程是否已初始化完成并开始接收连接
+        self.ready = False
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF_MIN
+        self.restart_at = None
+
+class WorkerPool:
+    """
+    多进程工作池前端
+
+    接受连接并按会话交给工作进程，监督并重启退出的工作进程，合并所有工作进程的指标。
+    """
+
+    def __init__(self, workers: int, host: str = "127.0.0.1", port: int = 9999,
+                 transport: str = "tcp", unix_path: str = DEFAULT_UNIX_PATH, backlog: int = 512,
+                 metrics_port: int = 0, server_options: Optional[Dict[str, Any]] = None,
+                 log_file: Optional[str] = None, log_level='INFO',
+                 log_sample_every: int = 1, log_rate: float = 10.0,
+                 ready_fd: Optional[int] = None, startup_profile: bool = False):
+        """
+        Args:
+            workers: 工作进程数量
+            host: 服务器地址
+            port: 服务器端口
+            transport: 传输方式（tcp/unix，不支持shm）
+            unix_path: Unix域套接字路径（transport为unix时使用）
+            backlog: 监听队列长度
+            metrics_port: 合并后的Prometheus指标端点的本地端口，0表示不启用
+            server_options: 每个工作进程中AsyncIPCServer的其他参数
+                （max_sessions、socket_options、rime_backend等，必须可以pickle）
+            log_file: 工作进程的日志文件路径，None表示不写文件
+            log_level: 工作进程的日志级别
+            log_sample_every: 工作进程每种命令每N次请求记录一条命令日志
+            log_rate: 工作进程每种命令每秒最多记录的命令日志条数
+            ready_fd: 所有工作进程就绪后写入就绪通知的文件描述符（见startup.notify_ready）
+            startup_profile: 就绪时是否在标准错误输出前端启动各阶段耗时
+        """
+        if workers < 1:
+            raise ValueError("工作进程数量必须大于0")
+        if transport not in ('tcp', 'unix'):
+            raise ValueError(f"工作池不支持传输方式: {transport}")
+
+        self.host = host
+        self.port = port
+        self.transport = transport
+        self.unix_path = unix_path
+        self.backlog = backlog
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.ready_fd = ready_fd
+        self.startup_profile = startup_profile
+        self.ready_notified = False
+        self.worker_options = {
+            'server': dict(server_options or {}),
+            'log_file': log_file,
+            'log_level': log_level,
+            'log_sample_every': log_sample_every,
+            'log_rate': log_rate,
+        }
+        self.handles = [WorkerHandle(index) for index in range(workers)]
+        self.context = multiprocessing.get_context('spawn')
+        # 保护工作进程的启动和退出处理
+        self.lock = threading.Lock()
+        # 同一时间只有一次指标收集使用控制管道（等待回复期间不持有self.lock）
+        self.export_lock = threading.Lock()
+        # 在监督线程之外回复工作进程的统计查询，收集指标时等待卡住的工作进程不会推迟重启
+        self.stats_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pool-stats')
+        self.round_robin = itertools.count()
+        self.export_requests = itertools.count(1)
+        self.is_running = False
+        self.loop = None
+        self.accept_task = None
+        self.supervisor = None
+        self.route_tasks = set()
+
+    def start(self) -> bool:
+        """启动工作池（阻塞直到停止）"""
+        if not is_supported():
+            logger.error("当前平台不支持工作池")
+            return False
+        try:
+            asyncio.run(self._serve())
+            return True
+        except Exception as e:
+            logger.error(f"启动工作池失败: {e}")
+            return False
+
+    def _address(self) -> str:
+        """监听地址的描述"""
+        if self.transport == 'tcp':
+            return f"{self.host}:{self.port}"
+        return f"{self.transport}:{self.unix_path}"
+
+    async def _serve(self):
+        """启动工作进程和监督线程，接受连接直到收到停止信号"""
+        self.loop = asyncio.get_running_loop()
+        if self.transport == 'unix':
+            listen_socket = bind_unix_socket(self.unix_path, self.backlog)
+        else:
+            listen_socket = socket.create_server((self.host, self.port), backlog=self.backlog)
+        listen_socket.setblocking(False)
+        startup.lap('listen')
+
+        self.is_running = True
+        for handle in self.handles:
+            self._start_worker(handle)
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self.supervisor.start()
+        if self.metrics_port:
+            self.metrics_server = MetricsHTTPServer(self, "127.0.0.1", self.metrics_port)
+            self.metrics_server.start()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.stop)
+
+        logger.info(f"工作池启动成功（{len(self.handles)}个工作进程），监听 {self._address()}")
+        self.accept_task = self.loop.create_task(self._accept_connections(listen_socket))
+        try:
+            await self.accept_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            listen_socket.close()
+            if self.transport == 'unix':
+                try:
+                    os.unlink(self.unix_path)
+                except OSError:
+                    pass
+            self._shutdown()
+
+    async def _accept_connections(self, listen_socket: socket.socket):
+        """接受连接并为每个连接启动路由任务"""
+        while self.is_running:
+            try:
+                client_socket, _ = await self.loop.sock_accept(listen_socket)
+            except OSError as e:
+                logger.error(f"接受连接失败: {e}")
+                continue
+            task = self.loop.create_task(self._route(client_socket))
+            self.route_tasks.add(task)
+            task.add_done_callback(self.route_tasks.discard)
+
+    async def _route(self, client_socket: socket.socket):
+        """读取第一帧，选出工作进程并把连接交给它"""
+        try:
+            initial = await self._read_initial(client_socket)
+            session_id = self._session_of(initial)
+            for handle in self._candidates(session_id):
+                if await self._hand_off(handle, client_socket, initial):
+                    return
+            if session_id is _NO_SESSION:
+                logger.warning("没有可用的工作进程，关闭连接")
+            else:
+                logger.warning(f"没有可用的工作进程，关闭连接（session_id={session_id!r}）")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            # 工作进程已持有连接的副本
+            client_socket.close()
+
+    async def _read_initial(self, client_socket: socket.socket) -> bytes:
+        """
+        读取连接上的第一帧
+
+        帧超过MAX_INITIAL_BYTES、超时或连接关闭时返回已读取的部分
+        """
+        data = bytearray()
+        deadline = self.loop.time() + ROUTE_TIMEOUT
+        while True:
+            needed = 4 if len(data) < 4 else 4 + int.from_bytes(data[:4], byteorder='little')
+            if len(data) >= needed or needed > MAX_INITIAL_BYTES:
+                break
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(self.loop.sock_recv(client_socket, needed - len(data)), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    def _session_of(self, initial: bytes):
+        """第一帧中请求的session_id，没有或无法解码时返回_NO_SESSION"""
+        if len(initial) < 4 or len(initial) != 4 + int.from_bytes(initial[:4], byteorder='little'):
+            return _NO_SESSION
+        try:
+            params = get_codec(DEFAULT_CODEC).decode(initial[4:]).get('params', {})
+            return params.get('session_id', _NO_SESSION) if isinstance(params, dict) else _NO_SESSION
+        except Exception:
+            return _NO_SESSION
+
+    def _candidates(self, session_id) -> List[WorkerHandle]:
+        """可以接收连接的工作进程：有会话时只有其所属的工作进程，否则从下一个开始轮询"""
+        if session_id is not _NO_SESSION:
+            handle = self.handles[worker_for(session_id, len(self.handles))]
+            return [handle] if handle.channel is not None else []
+        start = next(self.round_robin)
+        candidates = [self.handles[(start + offset) % len(self.handles)] for offset in range(len(self.handles))]
+        return [handle for handle in candidates if handle.channel is not None]
+
+    async def _hand_off(self, handle: WorkerHandle, client_socket: socket.socket, initial: bytes) -> bool:
+        """把连接和已读取的字节交给工作进程，HANDOFF_TIMEOUT内未能发送时返回False"""
+        channel = handle.channel
+        if channel is None:
+            return False
+        message = _HANDOFF.pack(len(initial)) + initial
+        try:
+            await asyncio.wait_for(self._send_hand_off(handle, channel, message, client_socket.fileno()),
+                                   HANDOFF_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"向工作进程{handle.index}传递连接超时")
+            return False
+        except (OSError, ValueError) as e:
+            # ValueError: 等待期间监督线程关闭了通道
+            logger.warning(f"向工作进程{handle.index}传递连接失败: {e}")
+            return False
+
+    async def _send_hand_off(self, handle: WorkerHandle, channel: socket.socket, message: bytes, fd: int):
+        """在非阻塞通道上发送传递连接的消息，通道已满时在事件循环上等待可写"""
+        async with handle.hand_off_lock:
+            while True:
+                try:
+                    socket.send_fds(channel, [message], [fd])
+                    return
+                except BlockingIOError:
+                    pass
+                writable = self.loop.create_future()
+                channel_fd = channel.fileno()
+                self.loop.add_writer(channel_fd, lambda: writable.done() or writable.set_result(None))
+                try:
+                    await writable
+                finally:
+                    self.loop.remove_writer(channel_fd)
+
+    def _start_worker(self, handle: WorkerHandle):
+        """启动（或重启）一个工作进程"""
+        with self.lock:
+            channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            channel.setblocking(False)
+            control, worker_control = self.context.Pipe()
+            pool, worker_pool = self.context.Pipe()
+            process = self.context.Process(
+                target=_worker_main, name=f"rime-worker-{handle.index}", daemon=True,
+                args=(handle.index, len(self.handles), worker_channel, worker_control, worker_pool,
+                      self.worker_options)
+            )
+            process.start()
+            for end in (worker_channel, worker_control, worker_pool):
+                end.close()
+
+            handle.process = process
+            handle.channel = channel
+            handle.control = control
+            handle.pool = pool
+            handle.started_at = time.monotonic()
+            handle.ready = False
+            handle.restart_at = None
+        logger.info(f"工作进程{handle.index}已启动（pid {process.pid}）")
+
+    def _close_worker(self, handle: WorkerHandle):
+        """关闭与工作进程之间的通道和管道（调用者持有锁）"""
+        for end in (handle.channel, handle.control, handle.pool):
+            if end is not None:
+                end.close()
+        handle.channel = handle.control = handle.pool = None
+
+    def _supervise(self):
+        """监督线程：重启退出的工作进程，响应工作进程的统计查询"""
+        while self.is_running:
+            waitables = {}
+            for handle in self.handles:
+                if handle.process is not None:
+                    waitables[handle.process.sentinel] = (handle, handle.process)
+                    waitables[handle.pool] = (handle, handle.process)
+
+            for ready in wait(list(waitables), timeout=RESTART_BACKOFF_MIN):
+                handle, process = waitables[ready]
+                if handle.process is not process:
+                    # 本轮中已经处理了该工作进程的退出
+                    continue
+                if ready is handle.pool:
+                    self._answer_pool_request(handle)
+                else:
+                    self._worker_exited(handle)
+
+            now = time.monotonic()
+            for handle in self.handles:
+                if self.is_running and handle.restart_at is not None and now >= handle.restart_at:
+                    try:
+                        self._start_worker(handle)
+                    except Exception as e:
+                        logger.error(f"重启工作进程{handle.index}失败: {e}")
+                        handle.restart_at = now + handle.backoff
+
+    def _worker_exited(self, handle: WorkerHandle):
+        """记录工作进程退出并安排重启"""
+        with self.lock:
+            process = handle.process
+            process.join()
+            lifetime = time.monotonic() - handle.started_at
+            self._close_worker(handle)
+            handle.process = None
+
+        if not self.is_running:
+            return
+        if lifetime > STABLE_SECONDS:
+            handle.backoff = RESTART_BACKOFF_MIN
+        delay = handle.backoff
+        handle.backoff = min(handle.backoff * 2, RESTART_BACKOFF_MAX)
+        handle.restarts += 1
+        handle.restart_at = time.monotonic() + delay
+        logger.warning(f"工作进程{handle.index}（pid {process.pid}）已退出，"
+                       f"退出码 {process.exitcode}，{delay:.1f}秒后重启")
+
+    def _answer_pool_request(self, handle: WorkerHandle):
+        """响应工作进程的就绪通知和统计查询"""
+        try:
+            command, request_id = handle.pool.recv()
+        except (EOFError, OSError):
+            # 工作进程正在退出，由其sentinel处理
+            return
+        if command == 'ready':
+            handle.ready = True
+            if not self.ready_notified and all(handle.ready for handle in self.handles):
+                self.ready_notified = True
+                self.loop.call_soon_threadsafe(self._notify_ready)
+        elif command == 'stats':
+            self.stats_executor.submit(self._send_pool_stats, handle.pool, request_id)
+
+    def _send_pool_stats(self, pool, request_id: int):
+        """收集整个工作池的统计并回复给查询的工作进程（在stats_executor中运行）"""
+        try:
+            pool.send((request_id, self.collect_stats()))
+        except OSError:
+            # 工作进程已退出
+            pass
+        except Exception as e:
+            logger.error(f"回复工作池统计失败: {e}")
+
+    def _notify_ready(self):
+        """所有工作进程第一次就绪后通知启动者，按需输出启动各阶段耗时"""
+        startup.lap('workers')
+        logger.info(f"{len(self.handles)}个工作进程均已就绪")
+        if self.startup_profile:
+            profile = startup.startup_profile()
+            profile.finish()
+            print(profile.report(), file=sys.stderr, flush=True)
+        startup.notify_ready(self.ready_fd, f"监听 {self._address()}，{len(self.handles)}个工作进程")
+
+    def collect_states(self) -> List[Dict[str, Any]]:
+        """
+        从所有运行中的工作进程收集可合并的指标（见ServerMetrics.export_state）
+
+        所有工作进程共用EXPORT_TIMEOUT的等待时间，没有及时回复的工作进程不计入。
+        等待期间不持有self.lock，监督线程可以照常重启其他工作进程。
+        """
+        with self.export_lock:
+            with self.lock:
+                workers = [(handle.control, handle.restarts) for handle in self.handles
+                           if handle.control is not None]
+
+            request_id = next(self.export_requests)
+            pending = []
+            for control, restarts in workers:
+                try:
+                    control.send(('export', request_id))
+                    pending.append((control, restarts))
+                except OSError:
+                    pass
+
+            states = []
+            deadline = time.monotonic() + EXPORT_TIMEOUT
+            for control, restarts in pending:
+                try:
+                    while control.poll(max(deadline - time.monotonic(), 0)):
+                        reply_id, state = control.recv()
+                        if reply_id == request_id:
+                            states.append(dict(state, restarts=restarts))
+                            break
+                except (EOFError, OSError):
+                    # 等待期间工作进程退出，控制管道已被关闭
+                    pass
+            return states
+
+    def collect_stats(self) -> Dict[str, Any]:
+        """合并后的指标和每个工作进程的概况（工作进程中stats命令的返回值）"""
+        states = self.collect_states()
+        workers = []
+        for state in states:
+            metrics = state['metrics']
+            workers.append({
+                'index': state['index'],
+                'pid': state['pid'],
+                'restarts': state['restarts'],
+                'requests_total': sum(data['total'] for data in metrics['latencies'].values()),
+                'connections': metrics['connections'],
+                'sessions': metrics['sessions'],
+            })
+        stats = ServerMetrics.from_states([state['metrics'] for state in states]).snapshot()
+        return {'stats': stats, 'workers': workers}
+
+    def render_prometheus(self) -> str:
+        """合并后的Prometheus文本格式指标（供MetricsHTTPServer调用）"""
+        states = self.collect_states()
+        text = ServerMetrics.from_states([state['metrics'] for state in states]).render_prometheus()
+        lines = [
+            "# TYPE unity_rime_workers gauge",
+            f"unity_rime_workers {len(states)}",
+            "# TYPE unity_rime_worker_restarts_total counter",
+            f"unity_rime_worker_restarts_total {sum(handle.restarts for handle in self.handles)}",
+        ]
+        return text + "\n".join(lines) + "\n"
+
+    def stop(self):
+        """停止接受连接（在事件循环线程中调用，工作进程在_serve退出时关闭）"""
+        logger.info("正在关闭工作池...")
+        self.is_running = False
+        if self.accept_task:
+            self.accept_task.cancel()
+
+    def _shutdown(self):
+        """关闭通道让工作进程自行退出，超时后强制结束"""
+        self.is_running = False
+        if self.supervisor:
+            self.supervisor.join()
+        self.stats_executor.shutdown(wait=False, cancel_futures=True)
+        if self.metrics_server:
+            self.metrics_server.stop()
+
+        with self.lock:
+            processes = [handle.process for handle in self.handles if handle.process is not None]
+            for handle in self.handles:
+                self._close_worker(handle)
+                handle.process = None
+
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for process in processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"工作进程（pid {process.pid}）未能及时退出，强制结束")
+                process.terminate()
+                process.join()
+        logger.info("工作池已停止")
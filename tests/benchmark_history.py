@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Unity Rime输入法集成 - 基准测试历史记录与回归检测
+
+作者: Manus AI
+版本: 1.0.0
+
+每次基准测试的结果连同运行环境和原始延迟样本追加到JSON Lines历史文件中，
+compare_runs用Mann-Whitney U检验比较两次运行的延迟样本，找出显著变慢的指标
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import platform
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+HISTORY_FILE = os.path.join(os.path.dirname(__file__), 'benchmark_history.jsonl')
+
+# 每个指标保存的最大样本数，超过时随机抽样（开环负载测试每一级可能有数万个样本）
+MAX_SAMPLES = 5000
+
+def environment_info(settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    收集运行环境信息
+
+    Args:
+        settings: 基准测试本身的配置（编解码器、传输方式、套接字选项等）
+    """
+    info = {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python_version': platform.python_version(),
+        'python_implementation': platform.python_implementation(),
+        'git_commit': _git_commit(),
+    }
+    if settings:
+        info.update(settings)
+    return info
+
+def _git_commit() -> Optional[str]:
+    """当前代码的git提交，不在git仓库中时返回None"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=5, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+def split_samples(results: Dict[str, Any], prefix: str = "") -> Tuple[Dict[str, Any], Dict[str, List[float]]]:
+    """
+    从结果中取出原始样本
+
+    结果中任意层级的 'samples' 列表被移出，按所在路径（例如 python_latency、
+    open_loop.steps.2）归入样本表，其余部分原样保留。
+
+    Returns:
+        (去掉样本的结果, 路径 -> 样本列表)
+    """
+    samples = {}
+
+    def walk(value, path):
+        if isinstance(value, dict):
+            stripped = {}
+            for key, item in value.items():
+                if key == 'samples' and isinstance(item, list):
+                    samples[path] = _limit_samples(item)
+                else:
+                    stripped[key] = walk(item, f"{path}.{key}" if path else str(key))
+            return stripped
+        if isinstance(value, list):
+            return [walk(item, f"{path}.{index}") for index, item in enumerate(value)]
+        return value
+
+    return walk(results, prefix), samples
+
+def _limit_samples(values: List[float]) -> List[float]:
+    """样本过多时做可复现的随机抽样"""
+    if len(values) <= MAX_SAMPLES:
+        return list(values)
+    return random.Random(0).sample(values, MAX_SAMPLES)
+
+def append_run(results: Dict[str, Any], samples: Dict[str, List[float]], environment: Dict[str, Any],
+               label: str = "", path: str = HISTORY_FILE) -> Dict[str, Any]:
+    """
+    把一次运行追加到历史文件
+
+    Returns:
+        写入的记录
+    """
+    runs = load_runs(path)
+    record = {
+        'run_id': (runs[-1]['run_id'] + 1) if runs else 1,
+        'timestamp': time.time(),
+        'datetime': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'label': label,
+        'environment': environment,
+        'results': results,
+        'samples': samples,
+    }
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
+
+def load_runs(path: str = HISTORY_FILE) -> List[Dict[str, Any]]:
+    """读取所有历史记录，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                runs.append(json.loads(line))
+    return runs
+
+def find_run(runs: List[Dict[str, Any]], selector: str) -> Optional[Dict[str, Any]]:
+    """
+    按选择器查找记录
+
+    Args:
+        selector: run_id、"latest"（最后一次）、"previous"（倒数第二次）或标签
+    """
+    if not runs:
+        return None
+    if selector == "latest":
+        return runs[-1]
+    if selector == "previous":
+        return runs[-2] if len(runs) > 1 else None
+    if selector.isdigit():
+        return next((run for run in runs if run['run_id'] == int(selector)), None)
+    # 同名标签取最近一次
+    return next((run for run in reversed(runs) if run.get('label') == selector), None)
+
+def mann_whitney_u(baseline: List[float], candidate: List[float]) -> Tuple[float, float]:
+    """
+    单侧Mann-Whitney U检验（备择假设：candidate的分布整体大于baseline）
+
+    使用带结校正和连续性校正的正态近似，适用于每组几十个以上的样本。
+
+    Returns:
+        (candidate的U统计量, p值)
+    """
+    n1, n2 = len(candidate), len(baseline)
+    if n1 == 0 or n2 == 0:
+        return 0.0, 1.0
+
+    combined = sorted([(value, 0) for value in candidate] + [(value, 1) for value in baseline])
+    n = n1 + n2
+    candidate_rank_sum = 0.0
+    tie_term = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        # 并列值取平均秩（秩从1开始）
+        rank = (i + j) / 2 + 1
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        candidate_rank_sum += rank * sum(1 for k in range(i, j + 1) if combined[k][1] == 0)
+        i = j + 1
+
+    u = candidate_rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))) if n > 1 else 0.0
+    if variance <= 0:
+        return u, 1.0
+
+    z = (u - mean - 0.5) / math.sqrt(variance)
+    return u, 0.5 * math.erfc(z / math.sqrt(2))
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+def compare_runs(baseline: Dict[str, Any], candidate: Dict[str, Any], alpha: float = 0.01,
+                 min_change: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    比较两次运行中共有指标的延迟样本
+
+    某个指标在统计上显著变慢（p < alpha）且中位数至少增加min_change（相对值）时
+    判为回归。只看p值时，样本量大的测试会把微小的差异也报成显著。
+
+    Args:
+        baseline: 基线记录
+        candidate: 待检查的记录
+        alpha: 显著性水平
+        min_change: 中位数的最小相对增幅
+
+    Returns:
+        每个指标的比较结果（按指标名排序）
+    """
+    comparisons = []
+    baseline_samples = baseline.get('samples', {})
+    candidate_samples = candidate.get('samples', {})
+
+    for metric in sorted(set(baseline_samples) & set(candidate_samples)):
+        before = baseline_samples[metric]
+        after = candidate_samples[metric]
+        if not before or not after:
+            continue
+
+        u, p_value = mann_whitney_u(before, after)
+        before_median = _median(before)
+        after_median = _median(after)
+        change = (after_median - before_median) / before_median if before_median > 0 else 0.0
+        comparisons.append({
+            'metric': metric,
+            'baseline_median': before_median,
+            'candidate_median': after_median,
+            'change': change,
+            # candidate中随机取一个样本大于baseline中随机取一个样本的概率，0.5表示无差别
+            'probability_slower': u / (len(before) * len(after)),
+            'p_value': p_value,
+            'regression': p_value < alpha and change >= min_change,
+        })
+
+    return comparisons
+
+def environment_differences(baseline: Dict[str, Any], candidate: Dict[str, Any]) -> Dict[str, Tuple[Any, Any]]:
+    """两次运行环境中不同的字段（git_commit除外）"""
+    before = baseline.get('environment', {})
+    after = candidate.get('environment', {})
+    return {
+        key: (before.get(key), after.get(key))
+        for key in sorted(set(before) | set(after))
+        if key != 'git_commit' and before.get(key) != after.get(key)
+    }
+
+def print_runs(runs: List[Dict[str, Any]], file=sys.stdout):
+    """列出历史记录"""
+    for run in runs:
+        environment = run.get('environment', {})
+        print(f"#{run['run_id']:<4} {run['datetime']}  {environment.get('git_commit') or '-':<10} "
+              f"Python {environment.get('python_version', '?'):<8} {environment.get('hostname', '?')}"
+              f"  {run.get('label', '')}", file=file)
+
+def print_comparison(baseline: Dict[str, Any], candidate: Dict[str, Any],
+                     comparisons: List[Dict[str, Any]], file=sys.stdout):
+    """打印比较结果"""
+    print(f"基线 #{baseline['run_id']} ({baseline['datetime']}) -> "
+          f"候选 #{candidate['run_id']} ({candidate['datetime']})", file=file)
+
+    differences = environment_differences(baseline, candidate)
+    if differences:
+        print("⚠️  运行环境不同，结果可能不可比:", file=file)
+        for key, (before, after) in differences.items():
+            print(f"  {key}: {before} -> {after}", file=file)
+
+    if not comparisons:
+        print("没有可比较的样本", file=file)
+        return
+
+    print(f"{'指标':<36} {'基线中位数':>12} {'候选中位数':>12} {'变化':>8} {'p值':>10}", file=file)
+    for item in comparisons:
+        mark = "  ❌ 回归" if item['regression'] else ""
+        print(f"{item['metric']:<36} {item['baseline_median']:>10.3f}ms {item['candidate_median']:>10.3f}ms "
+              f"{item['change']:>+7.1%} {item['p_value']:>10.2g}{mark}", file=file)
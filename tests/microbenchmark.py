@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+Unity Rime输入法集成 - 进程内微基准测试
+
+作者: Manus AI
+版本: 1.0.0
+
+这个脚本直接调用RimeWrapper的方法，不经过IPC服务器，
+用于在没有套接字噪声的情况下验证热点路径的优化效果
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import tempfile
+import logging
+import argparse
+import statistics
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Any, List, Sequence
+
+# 添加项目路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'python_component'))
+
+from rime_dict import COMPILED_SUFFIX, PrefixTrie
+from rime_wrapper import RimeWrapper
+
+BACKSPACE_KEY = 65288
+
+# 生成合成词典用的常见拼音音节
+SYLLABLES = (
+    "a", "ai", "an", "ba", "bai", "ban", "bao", "bei", "ben", "bi", "bian", "bu", "cai", "chang", "chen",
+    "cheng", "chu", "da", "dai", "dang", "de", "deng", "di", "dian", "dong", "du", "duo", "er", "fa",
+    "fang", "fen", "feng", "gao", "ge", "gong", "guo", "hai", "han", "hao", "he", "hen", "hua", "huan",
+    "hui", "ji", "jia", "jian", "jiang", "jie", "jin", "jing", "ju", "kai", "kan", "ke", "lai", "li",
+    "lian", "liang", "lu", "ma", "mei", "men", "mian", "ming", "na", "nan", "neng", "ni", "nian", "qi",
+    "qian", "qing", "qu", "ren", "ri", "shang", "shao", "shen", "sheng", "shi", "shou", "shu", "shui",
+    "ta", "tian", "tong", "wai", "wan", "wei", "wen", "wo", "xi", "xia", "xian", "xiang", "xiao", "xin",
+    "xing", "yang", "ye", "yi", "yin", "you", "yu", "yuan", "zai", "zhe", "zheng", "zhi", "zhong", "zi"
+)
+
+@dataclass
+class CandidateWord:
+    """候选词数据结构（优化前的状态构建方式，作为状态序列化的对照）"""
+    text: str
+    comment: str = ""
+    index: int = 0
+
+@dataclass
+class InputState:
+    """输入状态数据结构（优化前的状态构建方式，作为状态序列化的对照）"""
+    composition: str = ""  # 当前输入的拼音
+    candidates: List[CandidateWord] = None
+    page_size: int = 5
+    page_no: int = 0
+    is_last_page: bool = True
+
+    def __post_init__(self):
+        if self.candidates is None:
+            self.candidates = []
+
+def build_input_state(context: Dict) -> InputState:
+    """
+    从Rime上下文构建InputState（优化前RimeWrapper._build_input_state的实现）
+
+    为所有候选词创建CandidateWord对象，之后需要asdict才能序列化
+    """
+    composition = ""
+    candidates = []
+    page_size = 5
+    page_no = 0
+    is_last_page = True
+
+    if context:
+        # 获取当前输入的拼音
+        if 'composition' in context and context['composition']:
+            composition = context['composition'].get('preedit', '')
+
+        # 获取候选词列表
+        if 'menu' in context and context['menu']:
+            menu = context['menu']
+            if 'candidates' in menu:
+                for i, candidate in enumerate(menu['candidates']):
+                    if isinstance(candidate, dict):
+                        candidates.append(CandidateWord(
+                            text=candidate.get('text', ''),
+                            comment=candidate.get('comment', ''),
+                            index=i
+                        ))
+                    else:
+                        # 处理简单字符串格式的候选词
+                        candidates.append(CandidateWord(
+                            text=str(candidate),
+                            comment='',
+                            index=i
+                        ))
+
+            page_size = menu.get('page_size', 5)
+            page_no = menu.get('page_no', 0)
+            is_last_page = menu.get('is_last_page', True)
+
+    return InputState(
+        composition=composition,
+        candidates=candidates,
+        page_size=page_size,
+        page_no=page_no,
+        is_last_page=is_last_page
+    )
+
+def write_synthetic_dict(path: str, entries: int, seed: int = 0):
+    """
+    写一个合成的Rime词典（*.dict.yaml）
+
+    每个词条是1~4个随机音节和同样数量的随机汉字，权重随机，
+    用于在没有rime-data的机器上测试大词典的构建和查询开销。
+    """
+    rng = random.Random(seed)
+    name = os.path.basename(path).split('.')[0]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"---\nname: {name}\nversion: \"1.0\"\nsort: by_weight\n...\n\n")
+        for _ in range(entries):
+            length = rng.choice((1, 2, 2, 2, 3, 4))
+            code = " ".join(rng.choice(SYLLABLES) for _ in range(length))
+            text = "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(length))
+            f.write(f"{text}\t{code}\t{rng.randint(1, 100000)}\n")
+
+class MicroBenchmark:
+    """进程内微基准测试器"""
+
+    def __init__(self, iterations: int = 500, repeat: int = 5, warmup: int = 50, track_allocations: bool = True):
+        """
+        Args:
+            iterations: 每轮调用次数
+            repeat: 测量轮数（取中位数）
+            warmup: 预热调用次数
+            track_allocations: 是否用tracemalloc统计每次调用的内存分配
+        """
+        self.iterations = iterations
+        self.repeat = repeat
+        self.warmup = warmup
+        self.track_allocations = track_allocations
+
+        # 微基准只关心耗时，屏蔽包装器的日志输出
+        logging.getLogger().setLevel(logging.WARNING)
+        # 使用模拟引擎，候选词数量和输入长度可以通过模拟词典控制
+        self.rime = RimeWrapper(backend='mock')
+
+    def log(self, message: str):
+        """记录日志"""
+        timestamp = time.strftime("%H:%M:%S")
+        print(f"[{timestamp}] {message}")
+
+    def measure(self, func: Callable[[], Any]) -> Dict[str, float]:
+        """
+        测量单次调用的耗时和内存分配
+
+        先预热，再测量repeat轮、每轮iterations次调用（time.perf_counter_ns），
+        计时结束后在tracemalloc下再调用iterations次统计内存（tracemalloc本身会拖慢调用，
+        不与计时混在一起）。
+
+        Returns:
+            每次调用的纳秒数（各轮中位数、最小值）、每秒操作数，
+            以及每次调用的峰值分配字节数和留存字节数
+        """
+        for _ in range(self.warmup):
+            func()
+
+        per_call = []
+        for _ in range(self.repeat):
+            start = time.perf_counter_ns()
+            for _ in range(self.iterations):
+                func()
+            per_call.append((time.perf_counter_ns() - start) / self.iterations)
+
+        median = statistics.median(per_call)
+        result = {
+            'ns_per_call': median,
+            'min_ns_per_call': min(per_call),
+            'ops_per_sec': 1e9 / median if median > 0 else 0
+        }
+        if self.track_allocations:
+            result.update(self.measure_allocations(func))
+        return result
+
+    def measure_allocations(self, func: Callable[[], Any]) -> Dict[str, float]:
+        """
+        用tracemalloc统计每次调用分配的内存
+
+        Returns:
+            alloc_bytes_per_call: 单次调用期间已分配内存的峰值增量（临时对象）的平均值
+            retained_bytes_per_call: 所有调用结束后仍未释放的内存除以调用次数（持续增长说明有缓存或泄漏）
+        """
+        tracemalloc.start()
+        try:
+            # 先调用一次，让调用间保持的状态（例如引擎的候选词列表）换成被跟踪的对象，
+            # 否则它们会被计入留存
+            func()
+            baseline = tracemalloc.get_traced_memory()[0]
+            peak_total = 0
+            for _ in range(self.iterations):
+                # reset_peak需要Python 3.9+
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                func()
+                peak_total += tracemalloc.get_traced_memory()[1] - before
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'alloc_bytes_per_call': peak_total / self.iterations,
+            'retained_bytes_per_call': max(retained, 0) / self.iterations
+        }
+
+    @staticmethod
+    def make_context(candidate_count: int, composition: str = "nihao") -> Dict[str, Any]:
+        """构造一个带有指定数量候选词的Rime上下文"""
+        return {
+            'composition': {'preedit': composition},
+            'menu': {
+                'candidates': [
+                    {'text': f"候选{i}", 'comment': f"拼音: {composition}", 'index': i}
+                    for i in range(candidate_count)
+                ],
+                'page_size': 5,
+                'page_no': 0,
+                'is_last_page': True
+            }
+        }
+
+    @staticmethod
+    def make_composition(length: int) -> str:
+        """构造指定长度的输入（小写字母）"""
+        return "".join(chr(ord('a') + i % 26) for i in range(length))
+
+    def new_session(self, composition: str, candidate_count: int) -> int:
+        """
+        创建一个会话，让模拟引擎对composition及其所有前缀都返回candidate_count个候选词，
+        并输入composition
+
+        Returns:
+            会话ID
+        """
+        session_id = self.rime.create_session()
+        engine = self.rime.pyrime.sessions[session_id]
+        words = [f"候选{i}" for i in range(candidate_count)]
+        engine.set_dictionary(PrefixTrie.from_mapping(
+            {composition[:end]: words for end in range(1, len(composition) + 1)}, max(candidate_count, 1)))
+        for char in composition:
+            self.rime.process_key(ord(char), session_id)
+        return session_id
+
+    def print_result(self, label: str, result: Dict[str, float]):
+        """打印一项测试结果"""
+        line = (f"{label:<28} {result['ns_per_call'] / 1000:9.2f} µs  "
+                f"{result['ops_per_sec']:>11,.0f} ops/s")
+        if 'alloc_bytes_per_call' in result:
+            line += (f"  分配 {result['alloc_bytes_per_call']:>9,.0f} B/次"
+                     f"  留存 {result['retained_bytes_per_call']:>7,.1f} B/次")
+        self.log(line)
+
+    def benchmark_state_serialization(self, candidate_counts: Sequence[int] = (5, 50, 500)) -> Dict[str, Any]:
+        """
+        对比数据类+asdict路径与直接构建字典路径（均包含json编码）
+
+        数据类路径构建所有候选词；直接构建路径在候选词多于一页时只构建第一页
+        """
+        results = {}
+
+        for count in candidate_counts:
+            context = self.make_context(count)
+
+            legacy = self.measure(lambda: json.dumps(
+                asdict(build_input_state(context)), ensure_ascii=False))
+            direct = self.measure(lambda: json.dumps(
+                self.rime._build_state_dict(context), ensure_ascii=False))
+
+            speedup = legacy['ns_per_call'] / direct['ns_per_call'] if direct['ns_per_call'] else 0
+            results[str(count)] = {'dataclass_asdict': legacy, 'direct_dict': direct, 'speedup': speedup}
+
+            self.log(f"候选词 {count:>4}: asdict {legacy['ns_per_call'] / 1000:8.2f} µs, "
+                     f"直接构建 {direct['ns_per_call'] / 1000:8.2f} µs, 加速比 {speedup:.2f}x")
+
+        return results
+
+    def benchmark_process_key(self, candidate_counts: Sequence[int], lengths: Sequence[int]) -> Dict[str, Any]:
+        """
+        RimeWrapper.process_key
+
+        每次调用输入最后一个字母再退格（两次process_key，结果按单次按键折算），
+        引擎输入字母时在前缀树上前进一步并取出候选词，退格时取回上一帧的候选词，
+        包装器每次都要构建状态并记录版本。
+        """
+        results = {}
+
+        for length in lengths:
+            composition = self.make_composition(length)
+            for count in candidate_counts:
+                session_id = self.new_session(composition, count)
+                last_key = ord(composition[-1])
+
+                def type_and_delete():
+                    self.rime.process_key(BACKSPACE_KEY, session_id)
+                    self.rime.process_key(last_key, session_id)
+
+                result = self._per_call(self.measure(type_and_delete), 2)
+                self.rime.destroy_session(session_id)
+
+                results[f"len{length}_cand{count}"] = result
+                self.print_result(f"长度 {length:>2}, 候选词 {count:>4}", result)
+
+        return results
+
+    def benchmark_get_state(self, candidate_counts: Sequence[int]) -> Dict[str, Any]:
+        """RimeWrapper.get_current_state：状态未变化时命中缓存，状态变化后重新构建"""
+        results = {}
+
+        for count in candidate_counts:
+            session_id = self.new_session("nihao", count)
+
+            cached = self.measure(lambda: self.rime.get_current_state(session_id))
+
+            def rebuild():
+                self.rime._mark_dirty(session_id)
+                self.rime.get_current_state(session_id)
+
+            rebuilt = self.measure(rebuild)
+            self.rime.destroy_session(session_id)
+
+            results[str(count)] = {'cached': cached, 'rebuild': rebuilt}
+            self.print_result(f"候选词 {count:>4} 缓存命中", cached)
+            self.print_result(f"候选词 {count:>4} 重新构建", rebuilt)
+
+        return results
+
+    def benchmark_select_candidate(self, candidate_counts: Sequence[int]) -> Dict[str, Any]:
+        """RimeWrapper.select_candidate（每次调用先输入一个字母再选词，结果为两次调用之和）"""
+        results = {}
+
+        for count in candidate_counts:
+            session_id = self.new_session("a", count)
+            self.rime.clear_composition(session_id)
+
+            def type_and_select():
+                self.rime.process_key(ord('a'), session_id)
+                self.rime.select_candidate(0, session_id)
+
+            result = self.measure(type_and_select)
+            self.rime.destroy_session(session_id)
+
+            results[str(count)] = result
+            self.print_result(f"候选词 {count:>4} 键入+选词", result)
+
+        return results
+
+    def benchmark_paging(self, candidate_counts: Sequence[int]) -> Dict[str, Any]:
+        """RimeWrapper.get_page：在第0页和第1页之间来回翻页（包装器分页）"""
+        results = {}
+
+        for count in candidate_counts:
+            if count <= 5:
+                continue
+            session_id = self.new_session("nihao", count)
+
+            def flip():
+                self.rime.get_page(1, session_id)
+                self.rime.get_page(0, session_id)
+
+            result = self._per_call(self.measure(flip), 2)
+            self.rime.destroy_session(session_id)
+
+            results[str(count)] = result
+            self.print_result(f"候选词 {count:>4} 翻页", result)
+
+        return results
+
+    def benchmark_mock_engine(self, candidate_counts: Sequence[int], lengths: Sequence[int]) -> Dict[str, Any]:
+        """只调用模拟引擎（process_key + get_context），作为包装器开销的对照"""
+        results = {}
+        engine = self.rime.pyrime
+
+        for length in lengths:
+            composition = self.make_composition(length)
+            for count in candidate_counts:
+                session_id = self.new_session(composition, count)
+                last_key = ord(composition[-1])
+
+                def type_and_delete():
+                    engine.process_key(session_id, BACKSPACE_KEY)
+                    engine.get_context(session_id)
+                    engine.process_key(session_id, last_key)
+                    engine.get_context(session_id)
+
+                result = self._per_call(self.measure(type_and_delete), 2)
+                self.rime.destroy_session(session_id)
+
+                results[f"len{length}_cand{count}"] = result
+                self.print_result(f"长度 {length:>2}, 候选词 {count:>4}", result)
+
+        return results
+
+    def benchmark_dictionary(self, sizes: Sequence[int]) -> Dict[str, Any]:
+        """
+        离线词典（rime_dict.PrefixTrie）：从合成词典构建和打开编译后词典（mmap）的耗时和内存，
+        以及两种词典上不同长度编码前缀的查询耗时和逐字输入一个词的耗时
+        """
+        results = {}
+
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "synthetic.dict.yaml")
+                write_synthetic_dict(path, size)
+
+                start = time.perf_counter()
+                trie = PrefixTrie.from_dict_yaml([path])
+                load_seconds = time.perf_counter() - start
+
+                compiled_path = os.path.join(directory, "synthetic" + COMPILED_SUFFIX)
+                start = time.perf_counter()
+                trie.save(compiled_path)
+                save_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                compiled = PrefixTrie.from_compiled(compiled_path)
+                open_seconds = time.perf_counter() - start
+
+                result = {
+                    'entries': len(trie),
+                    'nodes': trie.node_count,
+                    'load_seconds': load_seconds,
+                    'save_seconds': save_seconds,
+                    'open_seconds': open_seconds,
+                    'memory_bytes': trie.nbytes,
+                    'file_bytes': os.path.getsize(compiled_path)
+                }
+                self.log(f"词条 {size:>8,}: 构建 {load_seconds:6.2f} s, {trie.node_count:,} 个节点, "
+                         f"{trie.nbytes / 1024 / 1024:6.1f} MB; 编译 {save_seconds:5.2f} s, "
+                         f"mmap打开 {open_seconds * 1000:6.2f} ms")
+
+                for kind, dictionary in (("yaml", trie), ("compiled", compiled)):
+                    for prefix in ("s", "shi", "zhong", "zhongguo", "xiangxiang"):
+                        lookup = self.measure(lambda: dictionary.lookup(prefix))
+                        result[f"{kind}_lookup_{prefix}"] = lookup
+                        self.print_result(f"  {kind} 查询 {prefix!r}", lookup)
+
+                    session_id = self.rime.create_session()
+                    self.rime.pyrime.sessions[session_id].set_dictionary(dictionary)
+
+                    def type_word():
+                        for char in "zhongguo":
+                            self.rime.process_key(ord(char), session_id)
+                        self.rime.clear_composition(session_id)
+
+                    typing = self._per_call(self.measure(type_word), len("zhongguo"))
+                    self.rime.destroy_session(session_id)
+                    result[f"{kind}_process_key"] = typing
+                    self.print_result(f"  {kind} 逐字输入 zhongguo（每键）", typing)
+
+                compiled.close()
+
+            results[str(size)] = result
+
+        return results
+
+    @staticmethod
+    def _per_call(result: Dict[str, float], calls: int) -> Dict[str, float]:
+        """把一次测量中包含calls次调用的结果折算为单次调用"""
+        scaled = dict(result)
+        for key in ('ns_per_call', 'min_ns_per_call', 'alloc_bytes_per_call', 'retained_bytes_per_call'):
+            if key in scaled:
+                scaled[key] /= calls
+        scaled['ops_per_sec'] = result['ops_per_sec'] * calls
+        return scaled
+
+    def run(self, candidate_counts: Sequence[int] = (5, 50, 500), lengths: Sequence[int] = (1, 5, 12),
+            dict_sizes: Sequence[int] = ()) -> Dict[str, Any]:
+        """
+        运行全部微基准测试
+
+        Args:
+            candidate_counts: 引擎返回的候选词数量
+            lengths: 输入（拼音）长度
+            dict_sizes: 离线词典测试的合成词典词条数，为空时跳过
+        """
+        print("Unity Rime输入法集成 - 进程内微基准测试")
+        print("=" * 60)
+        self.log(f"每轮 {self.iterations} 次调用，{self.repeat} 轮取中位数，预热 {self.warmup} 次"
+                 f"{'，tracemalloc统计内存分配' if self.track_allocations else ''}")
+
+        results = {}
+
+        print("\n📊 状态序列化 (build_input_state + asdict vs _build_state_dict)")
+        print("-" * 40)
+        results['state_serialization'] = self.benchmark_state_serialization(candidate_counts)
+
+        print("\n📊 process_key（每次按键）")
+        print("-" * 40)
+        results['process_key'] = self.benchmark_process_key(candidate_counts, lengths)
+
+        print("\n📊 模拟引擎（process_key + get_context，不经过包装器）")
+        print("-" * 40)
+        results['mock_engine'] = self.benchmark_mock_engine(candidate_counts, lengths)
+
+        print("\n📊 get_current_state")
+        print("-" * 40)
+        results['get_state'] = self.benchmark_get_state(candidate_counts)
+
+        print("\n📊 select_candidate")
+        print("-" * 40)
+        results['select_candidate'] = self.benchmark_select_candidate(candidate_counts)
+
+        print("\n📊 get_page（包装器分页）")
+        print("-" * 40)
+        results['paging'] = self.benchmark_paging(candidate_counts)
+
+        if dict_sizes:
+            print("\n📊 离线词典（合成 *.dict.yaml）")
+            print("-" * 40)
+            results['dictionary'] = self.benchmark_dictionary(dict_sizes)
+
+        print("\n✅ 微基准测试完成")
+        return results
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Unity Rime输入法集成 - 进程内微基准测试")
+    parser.add_argument("--iterations", type=int, default=500, help="每轮调用次数")
+    parser.add_argument("--repeat", type=int, default=5, help="测量轮数（取中位数）")
+    parser.add_argument("--warmup", type=int, default=50, help="预热调用次数")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[5, 50, 500], help="候选词数量")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1, 5, 12], help="输入长度")
+    parser.add_argument("--dict-size", type=int, nargs="+", default=[],
+                        help="离线词典测试的合成词典词条数，例如 100000 1000000")
+    parser.add_argument("--no-alloc", action="store_true", help="不统计内存分配（更快）")
+    parser.add_argument("--output", help="把结果保存为JSON文件")
+    args = parser.parse_args()
+
+    benchmark = MicroBenchmark(args.iterations, args.repeat, args.warmup, not args.no_alloc)
+    results = benchmark.run(args.candidates, args.lengths, args.dict_size)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n📄 测试结果已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -12,14 +12,95 @@ import sys
 import os
 import time
 import json
+import ctypes
+import random
 import socket
+import asyncio
+import argparse
 import subprocess
 import statistics
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Dict, Any
 
 # 添加项目路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'python_component'))
 
+from framing import HEADER, SocketOptions, encode_frame, recv_frame, send_frame
+from startup import start_server
+import benchmark_history
+
+# 输入处理测试的按键序列（"nihao"）和选择第一个候选词后上屏的文字
+INPUT_SEQUENCE = [110, 105, 104, 97, 111]
+INPUT_EXPECTED_TEXT = "你好"
+
+# 负载测试中模拟输入的拼音（模拟词典中都有候选词）
+LOAD_WORDS = ["nihao", "zhongguo", "yi", "ni", "hao", "shijie"]
+
+def keystroke_requests(rng: random.Random) -> Iterator[Dict[str, Any]]:
+    """
+    生成模拟玩家输入的请求序列
+    
+    逐字母输入一个拼音（每次按键后有10%的概率查询状态），
+    之后90%选择第一个候选词，10%清空输入。
+    """
+    while True:
+        for char in rng.choice(LOAD_WORDS):
+            yield {"command": "process_key", "params": {"key_code": ord(char)}}
+            if rng.random() < 0.1:
+                yield {"command": "get_state", "params": {}}
+        if rng.random() < 0.9:
+            yield {"command": "select_candidate", "params": {"index": 0}}
+        else:
+            yield {"command": "clear_composition", "params": {}}
+
+def percentile(sorted_values: List[float], quantile: float) -> float:
+    """已排序数据的分位数（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(quantile * len(sorted_values)), len(sorted_values) - 1)]
+
+def _closed_loop_generator(host: str, port: int, connections: int, window: int,
+                           duration: float, seed: int):
+    """
+    负载生成进程：每个连接流水线保持window个未完成的按键请求，持续duration秒
+    
+    Returns:
+        (完成的请求数, 实际测量时间)
+    """
+    async def run():
+        streams = await asyncio.gather(*[asyncio.open_connection(host, port) for _ in range(connections)])
+        
+        # 预热：每个连接先完成一次请求，连接交给工作进程和创建会话的时间不计入测量
+        for reader, writer in streams:
+            writer.write(encode_frame(json.dumps({"command": "ping", "params": {}}).encode('utf-8')))
+        for reader, writer in streams:
+            await reader.readexactly(HEADER.unpack(await reader.readexactly(HEADER.size))[0])
+        
+        completed = 0
+        start = time.perf_counter()
+        end = start + duration
+        
+        async def client(index: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            nonlocal completed
+            requests = keystroke_requests(random.Random(seed * 100003 + index))
+            in_flight = 0
+            while in_flight < window:
+                writer.write(encode_frame(json.dumps(next(requests)).encode('utf-8')))
+                in_flight += 1
+            while in_flight:
+                await reader.readexactly(HEADER.unpack(await reader.readexactly(HEADER.size))[0])
+                in_flight -= 1
+                completed += 1
+                if time.perf_counter() < end:
+                    writer.write(encode_frame(json.dumps(next(requests)).encode('utf-8')))
+                    in_flight += 1
+            writer.close()
+        
+        await asyncio.gather(*[client(index, reader, writer) for index, (reader, writer) in enumerate(streams)])
+        return completed, time.perf_counter() - start
+    
+    return asyncio.run(run())
+
 class PerformanceBenchmark:
     """性能基准测试器"""
     
@@ -27,6 +108,13 @@ class PerformanceBenchmark:
         self.server_process = None
         self.server_host = "127.0.0.1"
         self.server_port = 9999
+        # 负载测试使用单独启动的asyncio服务器
+        self.load_server_port = 9998
+        # 负载生成器是否忙等到计划发送时间（需要空闲的CPU核，否则会与服务器争抢）
+        self.precise_timing = False
+        # 历史记录文件和本次运行的标签
+        self.history_file = benchmark_history.HISTORY_FILE
+        self.label = ""
         
     def log(self, message: str):
         """记录日志"""
@@ -40,12 +128,12 @@ class PerformanceBenchmark:
             if not os.path.exists(server_script):
                 return False
             
-            self.server_process = subprocess.Popen([
+            self.server_process, ready = start_server([
                 sys.executable, server_script
             ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            time.sleep(2)
-            return self.server_process.poll() is None
+            if not ready:
+                self.stop_python_server()
+            return ready
             
         except Exception:
             return False
@@ -59,15 +147,29 @@ class PerformanceBenchmark:
             except subprocess.TimeoutExpired:
                 self.server_process.kill()
     
-    def benchmark_python_latency(self, iterations: int = 1000) -> Dict[str, float]:
-        """测试Python模式延迟"""
-        self.log(f"测试Python模式延迟 ({iterations} 次迭代)...")
+    def benchmark_python_latency(self, iterations: int = 1000, socket_mode: str = "tuned") -> Dict[str, float]:
+        """
+        测试Python模式延迟
+        
+        Args:
+            iterations: 请求次数
+            socket_mode: tuned（TCP_NODELAY + 长度头和消息体一次写出）或
+                         legacy（保留Nagle算法，长度头和消息体分两次send，即优化前的客户端行为）
+        """
+        self.log(f"测试Python模式延迟 ({iterations} 次迭代, {socket_mode})...")
         
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(30)
             sock.connect((self.server_host, self.server_port))
             
+            if socket_mode == "legacy":
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+                send = self._send_request_split
+            else:
+                SocketOptions().apply(sock)
+                send = self._send_request
+            
             latencies = []
             
             for i in range(iterations):
@@ -75,7 +177,7 @@ class PerformanceBenchmark:
                 
                 # 发送ping请求
                 request = {"command": "ping", "params": {}}
-                self._send_request(sock, request)
+                send(sock, request)
                 self._receive_response(sock)
                 
                 end_time = time.perf_counter()
@@ -87,18 +189,26 @@ class PerformanceBenchmark:
             
             sock.close()
             
+            latencies.sort()
             return {
-                'min': min(latencies),
-                'max': max(latencies),
+                'min': latencies[0],
+                'max': latencies[-1],
                 'mean': statistics.mean(latencies),
                 'median': statistics.median(latencies),
-                'stdev': statistics.stdev(latencies) if len(latencies) > 1 else 0
+                'p95': latencies[int(len(latencies) * 0.95)],
+                'p99': latencies[int(len(latencies) * 0.99)],
+                'stdev': statistics.stdev(latencies) if len(latencies) > 1 else 0,
+                'samples': latencies
             }
             
         except Exception as e:
             self.log(f"Python延迟测试失败: {e}")
             return {}
     
+    def benchmark_socket_modes(self, iterations: int = 200) -> Dict[str, Dict[str, float]]:
+        """对比调优前后的套接字写法对尾延迟的影响"""
+        return {mode: self.benchmark_python_latency(iterations, mode) for mode in ("legacy", "tuned")}
+    
     def benchmark_python_throughput(self, duration: int = 10) -> float:
         """测试Python模式吞吐量"""
         self.log(f"测试Python模式吞吐量 ({duration} 秒)...")
@@ -134,6 +244,49 @@ class PerformanceBenchmark:
             self.log(f"Python吞吐量测试失败: {e}")
             return 0
     
+    def benchmark_python_pipelined_throughput(self, duration: int = 10, window: int = 32) -> float:
+        """测试Python模式流水线吞吐量（同一连接上保持window个未完成请求）"""
+        self.log(f"测试Python模式流水线吞吐量 ({duration} 秒, 窗口 {window})...")
+        
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(30)
+            sock.connect((self.server_host, self.server_port))
+            
+            next_id = 0
+            in_flight = 0
+            request_count = 0
+            
+            start_time = time.time()
+            end_time = start_time + duration
+            
+            # 先填满窗口，之后每收到一个响应就补发一个请求
+            while in_flight < window:
+                next_id += 1
+                self._send_request(sock, {"id": next_id, "command": "ping", "params": {}})
+                in_flight += 1
+            
+            while in_flight > 0:
+                response = self._receive_response(sock)
+                if not response:
+                    break
+                in_flight -= 1
+                request_count += 1
+                
+                if time.time() < end_time:
+                    next_id += 1
+                    self._send_request(sock, {"id": next_id, "command": "ping", "params": {}})
+                    in_flight += 1
+            
+            actual_duration = time.time() - start_time
+            sock.close()
+            
+            return request_count / actual_duration
+            
+        except Exception as e:
+            self.log(f"Python流水线吞吐量测试失败: {e}")
+            return 0
+    
     def benchmark_python_input_processing(self, iterations: int = 100) -> Dict[str, float]:
         """测试Python输入处理性能"""
         self.log(f"测试Python输入处理性能 ({iterations} 次迭代)...")
@@ -144,7 +297,7 @@ class PerformanceBenchmark:
             sock.connect((self.server_host, self.server_port))
             
             processing_times = []
-            test_sequence = [110, 105, 104, 97, 111]  # "nihao"
+            test_sequence = INPUT_SEQUENCE
             
             for i in range(iterations):
                 start_time = time.perf_counter()
@@ -164,7 +317,7 @@ class PerformanceBenchmark:
                 processing_time = (end_time - start_time) * 1000
                 processing_times.append(processing_time)
                 
-                if (i + 1) % 10 == 0:
+                if (i + 1) % 100 == 0:
                     self.log(f"  完成 {i + 1}/{iterations} 次输入序列")
             
             sock.close()
@@ -174,84 +327,330 @@ class PerformanceBenchmark:
                 'max': max(processing_times),
                 'mean': statistics.mean(processing_times),
                 'median': statistics.median(processing_times),
-                'stdev': statistics.stdev(processing_times) if len(processing_times) > 1 else 0
+                'stdev': statistics.stdev(processing_times) if len(processing_times) > 1 else 0,
+                'samples': processing_times
             }
             
         except Exception as e:
             self.log(f"Python输入处理测试失败: {e}")
             return {}
     
-    def benchmark_dll_performance(self, iterations: int = 1000) -> Dict[str, float]:
-        """测试DLL性能"""
-        self.log(f"测试DLL性能 ({iterations} 次迭代)...")
+    def benchmark_trace_breakdown(self, iterations: int = 100) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        按阶段分解请求耗时
+        
+        与输入处理测试相同的序列，每个请求带 "trace": true，按命令汇总服务器返回的
+        各阶段耗时；客户端往返时间减去服务器内总耗时记为transport（套接字读写、
+        分帧和客户端编解码）。
+        
+        Returns:
+            命令 -> 阶段 -> {mean_us, median_us, p99_us}
+        """
+        self.log(f"测试请求分阶段耗时 ({iterations} 次迭代)...")
         
         try:
-            dll_build_dir = os.path.join(os.path.dirname(__file__), '..', 'dll_component', 'build')
-            test_dll_path = os.path.join(dll_build_dir, 'test_dll')
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(30)
+            sock.connect((self.server_host, self.server_port))
             
-            if not os.path.exists(test_dll_path):
-                self.log("DLL测试程序不存在")
-                return {}
+            # 命令 -> 阶段 -> 耗时列表（微秒）
+            samples = {}
+            requests = [{"command": "process_key", "params": {"key_code": key_code}}
+                        for key_code in [110, 105, 104, 97, 111]]  # "nihao"
+            requests.append({"command": "select_candidate", "params": {"index": 0}})
+            
+            for _ in range(iterations):
+                for request in requests:
+                    start_ns = time.perf_counter_ns()
+                    self._send_request(sock, dict(request, trace=True))
+                    response = self._receive_response(sock)
+                    roundtrip_ns = time.perf_counter_ns() - start_ns
+                    
+                    trace = response.get('trace')
+                    if not trace:
+                        continue
+                    
+                    stages = samples.setdefault(request['command'], {})
+                    for stage, duration_ns in trace['stages_ns'].items():
+                        stages.setdefault(stage, []).append(duration_ns / 1000)
+                    stages.setdefault('transport', []).append((roundtrip_ns - trace['total_ns']) / 1000)
+                    stages.setdefault('roundtrip', []).append(roundtrip_ns / 1000)
             
-            # 运行DLL性能测试
-            # 这里简化处理，实际应该修改test_dll.cpp来支持性能测试
-            times = []
+            sock.close()
             
-            for i in range(min(iterations, 10)):  # 限制次数，避免过长时间
+            breakdown = {}
+            for command, stages in samples.items():
+                breakdown[command] = {}
+                for stage, values in stages.items():
+                    values.sort()
+                    breakdown[command][stage] = {
+                        'mean_us': statistics.mean(values),
+                        'median_us': statistics.median(values),
+                        'p99_us': values[int(len(values) * 0.99)]
+                    }
+            return breakdown
+            
+        except Exception as e:
+            self.log(f"请求分阶段耗时测试失败: {e}")
+            return {}
+    
+    def benchmark_python_batch_input(self, iterations: int = 100) -> Dict[str, float]:
+        """测试Python批量输入处理性能（与输入处理测试相同的序列，一次往返完成）"""
+        self.log(f"测试Python批量输入处理性能 ({iterations} 次迭代)...")
+        
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(30)
+            sock.connect((self.server_host, self.server_port))
+            
+            processing_times = []
+            test_sequence = [110, 105, 104, 97, 111]  # "nihao"
+            operations = [{"command": "process_key", "params": {"key_code": key_code}} for key_code in test_sequence]
+            operations.append({"command": "select_candidate", "params": {"index": 0}})
+            request = {"command": "batch", "params": {"operations": operations}}
+            
+            for i in range(iterations):
                 start_time = time.perf_counter()
                 
-                result = subprocess.run([test_dll_path], 
-                                      capture_output=True, 
-                                      text=True, 
-                                      timeout=10)
+                self._send_request(sock, request)
+                self._receive_response(sock)
                 
                 end_time = time.perf_counter()
+                processing_time = (end_time - start_time) * 1000
+                processing_times.append(processing_time)
                 
-                if result.returncode == 0:
-                    execution_time = (end_time - start_time) * 1000
-                    times.append(execution_time)
+                if (i + 1) % 10 == 0:
+                    self.log(f"  完成 {i + 1}/{iterations} 次批量输入序列")
+            
+            sock.close()
+            
+            return {
+                'min': min(processing_times),
+                'max': max(processing_times),
+                'mean': statistics.mean(processing_times),
+                'median': statistics.median(processing_times),
+                'stdev': statistics.stdev(processing_times) if len(processing_times) > 1 else 0,
+                'samples': processing_times
+            }
+            
+        except Exception as e:
+            self.log(f"Python批量输入处理测试失败: {e}")
+            return {}
+    
+    def benchmark_transport_latency(self, transport: str, iterations: int = 1000) -> Dict[str, float]:
+        """测试同机传输方式（unix/shm）的ping延迟，使用独立启动的asyncio服务器"""
+        self.log(f"测试{transport}传输延迟 ({iterations} 次迭代)...")
+        
+        from ipc_server import IPCClient
+        
+        unix_path = os.path.join('/tmp', f'unity_rime_bench_{os.getpid()}.sock')
+        server_script = os.path.join(os.path.dirname(__file__), '..', 'python_component', 'ipc_server.py')
+        server_process = subprocess.Popen([
+            sys.executable, server_script, '--asyncio', '--transport', transport, '--unix-path', unix_path
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        
+        try:
+            # 等待套接字文件出现
+            deadline = time.time() + 10
+            while not os.path.exists(unix_path):
+                if time.time() > deadline or server_process.poll() is not None:
+                    self.log(f"{transport}传输服务器启动失败")
+                    return {}
+                time.sleep(0.05)
+            
+            client = IPCClient(transport=transport, unix_path=unix_path)
+            if not client.connect():
+                return {}
+            
+            latencies = []
+            for i in range(iterations):
+                start_time = time.perf_counter()
+                client.send_request("ping")
+                end_time = time.perf_counter()
+                latencies.append((end_time - start_time) * 1000)
+            
+            client.disconnect()
+            
+            return {
+                'min': min(latencies),
+                'max': max(latencies),
+                'mean': statistics.mean(latencies),
+                'median': statistics.median(latencies),
+                'stdev': statistics.stdev(latencies) if len(latencies) > 1 else 0,
+                'samples': latencies
+            }
+            
+        except Exception as e:
+            self.log(f"{transport}传输延迟测试失败: {e}")
+            return {}
+        finally:
+            server_process.terminate()
+            try:
+                server_process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                server_process.kill()
+    
+    def benchmark_dll_performance(self, iterations: int = 1000, warmup: int = 100) -> Dict[str, Any]:
+        """
+        测试DLL性能
+        
+        在本进程中通过ctypes加载librime_dll，直接计时每次RimeProcessKey/RimeSelectCandidate
+        调用（含随后的RimeFreeResult，与Unity端的调用方式相同）。按键序列与Python输入处理
+        测试相同（"nihao" + 选择第一个候选词），序列耗时可以直接与其对比。
+        
+        Args:
+            iterations: 计时的输入序列数
+            warmup: 不计时的预热序列数
+            
+        Returns:
+            序列耗时统计（毫秒）以及每种调用的耗时统计（微秒）
+        """
+        self.log(f"测试DLL性能 ({iterations} 次输入序列)...")
+        
+        try:
+            from rime_native import NativeRime, RimeResult
+            
+            try:
+                native = NativeRime()
+            except OSError as e:
+                self.log(f"无法加载librime_dll: {e}")
+                return {}
+            
+            lib = native.lib
+            session_id = native.create_session()
+            result = RimeResult()
+            result_ref = ctypes.byref(result)
+            clock = time.perf_counter_ns
+            
+            sequence_times = []
+            process_key_times = []
+            select_times = []
+            
+            for i in range(warmup + iterations):
+                sequence_start = clock()
+                key_times = []
+                for key_code in INPUT_SEQUENCE:
+                    start = clock()
+                    lib.RimeProcessKey(session_id, key_code, result_ref)
+                    lib.RimeFreeResult(result_ref)
+                    key_times.append(clock() - start)
                 
-                if (i + 1) % 5 == 0:
-                    self.log(f"  完成 {i + 1}/10 次DLL测试")
+                start = clock()
+                lib.RimeSelectCandidate(session_id, 0, result_ref)
+                selected_text = result.selected_text
+                lib.RimeFreeResult(result_ref)
+                end = clock()
+                
+                if selected_text.decode('utf-8') != INPUT_EXPECTED_TEXT:
+                    self.log(f"DLL选词结果错误: {selected_text!r}")
+                    return {}
+                
+                if i >= warmup:
+                    process_key_times.extend(key_times)
+                    select_times.append(end - start)
+                    sequence_times.append((end - sequence_start) / 1e6)
             
-            if times:
+            native.destroy_session(session_id)
+            
+            def summary_us(values: List[int]) -> Dict[str, float]:
+                values = sorted(value / 1000 for value in values)
                 return {
-                    'min': min(times),
-                    'max': max(times),
-                    'mean': statistics.mean(times),
-                    'median': statistics.median(times),
-                    'stdev': statistics.stdev(times) if len(times) > 1 else 0
+                    'mean_us': statistics.mean(values),
+                    'median_us': statistics.median(values),
+                    'p99_us': percentile(values, 0.99)
                 }
-            else:
-                return {}
+            
+            sorted_times = sorted(sequence_times)
+            return {
+                'min': sorted_times[0],
+                'max': sorted_times[-1],
+                'mean': statistics.mean(sequence_times),
+                'median': statistics.median(sequence_times),
+                'p99': percentile(sorted_times, 0.99),
+                'stdev': statistics.stdev(sequence_times) if len(sequence_times) > 1 else 0,
+                'process_key': summary_us(process_key_times),
+                'select_candidate': summary_us(select_times),
+                'library': native.library_path,
+                'samples': sequence_times
+            }
                 
         except Exception as e:
             self.log(f"DLL性能测试失败: {e}")
             return {}
     
+    def benchmark_wrapper_inprocess(self, backend: str = "native", iterations: int = 1000,
+                                    warmup: int = 100) -> Dict[str, float]:
+        """
+        在本进程中通过RimeWrapper执行与Python输入处理测试相同的序列（不经过IPC），
+        用于区分包装器本身（状态构建、版本记录）和IPC往返各占多少耗时
+        
+        Args:
+            backend: RimeWrapper引擎后端
+            iterations: 计时的输入序列数
+            warmup: 不计时的预热序列数
+        """
+        self.log(f"测试RimeWrapper进程内性能 ({backend}, {iterations} 次输入序列)...")
+        
+        try:
+            from rime_wrapper import RimeWrapper
+            
+            rime = RimeWrapper(backend=backend)
+            if not rime.is_initialized:
+                return {}
+            
+            session_id = rime.create_session()
+            sequence_times = []
+            for i in range(warmup + iterations):
+                start = time.perf_counter_ns()
+                for key_code in INPUT_SEQUENCE:
+                    rime.process_key(key_code, session_id)
+                rime.select_candidate(0, session_id)
+                if i >= warmup:
+                    sequence_times.append((time.perf_counter_ns() - start) / 1e6)
+            rime.destroy_session(session_id)
+            
+            sorted_times = sorted(sequence_times)
+            return {
+                'min': sorted_times[0],
+                'max': sorted_times[-1],
+                'mean': statistics.mean(sequence_times),
+                'median': statistics.median(sequence_times),
+                'p99': percentile(sorted_times, 0.99),
+                'stdev': statistics.stdev(sequence_times) if len(sequence_times) > 1 else 0,
+                'samples': sequence_times
+            }
+            
+        except Exception as e:
+            self.log(f"RimeWrapper进程内性能测试失败: {e}")
+            return {}
+    
     def _send_request(self, sock: socket.socket, request: Dict[str, Any]) -> bool:
         """发送请求"""
         try:
-            request_json = json.dumps(request)
-            request_data = request_json.encode('utf-8')
-            
-            length_data = len(request_data).to_bytes(4, byteorder='little')
-            sock.send(length_data)
-            sock.send(request_data)
+            request_data = json.dumps(request).encode('utf-8')
+            send_frame(sock, request_data)
             
             return True
         except Exception:
             return False
     
+    def _send_request_split(self, sock: socket.socket, request: Dict[str, Any]) -> bool:
+        """按优化前的方式发送请求：长度头和消息体分两次send"""
+        try:
+            request_data = json.dumps(request).encode('utf-8')
+            sock.sendall(len(request_data).to_bytes(4, byteorder='little'))
+            sock.sendall(request_data)
+            return True
+        except Exception:
+            return False
+    
     def _receive_response(self, sock: socket.socket) -> Dict[str, Any]:
         """接收响应"""
         try:
-            response_length_data = sock.recv(4)
-            response_length = int.from_bytes(response_length_data, byteorder='little')
-            
-            response_data = sock.recv(response_length)
-            response_json = response_data.decode('utf-8')
-            return json.loads(response_json)
+            response_data = recv_frame(sock)
+            if response_data is None:
+                return {}
+            return json.loads(response_data.decode('utf-8'))
             
         except Exception:
             return {}
@@ -285,54 +684,132 @@ class PerformanceBenchmark:
                 print(f"  最大值: {latency_results['max']:.2f} ms")
                 print(f"  平均值: {latency_results['mean']:.2f} ms")
                 print(f"  中位数: {latency_results['median']:.2f} ms")
+                print(f"  P99: {latency_results['p99']:.2f} ms")
                 print(f"  标准差: {latency_results['stdev']:.2f} ms")
             
+            # 套接字写法对比
+            socket_modes = self.benchmark_socket_modes(200)
+            if all(socket_modes.values()):
+                results['python_latency_socket_modes'] = socket_modes
+                print("\n套接字写法对比 (200次):")
+                for mode, stats in socket_modes.items():
+                    print(f"  {mode:>6}: 中位数 {stats['median']:.2f} ms, P99 {stats['p99']:.2f} ms")
+            
             # 吞吐量测试
             throughput = self.benchmark_python_throughput(10)
             if throughput > 0:
                 results['python_throughput'] = throughput
                 print(f"\n吞吐量: {throughput:.1f} 请求/秒")
             
+            # 流水线吞吐量测试
+            pipelined_throughput = self.benchmark_python_pipelined_throughput(10)
+            if pipelined_throughput > 0:
+                results['python_pipelined_throughput'] = pipelined_throughput
+                print(f"流水线吞吐量: {pipelined_throughput:.1f} 请求/秒")
+            
             # 输入处理测试
-            input_results = self.benchmark_python_input_processing(50)
+            input_results = self.benchmark_python_input_processing(1000)
             if input_results:
                 results['python_input'] = input_results
-                print(f"\n输入处理统计 (50次完整序列):")
+                print(f"\n输入处理统计 (1000次完整序列):")
                 print(f"  最小值: {input_results['min']:.2f} ms")
                 print(f"  最大值: {input_results['max']:.2f} ms")
                 print(f"  平均值: {input_results['mean']:.2f} ms")
                 print(f"  中位数: {input_results['median']:.2f} ms")
                 print(f"  标准差: {input_results['stdev']:.2f} ms")
+            
+            # 批量输入处理测试
+            batch_results = self.benchmark_python_batch_input(50)
+            if batch_results:
+                results['python_batch_input'] = batch_results
+                print(f"\n批量输入处理统计 (50次完整序列):")
+                print(f"  最小值: {batch_results['min']:.2f} ms")
+                print(f"  最大值: {batch_results['max']:.2f} ms")
+                print(f"  平均值: {batch_results['mean']:.2f} ms")
+                print(f"  中位数: {batch_results['median']:.2f} ms")
+                print(f"  标准差: {batch_results['stdev']:.2f} ms")
+                if input_results and batch_results['mean'] > 0:
+                    print(f"  相对逐键请求加速比: {input_results['mean'] / batch_results['mean']:.1f}x")
+            
+            # 分阶段耗时
+            breakdown = self.benchmark_trace_breakdown(50)
+            if breakdown:
+                results['python_trace_breakdown'] = breakdown
+                print(f"\n请求分阶段耗时 (50次完整序列, µs):")
+                for command, stages in breakdown.items():
+                    print(f"  {command}:")
+                    for stage, stats in stages.items():
+                        print(f"    {stage:<26} 平均 {stats['mean_us']:8.1f}  中位数 {stats['median_us']:8.1f}  "
+                              f"P99 {stats['p99_us']:8.1f}")
+        
+        # 开环负载测试
+        print("\n📊 开环负载测试")
+        print("-" * 40)
+        
+        load_server = self.start_load_server()
+        if load_server is not None:
+            try:
+                load_results = self.benchmark_max_throughput(20, [250, 500, 1000, 2000, 4000], 20.0, 3.0)
+            finally:
+                self.stop_load_server(load_server)
+            results['open_loop'] = load_results
+            print(f"20 个客户端在 p99 ≤ 20 ms 时的最大吞吐量: {load_results['max_rate_within_slo']:.0f} 次/秒")
+        else:
+            print("❌ 无法启动负载测试服务器")
+        
+        # 同机传输方式测试
+        print("\n📊 同机传输方式延迟测试")
+        print("-" * 40)
+        
+        for transport in ('unix', 'shm'):
+            transport_results = self.benchmark_transport_latency(transport, 1000)
+            if transport_results:
+                results[f'{transport}_latency'] = transport_results
+                print(f"{transport} 延迟: 平均 {transport_results['mean']:.3f} ms, "
+                      f"中位数 {transport_results['median']:.3f} ms, 最大 {transport_results['max']:.3f} ms")
+            else:
+                print(f"❌ {transport} 传输测试失败")
         
         # DLL性能测试
         print("\n📊 DLL模式性能测试")
         print("-" * 40)
         
-        dll_results = self.benchmark_dll_performance(10)
+        dll_results = self.benchmark_dll_performance(1000)
         if dll_results:
             results['dll_performance'] = dll_results
-            print(f"DLL执行统计 (10次):")
-            print(f"  最小值: {dll_results['min']:.2f} ms")
-            print(f"  最大值: {dll_results['max']:.2f} ms")
-            print(f"  平均值: {dll_results['mean']:.2f} ms")
-            print(f"  中位数: {dll_results['median']:.2f} ms")
-            print(f"  标准差: {dll_results['stdev']:.2f} ms")
+            print(f"DLL输入处理统计 (1000次完整序列，进程内直接调用):")
+            print(f"  最小值: {dll_results['min'] * 1000:.1f} µs")
+            print(f"  最大值: {dll_results['max'] * 1000:.1f} µs")
+            print(f"  平均值: {dll_results['mean'] * 1000:.1f} µs")
+            print(f"  中位数: {dll_results['median'] * 1000:.1f} µs")
+            print(f"  标准差: {dll_results['stdev'] * 1000:.1f} µs")
+            for call, key in (("RimeProcessKey", 'process_key'), ("RimeSelectCandidate", 'select_candidate')):
+                print(f"  {call}: 平均 {dll_results[key]['mean_us']:.2f} µs, "
+                      f"中位数 {dll_results[key]['median_us']:.2f} µs, P99 {dll_results[key]['p99_us']:.2f} µs")
         else:
             print("❌ DLL性能测试失败")
         
-        # 性能对比
-        if python_available and 'python_latency' in results and 'dll_performance' in results:
-            print("\n📈 性能对比")
+        wrapper_results = self.benchmark_wrapper_inprocess("native", 1000)
+        if wrapper_results:
+            results['wrapper_native_inprocess'] = wrapper_results
+            print(f"RimeWrapper(native) 进程内: 平均 {wrapper_results['mean'] * 1000:.1f} µs/序列")
+        
+        # 性能对比（同一输入序列："nihao" + 选择第一个候选词）
+        if python_available and 'python_input' in results and 'dll_performance' in results:
+            print("\n📈 性能对比（每个输入序列: 5次按键 + 选词）")
             print("-" * 40)
             
-            python_avg = results['python_latency']['mean']
+            python_avg = results['python_input']['mean']
             dll_avg = results['dll_performance']['mean']
             
+            print(f"Python模式 (IPC往返): 平均 {python_avg * 1000:.1f} µs, "
+                  f"中位数 {results['python_input']['median'] * 1000:.1f} µs")
+            if wrapper_results:
+                print(f"RimeWrapper进程内 (native后端): 平均 {wrapper_results['mean'] * 1000:.1f} µs")
+            print(f"DLL模式 (直接调用): 平均 {dll_avg * 1000:.1f} µs, "
+                  f"中位数 {dll_results['median'] * 1000:.1f} µs")
             if dll_avg > 0:
-                speedup = python_avg / dll_avg
-                print(f"Python平均延迟: {python_avg:.2f} ms")
-                print(f"DLL平均执行时间: {dll_avg:.2f} ms")
-                print(f"DLL相对加速比: {speedup:.1f}x")
+                print(f"DLL相对Python模式加速比: {python_avg / dll_avg:.1f}x")
             
             if 'python_throughput' in results:
                 print(f"Python吞吐量: {results['python_throughput']:.1f} 请求/秒")
@@ -348,27 +825,375 @@ class PerformanceBenchmark:
         
         return results
     
-    def save_results(self, results: Dict[str, Any]):
-        """保存测试结果到文件"""
+    def start_load_server(self, workers: int = 0) -> subprocess.Popen:
+        """
+        启动负载测试用的asyncio服务器，端口可连接后返回进程，失败返回None
+        
+        Args:
+            workers: 工作池的工作进程数，0表示单进程asyncio服务器
+        """
+        server_script = os.path.join(os.path.dirname(__file__), '..', 'python_component', 'ipc_server.py')
+        mode_args = ['--workers', str(workers), '--log-file', ''] if workers else ['--asyncio']
+        server_process, ready = start_server([
+            sys.executable, server_script, *mode_args, '--port', str(self.load_server_port)
+        ], timeout=60, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        
+        if ready:
+            return server_process
+        self.stop_load_server(server_process)
+        return None
+    
+    def stop_load_server(self, server_process: subprocess.Popen):
+        """停止负载测试服务器"""
+        server_process.terminate()
+        try:
+            server_process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            server_process.kill()
+    
+    def benchmark_open_loop(self, clients: int, rate: float, duration: float = 10.0,
+                            drain_timeout: float = 5.0, seed: int = 0) -> Dict[str, Any]:
+        """
+        开环负载测试
+        
+        clients个连接共同以rate次/秒的目标到达率发送请求，每个连接的请求间隔服从
+        指数分布（泊松到达），发送不等待响应（流水线），因此服务器变慢时请求会排队，
+        而不是像闭环测试那样自动降低发送速率。延迟从计划发送时间开始计算，
+        负载生成器自身落后于计划时的等待也计入延迟（避免协调遗漏）。
+        
+        Args:
+            clients: 并发连接数（模拟的玩家数）
+            rate: 所有连接合计的目标请求速率（次/秒）
+            duration: 发送持续时间（秒）
+            drain_timeout: 停止发送后等待剩余响应的时间（秒），超时未收到的计为timeouts
+            seed: 随机数种子
+        
+        Returns:
+            延迟分位数（毫秒）、完成吞吐量和错误统计
+        """
+        return asyncio.run(self._run_open_loop(clients, rate, duration, drain_timeout, seed))
+    
+    async def _run_open_loop(self, clients: int, rate: float, duration: float,
+                             drain_timeout: float, seed: int) -> Dict[str, Any]:
+        """在事件循环中运行所有模拟客户端"""
+        latencies = []
+        send_lags = []
+        counters = {'sent': 0, 'completed': 0, 'errors': 0, 'timeouts': 0}
+        
+        # 先建立所有连接，避免连接建立的耗时计入第一批请求的延迟
+        connections = await asyncio.gather(*[
+            asyncio.open_connection(self.server_host, self.load_server_port) for _ in range(clients)
+        ])
+        
+        start = time.perf_counter() + 0.05
+        end = start + duration
+        await asyncio.gather(*[
+            self._open_loop_client(reader, writer, rate / clients, start, end, drain_timeout,
+                                   random.Random(seed * 100003 + index), latencies, send_lags, counters)
+            for index, (reader, writer) in enumerate(connections)
+        ])
+        
+        latencies.sort()
+        send_lags.sort()
+        return {
+            'clients': clients,
+            'target_rate': rate,
+            'achieved_rate': counters['completed'] / duration,
+            **counters,
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'p999': percentile(latencies, 0.999),
+            'max': latencies[-1] if latencies else 0.0,
+            'send_lag_p99': percentile(send_lags, 0.99),
+            'samples': latencies
+        }
+    
+    async def _open_loop_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                rate: float, start: float, end: float, drain_timeout: float,
+                                rng: random.Random, latencies: List[float], send_lags: List[float],
+                                counters: Dict[str, int]):
+        """单个模拟客户端：按计划时间发送请求，另一个任务按id匹配响应"""
+        # 请求id -> 计划发送时间
+        intended = {}
+        all_sent = asyncio.Event()
+        drained = asyncio.Event()
+        
+        async def receive():
+            try:
+                while True:
+                    header = await reader.readexactly(HEADER.size)
+                    response = json.loads(await reader.readexactly(HEADER.unpack(header)[0]))
+                    intended_time = intended.pop(response.get('id'), None)
+                    if intended_time is None:
+                        continue
+                    latencies.append((time.perf_counter() - intended_time) * 1000)
+                    counters['completed'] += 1
+                    if 'error' in response:
+                        counters['errors'] += 1
+                    if all_sent.is_set() and not intended:
+                        drained.set()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                drained.set()
+        
+        receive_task = asyncio.create_task(receive())
+        requests = keystroke_requests(rng)
+        next_time = start
+        request_id = 0
+        
+        try:
+            while True:
+                next_time += rng.expovariate(rate)
+                if next_time >= end:
+                    break
+                
+                delay = next_time - time.perf_counter()
+                if self.precise_timing:
+                    # 事件循环的定时器按毫秒取整，提前1ms醒来后让出执行权直到计划时间，
+                    # 避免负载生成器自身的唤醒延迟计入测得的延迟（会占满一个CPU核）
+                    if delay > 0.002:
+                        await asyncio.sleep(delay - 0.001)
+                    while time.perf_counter() < next_time:
+                        await asyncio.sleep(0)
+                elif delay > 0:
+                    await asyncio.sleep(delay)
+                send_lags.append(max(time.perf_counter() - next_time, 0.0) * 1000)
+                
+                request_id += 1
+                request = next(requests)
+                request['id'] = request_id
+                intended[request_id] = next_time
+                writer.write(encode_frame(json.dumps(request).encode('utf-8')))
+                counters['sent'] += 1
+            
+            all_sent.set()
+            if intended:
+                try:
+                    await asyncio.wait_for(drained.wait(), drain_timeout)
+                except asyncio.TimeoutError:
+                    pass
+            counters['timeouts'] += len(intended)
+        finally:
+            receive_task.cancel()
+            writer.close()
+    
+    def benchmark_max_throughput(self, clients: int, rates: List[float], slo_p99_ms: float = 20.0,
+                                 duration: float = 5.0) -> Dict[str, Any]:
+        """
+        逐级提高目标速率，找出p99延迟仍满足SLO时的最大吞吐量
+        
+        某一级p99超过slo_p99_ms、有请求超时或完成速率低于目标的95%时停止。
+        
+        Returns:
+            各级结果和满足SLO的最大速率
+        """
+        steps = []
+        max_rate = 0.0
+        
+        for rate in rates:
+            self.log(f"开环负载: {clients} 个客户端, 目标 {rate:.0f} 次/秒...")
+            result = self.benchmark_open_loop(clients, rate, duration)
+            steps.append(result)
+            self.log(f"  完成 {result['achieved_rate']:.0f} 次/秒, p50 {result['p50']:.2f} ms, "
+                     f"p99 {result['p99']:.2f} ms, p999 {result['p999']:.2f} ms, 超时 {result['timeouts']}, "
+                     f"发送滞后p99 {result['send_lag_p99']:.2f} ms")
+            
+            if (result['p99'] > slo_p99_ms or result['timeouts']
+                    or result['achieved_rate'] < rate * 0.95):
+                break
+            max_rate = result['achieved_rate']
+        
+        return {
+            'clients': clients,
+            'slo_p99_ms': slo_p99_ms,
+            'max_rate_within_slo': max_rate,
+            'steps': steps
+        }
+    
+    def run_load_test(self, clients: int, rates: List[float], slo_p99_ms: float,
+                      duration: float) -> Dict[str, Any]:
+        """启动负载测试服务器并运行速率扫描"""
+        print("Unity Rime输入法集成 - 开环负载测试")
+        print("=" * 60)
+        
+        server_process = self.start_load_server()
+        if server_process is None:
+            print("❌ 无法启动负载测试服务器")
+            return {}
+        
         try:
-            results_file = os.path.join(os.path.dirname(__file__), 'benchmark_results.json')
+            result = self.benchmark_max_throughput(clients, rates, slo_p99_ms, duration)
+        finally:
+            self.stop_load_server(server_process)
+        
+        print(f"\n{clients} 个客户端在 p99 ≤ {slo_p99_ms:g} ms 时的最大吞吐量: "
+              f"{result['max_rate_within_slo']:.0f} 次/秒")
+        return result
+    
+    def benchmark_worker_scaling(self, worker_counts: List[int], generators: int = 4,
+                                 connections: int = 16, window: int = 8,
+                                 duration: float = 10.0) -> Dict[str, Any]:
+        """
+        测试按键吞吐量随工作池进程数的扩展
+        
+        每种进程数单独启动一个工作池，generators个负载生成进程各自保持connections个连接，
+        每个连接上流水线保持window个未完成的按键请求（闭环），测得饱和吞吐量。
+        负载生成进程与工作进程共用CPU，进程数加生成器数超过核数时测得的加速比偏低。
+        
+        Returns:
+            每种进程数的吞吐量、相对于第一种进程数的加速比和扩展效率
+        """
+        cpu_count = os.cpu_count() or 1
+        self.log(f"工作池扩展测试: 工作进程数 {worker_counts}, {generators} 个负载生成进程, "
+                 f"每个 {connections} 个连接, 窗口 {window}, CPU核数 {cpu_count}")
+        if max(worker_counts) + generators > cpu_count:
+            self.log("  警告: 工作进程数加负载生成进程数超过CPU核数，加速比会被低估")
+        
+        steps = []
+        for workers in worker_counts:
+            server_process = self.start_load_server(workers)
+            if server_process is None:
+                self.log(f"  无法启动 {workers} 个工作进程的工作池")
+                continue
+            try:
+                with ProcessPoolExecutor(max_workers=generators) as executor:
+                    counts = list(executor.map(
+                        _closed_loop_generator,
+                        [self.server_host] * generators, [self.load_server_port] * generators,
+                        [connections] * generators, [window] * generators, [duration] * generators,
+                        range(generators)
+                    ))
+            finally:
+                self.stop_load_server(server_process)
             
-            # 添加时间戳
-            results['timestamp'] = time.time()
-            results['datetime'] = time.strftime("%Y-%m-%d %H:%M:%S")
+            throughput = sum(count / elapsed for count, elapsed in counts if elapsed > 0)
+            steps.append({'workers': workers, 'throughput': throughput})
+        
+        if steps:
+            base = steps[0]
+            for step in steps:
+                step['speedup'] = step['throughput'] / base['throughput'] if base['throughput'] else 0.0
+                step['efficiency'] = step['speedup'] * base['workers'] / step['workers']
+                self.log(f"  {step['workers']:>3} 个工作进程: {step['throughput']:.0f} 次/秒, "
+                         f"加速比 {step['speedup']:.2f}, 效率 {step['efficiency']:.0%}")
+        
+        return {
+            'cpu_count': cpu_count,
+            'generators': generators,
+            'connections': connections,
+            'window': window,
+            'duration': duration,
+            'steps': steps
+        }
+    
+    def benchmark_settings(self) -> Dict[str, Any]:
+        """影响测试结果的基准测试配置（记录到历史中）"""
+        return {
+            'codec': 'json',
+            'transport': 'tcp',
+            'tcp_nodelay': SocketOptions().tcp_nodelay,
+            'precise_timing': self.precise_timing
+        }
+    
+    def save_results(self, results: Dict[str, Any], filename: str = 'benchmark_results.json'):
+        """
+        保存测试结果
+        
+        汇总结果（不含原始样本）连同运行环境写入filename，覆盖上一次的结果；
+        完整记录（含原始延迟样本）追加到历史文件，供compare命令检测回归。
+        """
+        try:
+            results_file = os.path.join(os.path.dirname(__file__), filename)
+            summary, samples = benchmark_history.split_samples(results)
+            environment = benchmark_history.environment_info(self.benchmark_settings())
+            
+            record = benchmark_history.append_run(summary, samples, environment, self.label, self.history_file)
+            
+            # 添加时间戳和运行环境
+            summary['timestamp'] = record['timestamp']
+            summary['datetime'] = record['datetime']
+            summary['run_id'] = record['run_id']
+            summary['environment'] = environment
             
             with open(results_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+                json.dump(summary, f, indent=2, ensure_ascii=False)
             
             print(f"\n📄 测试结果已保存到: {results_file}")
+            print(f"📄 已追加到历史记录 #{record['run_id']}: {self.history_file}")
             
         except Exception as e:
             print(f"❌ 保存结果失败: {e}")
+    
+    def compare(self, baseline: str = "previous", candidate: str = "latest", alpha: float = 0.01,
+                min_change: float = 0.05) -> int:
+        """
+        比较历史记录中的两次运行
+        
+        Returns:
+            进程退出码：0 没有回归，1 有显著回归，2 找不到指定的记录
+        """
+        runs = benchmark_history.load_runs(self.history_file)
+        baseline_run = benchmark_history.find_run(runs, baseline)
+        candidate_run = benchmark_history.find_run(runs, candidate)
+        if baseline_run is None or candidate_run is None:
+            print(f"❌ 历史记录中找不到{'基线' if baseline_run is None else '候选'}运行: "
+                  f"{baseline if baseline_run is None else candidate}")
+            return 2
+        
+        comparisons = benchmark_history.compare_runs(baseline_run, candidate_run, alpha, min_change)
+        benchmark_history.print_comparison(baseline_run, candidate_run, comparisons)
+        
+        regressions = [item['metric'] for item in comparisons if item['regression']]
+        if regressions:
+            print(f"\n❌ {len(regressions)} 个指标显著变慢（p < {alpha:g} 且中位数增加 ≥ {min_change:.0%}）")
+            return 1
+        print("\n✅ 没有发现显著的性能回归")
+        return 0
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="Unity Rime输入法集成 - 性能基准测试")
+    parser.add_argument("mode", nargs="?", default="all", choices=["all", "load", "scaling", "compare", "history"],
+                        help="all: 运行完整基准测试（默认）；load: 只运行开环负载测试；"
+                             "scaling: 测试吞吐量随工作池进程数的扩展；"
+                             "compare: 比较历史记录中的两次运行；history: 列出历史记录")
+    parser.add_argument("--clients", type=int, default=50, help="负载测试的并发客户端数")
+    parser.add_argument("--rates", type=float, nargs="+", default=[500, 1000, 2000, 4000, 8000],
+                        help="负载测试依次尝试的目标速率（次/秒）")
+    parser.add_argument("--slo-ms", type=float, default=20.0, help="负载测试的p99延迟目标（毫秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="负载测试每一级的持续时间（秒）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="扩展测试依次使用的工作进程数")
+    parser.add_argument("--generators", type=int, default=4, help="扩展测试的负载生成进程数")
+    parser.add_argument("--precise-timing", action="store_true",
+                        help="负载生成器忙等到计划发送时间（消除约1ms的定时误差，需要空闲的CPU核）")
+    parser.add_argument("--history-file", default=benchmark_history.HISTORY_FILE, help="历史记录文件（JSON Lines）")
+    parser.add_argument("--label", default="", help="本次运行的标签（例如分支名），compare时可用标签选择运行")
+    parser.add_argument("--baseline", default="previous",
+                        help="compare的基线：run_id、标签、latest或previous（默认倒数第二次）")
+    parser.add_argument("--candidate", default="latest", help="compare的候选运行（默认最后一次）")
+    parser.add_argument("--alpha", type=float, default=0.01, help="compare的显著性水平")
+    parser.add_argument("--min-change", type=float, default=0.05,
+                        help="compare判为回归所需的中位数最小相对增幅（默认0.05即5%%）")
+    args = parser.parse_args()
+    
     benchmark = PerformanceBenchmark()
-    benchmark.run_benchmark()
+    benchmark.precise_timing = args.precise_timing
+    benchmark.history_file = args.history_file
+    benchmark.label = args.label
+    if args.mode == "compare":
+        sys.exit(benchmark.compare(args.baseline, args.candidate, args.alpha, args.min_change))
+    elif args.mode == "history":
+        benchmark_history.print_runs(benchmark_history.load_runs(args.history_file))
+    elif args.mode == "load":
+        result = benchmark.run_load_test(args.clients, args.rates, args.slo_ms, args.duration)
+        if result:
+            benchmark.save_results({'open_loop': result}, 'load_test_results.json')
+    elif args.mode == "scaling":
+        result = benchmark.benchmark_worker_scaling(args.workers, args.generators, duration=args.duration)
+        benchmark.save_results({'worker_scaling': result}, 'scaling_results.json')
+    else:
+        benchmark.run_benchmark()
 
 if __name__ == "__main__":
     main()
@@ -12,6 +12,8 @@ import sys
 import os
 import time
 import json
+import ctypes
+import signal
 import socket
 import subprocess
 import threading
@@ -20,6 +22,9 @@ from typing import Dict, List, Any, Optional
 # 添加项目路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'python_component'))
 
+from framing import recv_frame, send_frame
+from startup import start_server
+
 class IntegrationTester:
     """集成测试器"""
     
@@ -28,6 +33,7 @@ class IntegrationTester:
         self.server_process = None
         self.server_host = "127.0.0.1"
         self.server_port = 9999
+        self.server_args = ["--asyncio"]
         
     def log(self, message: str, level: str = "INFO"):
         """记录日志"""
@@ -46,19 +52,17 @@ class IntegrationTester:
                 self.log(f"服务器脚本不存在: {server_script}", "ERROR")
                 return False
             
-            # 启动服务器进程
-            self.server_process = subprocess.Popen([
-                sys.executable, server_script
+            # 启动服务器进程，等待其开始监听后的就绪通知
+            started = time.time()
+            self.server_process, ready = start_server([
+                sys.executable, server_script, *self.server_args
             ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
             
-            # 等待服务器启动
-            time.sleep(2)
-            
-            # 检查进程是否还在运行
-            if self.server_process.poll() is None:
-                self.log("Python服务器启动成功")
+            if ready:
+                self.log(f"Python服务器启动成功（{(time.time() - started) * 1000:.0f} ms）")
                 return True
             else:
+                self.server_process.terminate()
                 stdout, stderr = self.server_process.communicate()
                 self.log(f"Python服务器启动失败: {stderr}", "ERROR")
                 return False
@@ -96,22 +100,12 @@ class IntegrationTester:
                 "params": {}
             }
             
-            request_json = json.dumps(request)
-            request_data = request_json.encode('utf-8')
-            
-            # 发送消息长度
-            length_data = len(request_data).to_bytes(4, byteorder='little')
-            sock.send(length_data)
-            sock.send(request_data)
+            request_data = json.dumps(request).encode('utf-8')
+            send_frame(sock, request_data)
             
-            # 接收响应长度
-            response_length_data = sock.recv(4)
-            response_length = int.from_bytes(response_length_data, byteorder='little')
-            
-            # 接收响应数据
-            response_data = sock.recv(response_length)
-            response_json = response_data.decode('utf-8')
-            response = json.loads(response_json)
+            # 接收响应
+            response_data = recv_frame(sock)
+            response = json.loads(response_data.decode('utf-8'))
             
             sock.close()
             
@@ -192,16 +186,538 @@ class IntegrationTester:
             self.log(f"Python输入处理测试异常: {e}", "ERROR")
             return False
     
+    def test_python_concurrent_clients(self, client_count: int = 8) -> bool:
+        """测试多个客户端同时连接"""
+        try:
+            self.log(f"测试{client_count}个客户端并发连接...")
+            
+            # 先建立全部连接，再交错发送请求，单客户端服务器会在第二个连接上阻塞
+            sockets = []
+            for _ in range(client_count):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.settimeout(5)
+                sock.connect((self.server_host, self.server_port))
+                sockets.append(sock)
+            
+            try:
+                for sock in reversed(sockets):
+                    if not self._send_request(sock, {"command": "ping", "params": {}}):
+                        return False
+                    response = self._receive_response(sock)
+                    if not response or response.get('message') != 'pong':
+                        self.log(f"并发客户端未收到正确响应: {response}", "ERROR")
+                        return False
+            finally:
+                for sock in sockets:
+                    sock.close()
+            
+            self.log("并发连接测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"并发连接测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_session_isolation(self) -> bool:
+        """测试不同连接的输入状态互不干扰"""
+        try:
+            self.log("测试连接间会话隔离...")
+            
+            sock_a = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock_b = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock_a.settimeout(5)
+            sock_b.settimeout(5)
+            sock_a.connect((self.server_host, self.server_port))
+            sock_b.connect((self.server_host, self.server_port))
+            
+            try:
+                # 两个连接交错输入 "ni" 和 "hao"
+                for key_a, key_b in [(110, 104), (105, 97), (None, 111)]:
+                    for sock, key_code in ((sock_a, key_a), (sock_b, key_b)):
+                        if key_code is None:
+                            continue
+                        self._send_request(sock, {"command": "process_key", "params": {"key_code": key_code}})
+                        response = self._receive_response(sock)
+                        if not response or not response.get('success'):
+                            self.log(f"处理按键失败: {response}", "ERROR")
+                            return False
+                
+                compositions = []
+                for sock in (sock_a, sock_b):
+                    self._send_request(sock, {"command": "get_state", "params": {}})
+                    response = self._receive_response(sock)
+                    compositions.append(response.get('state', {}).get('composition') if response else None)
+            finally:
+                sock_a.close()
+                sock_b.close()
+            
+            if compositions != ['ni', 'hao']:
+                self.log(f"会话状态互相干扰: {compositions}", "ERROR")
+                return False
+            
+            self.log("会话隔离测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"会话隔离测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_batch(self) -> bool:
+        """测试批量命令"""
+        try:
+            self.log("测试批量命令...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            operations = [{"command": "process_key", "params": {"key_code": key_code}}
+                          for key_code in [110, 105, 104, 97, 111]]  # "nihao"
+            operations.append({"command": "select_candidate", "params": {"index": 0}})
+            
+            try:
+                self._send_request(sock, {"command": "batch", "params": {"operations": operations}})
+                response = self._receive_response(sock)
+                
+                self._send_request(sock, {"command": "batch", "params": {"operations": operations[:2], "results": "all"}})
+                all_response = self._receive_response(sock)
+                
+                # 逐步结果远大于一次recv的数据量，验证分帧读取
+                large_operations = [{"command": "get_state"}] * 2000
+                self._send_request(sock, {"command": "batch", "params": {"operations": large_operations, "results": "all"}})
+                large_response = self._receive_response(sock)
+            finally:
+                sock.close()
+            
+            if not response or response.get('selected_text') != '你好' or response.get('steps') != len(operations):
+                self.log(f"批量命令结果错误: {response}", "ERROR")
+                return False
+            
+            if not all_response or [r['state']['composition'] for r in all_response.get('results', [])] != ['n', 'ni']:
+                self.log(f"批量命令逐步结果错误: {all_response}", "ERROR")
+                return False
+            
+            if not large_response or len(large_response.get('results', [])) != len(large_operations):
+                self.log("批量命令大响应接收错误", "ERROR")
+                return False
+            
+            self.log("批量命令测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"批量命令测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_pipelining(self) -> bool:
+        """测试流水线请求（不等待响应连续发送多个带id的请求）"""
+        try:
+            self.log("测试流水线请求...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            test_keys = [110, 105, 104, 97, 111]  # "nihao"
+            try:
+                for request_id, key_code in enumerate(test_keys, 1):
+                    if not self._send_request(sock, {"id": request_id, "command": "process_key",
+                                                     "params": {"key_code": key_code}}):
+                        return False
+                
+                responses = [self._receive_response(sock) for _ in test_keys]
+            finally:
+                sock.close()
+            
+            ids = [response.get('id') if response else None for response in responses]
+            if ids != list(range(1, len(test_keys) + 1)):
+                self.log(f"流水线响应id错误: {ids}", "ERROR")
+                return False
+            
+            if responses[-1].get('state', {}).get('composition') != 'nihao':
+                self.log(f"流水线请求处理顺序错误: {responses[-1]}", "ERROR")
+                return False
+            
+            self.log("流水线请求测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"流水线请求测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_paging(self) -> bool:
+        """测试候选词翻页"""
+        try:
+            self.log("测试候选词翻页...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            operations = [{"command": "process_key", "params": {"key_code": key_code}}
+                          for key_code in [121, 105]]  # "yi"，候选词多于一页
+            try:
+                self._send_request(sock, {"command": "batch", "params": {"operations": operations}})
+                first = self._receive_response(sock)
+                
+                self._send_request(sock, {"command": "page_down"})
+                second = self._receive_response(sock)
+                
+                self._send_request(sock, {"command": "get_page", "params": {"page_no": 99}})
+                last = self._receive_response(sock)
+                
+                self._send_request(sock, {"command": "page_up"})
+                back = self._receive_response(sock)
+                
+                # 在第2页按当前页中的位置选择候选词
+                self._send_request(sock, {"command": "select_candidate", "params": {"index": 1}})
+                selected = self._receive_response(sock)
+            finally:
+                sock.close()
+            
+            pages = [(r['state']['page_no'], r['state']['is_last_page'])
+                     for r in (first, second, last, back) if r and 'state' in r]
+            if pages != [(0, False), (1, False), (2, True), (1, False)]:
+                self.log(f"翻页结果错误: {pages}", "ERROR")
+                return False
+            
+            # index是候选词在当前页中的位置
+            page_size = second['state']['page_size']
+            indexes = [candidate['index'] for candidate in second['state']['candidates']]
+            if indexes != list(range(page_size)):
+                self.log(f"翻页后候选词序号错误: {indexes}", "ERROR")
+                return False
+            
+            expected = back['state']['candidates'][1]['text']
+            if not selected or selected.get('selected_text') != expected:
+                self.log(f"第2页选择的候选词错误: {selected}，应为 {expected}", "ERROR")
+                return False
+            
+            self.log("候选词翻页测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"候选词翻页测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_delta(self) -> bool:
+        """测试增量状态（base_version返回delta，未知或过期的base_version返回带full的完整状态）"""
+        try:
+            self.log("测试增量状态...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            def request(command: str, **params) -> Dict[str, Any]:
+                self._send_request(sock, {"command": command, "params": params})
+                return self._receive_response(sock) or {}
+            
+            try:
+                request("clear_composition")
+                first = request("process_key", key_code=110, delta=True)
+                second = request("process_key", key_code=105, delta=True, base_version=first.get('version'))
+                unchanged = request("get_state", delta=True, base_version=second.get('version'))
+                full = request("get_state", delta=True, base_version=first.get('version'), full=True)
+                unknown = request("get_state", delta=True, base_version=10 ** 9)
+                
+                # 服务器只保留最近16个版本，之后最早的版本需要重新同步
+                for _ in range(10):
+                    request("process_key", key_code=97)
+                    request("clear_composition")
+                stale = request("get_state", delta=True, base_version=first.get('version'))
+            finally:
+                sock.close()
+            
+            # 没有base_version时返回完整状态
+            if ('state' not in first or 'delta' in first or not first.get('full')
+                    or first['state'].get('composition') != "n"):
+                self.log(f"首次请求应返回完整状态: {first}", "ERROR")
+                return False
+            
+            if ('state' in second or 'full' in second or second.get('base_version') != first['version']
+                    or second.get('version', 0) <= first['version']):
+                self.log(f"增量响应错误: {second}", "ERROR")
+                return False
+            merged = dict(first['state'], **second['delta'])
+            if merged != full.get('state') or second['delta'].get('composition') != "ni":
+                self.log(f"合并增量后的状态与完整状态不一致: {merged} / {full}", "ERROR")
+                return False
+            
+            if unchanged.get('delta') != {} or unchanged.get('version') != second['version']:
+                self.log(f"状态未变化时增量应为空且版本不变: {unchanged}", "ERROR")
+                return False
+            
+            if 'delta' in full or not full.get('full') or full.get('version') != second['version']:
+                self.log(f"指定full时应返回完整状态: {full}", "ERROR")
+                return False
+            
+            for name, response in (("未知", unknown), ("过期", stale)):
+                if 'state' not in response or 'delta' in response or not response.get('full'):
+                    self.log(f"{name}的base_version应返回完整状态: {response}", "ERROR")
+                    return False
+            if stale['version'] <= second['version'] or stale['state'].get('composition') != "":
+                self.log(f"版本号没有随状态变化递增: {stale}", "ERROR")
+                return False
+            
+            self.log("增量状态测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"增量状态测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_codec(self) -> bool:
+        """测试编解码器协商（set_codec、msgpack往返、未知或不可用的编解码器）"""
+        try:
+            self.log("测试编解码器协商...")
+            
+            import codec
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            try:
+                # 未知编解码器返回错误和可用列表，连接仍使用JSON
+                self._send_request(sock, {"command": "set_codec", "params": {"codec": "xml"}})
+                unknown = self._receive_response(sock) or {}
+                self._send_request(sock, {"command": "ping"})
+                pong = self._receive_response(sock) or {}
+                
+                if 'error' not in unknown or 'json' not in unknown.get('codecs', []) or not pong.get('success'):
+                    self.log(f"未知编解码器的响应错误: {unknown} / {pong}", "ERROR")
+                    return False
+                
+                if 'msgpack' in unknown['codecs'] and codec.msgpack is not None:
+                    msgpack_codec = codec.get_codec('msgpack')
+                    
+                    # 协商的响应仍使用JSON，之后的消息使用msgpack
+                    self._send_request(sock, {"command": "set_codec", "params": {"codec": "msgpack"}})
+                    switched = self._receive_response(sock) or {}
+                    send_frame(sock, msgpack_codec.encode(
+                        {"command": "process_key", "params": {"key_code": 110}, "id": 1}))
+                    raw = recv_frame(sock)
+                    response = msgpack_codec.decode(raw)
+                    send_frame(sock, msgpack_codec.encode({"command": "set_codec", "params": {"codec": "json"}}))
+                    back = msgpack_codec.decode(recv_frame(sock))
+                    self._send_request(sock, {"command": "ping"})
+                    pong = self._receive_response(sock) or {}
+                    
+                    if switched.get('codec') != 'msgpack' or not switched.get('success'):
+                        self.log(f"切换到msgpack失败: {switched}", "ERROR")
+                        return False
+                    composition = response.get('state', {}).get('composition', '')
+                    if raw[:1] == b'{' or response.get('id') != 1 or not composition.endswith('n'):
+                        self.log(f"msgpack往返错误: {raw[:32]!r} / {response}", "ERROR")
+                        return False
+                    if back.get('codec') != 'json' or not pong.get('success'):
+                        self.log(f"切换回JSON失败: {back} / {pong}", "ERROR")
+                        return False
+                else:
+                    self.log("服务器未安装msgpack，跳过msgpack往返测试")
+            finally:
+                sock.close()
+            
+            # msgpack不可用时set_codec返回错误，可用列表中没有msgpack
+            import ipc_server
+            installed = codec.msgpack
+            codec.msgpack = None
+            try:
+                server = ipc_server.IPCServer()
+                connection = ipc_server.ClientConnection(1)
+                unavailable = server._execute_request({"command": "set_codec", "params": {"codec": "msgpack"}},
+                                                      connection)
+            finally:
+                codec.msgpack = installed
+            
+            if ('error' not in unavailable or 'msgpack' in unavailable.get('codecs', [])
+                    or connection.pending_codec is not None):
+                self.log(f"msgpack不可用时的响应错误: {unavailable}", "ERROR")
+                return False
+            
+            self.log("编解码器协商测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"编解码器协商测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_stats(self) -> bool:
+        """测试运行指标"""
+        try:
+            self.log("测试运行指标...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            try:
+                self._send_request(sock, {"command": "stats"})
+                before = self._receive_response(sock)
+                
+                for key_code in [110, 105]:
+                    self._send_request(sock, {"command": "process_key", "params": {"key_code": key_code}})
+                    self._receive_response(sock)
+                self._send_request(sock, {"command": "no_such_command"})
+                self._receive_response(sock)
+                
+                self._send_request(sock, {"command": "stats"})
+                after = self._receive_response(sock)
+            finally:
+                sock.close()
+            
+            if not before or not after or not after.get('success'):
+                self.log(f"获取运行指标失败: {after}", "ERROR")
+                return False
+            
+            def command_count(stats, command, field='count'):
+                return stats['stats']['commands'].get(command, {}).get(field, 0)
+            
+            process_key = after['stats']['commands'].get('process_key', {})
+            if (command_count(after, 'process_key') - command_count(before, 'process_key') != 2
+                    or command_count(after, 'unknown', 'errors') - command_count(before, 'unknown', 'errors') != 1
+                    or not process_key.get('p99_ms', 0) > 0
+                    or after['stats']['bytes_received'] <= before['stats']['bytes_received']):
+                self.log(f"运行指标统计错误: {after}", "ERROR")
+                return False
+            
+            self.log("运行指标测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"运行指标测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_trace(self) -> bool:
+        """测试请求分阶段计时"""
+        try:
+            self.log("测试请求分阶段计时...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            try:
+                self._send_request(sock, {"command": "process_key", "params": {"key_code": 110}, "trace": True})
+                traced = self._receive_response(sock)
+                
+                self._send_request(sock, {"command": "process_key", "params": {"key_code": 105}})
+                untraced = self._receive_response(sock)
+            finally:
+                sock.close()
+            
+            trace = traced.get('trace') if traced else None
+            if not trace or 'trace' in (untraced or {}):
+                self.log(f"分阶段计时字段错误: {traced} / {untraced}", "ERROR")
+                return False
+            
+            stages = trace['stages_ns']
+            for stage in ('decode', 'engine_process_key', 'engine_get_context', 'build_state', 'encode'):
+                if stage not in stages:
+                    self.log(f"缺少计时阶段 {stage}: {stages}", "ERROR")
+                    return False
+            
+            if sum(stages.values()) != trace['total_ns']:
+                self.log(f"各阶段耗时之和与总耗时不一致: {trace}", "ERROR")
+                return False
+            
+            self.log("请求分阶段计时测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"请求分阶段计时测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_oversized_frame(self) -> bool:
+        """测试长度头超过MAX_FRAME_SIZE的帧（服务器应立即关闭连接，而不是等待读取）"""
+        try:
+            self.log("测试超长帧...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            try:
+                sock.sendall((0xFFFFFFF0).to_bytes(4, byteorder='little'))
+                try:
+                    closed = sock.recv(1) == b''
+                except ConnectionResetError:
+                    closed = True
+            except socket.timeout:
+                closed = False
+            finally:
+                sock.close()
+            
+            if not closed:
+                self.log("服务器未关闭长度头超限的连接", "ERROR")
+                return False
+            
+            # 服务器仍然正常处理其他连接
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            try:
+                self._send_request(sock, {"command": "ping"})
+                response = self._receive_response(sock)
+            finally:
+                sock.close()
+            
+            if not response or not response.get('success'):
+                self.log(f"超长帧之后服务器响应错误: {response}", "ERROR")
+                return False
+            
+            self.log("超长帧测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"超长帧测试异常: {e}", "ERROR")
+            return False
+    
+    def test_python_invalid_request(self) -> bool:
+        """测试不是JSON对象或命令名不是字符串的请求（应返回错误响应，连接保持可用）"""
+        try:
+            self.log("测试非对象请求...")
+            
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect((self.server_host, self.server_port))
+            
+            try:
+                responses = []
+                for body in (b'[1,2]', b'42', b'"ping"', b'{"command": [1]}'):
+                    send_frame(sock, body)
+                    responses.append(self._receive_response(sock))
+                
+                self._send_request(sock, {"command": "ping"})
+                pong = self._receive_response(sock)
+            finally:
+                sock.close()
+            
+            # 非对象请求返回success为false，其余错误与普通请求一样只要求带有error
+            for response in responses:
+                if not response or 'error' not in response:
+                    self.log(f"非对象请求的响应错误: {response}", "ERROR")
+                    return False
+            if any(response.get('success') is not False for response in responses[:3]):
+                self.log(f"非对象请求的响应缺少success: {responses}", "ERROR")
+                return False
+            
+            if not pong or not pong.get('success'):
+                self.log(f"非对象请求之后连接不可用: {pong}", "ERROR")
+                return False
+            
+            self.log("非对象请求测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"非对象请求测试异常: {e}", "ERROR")
+            return False
+    
     def _send_request(self, sock: socket.socket, request: Dict[str, Any]) -> bool:
         """发送请求"""
         try:
-            request_json = json.dumps(request)
-            request_data = request_json.encode('utf-8')
-            
-            # 发送消息长度
-            length_data = len(request_data).to_bytes(4, byteorder='little')
-            sock.send(length_data)
-            sock.send(request_data)
+            request_data = json.dumps(request).encode('utf-8')
+            send_frame(sock, request_data)
             
             return True
         except Exception as e:
@@ -211,20 +727,11 @@ class IntegrationTester:
     def _receive_response(self, sock: socket.socket) -> Optional[Dict[str, Any]]:
         """接收响应"""
         try:
-            # 接收响应长度
-            response_length_data = sock.recv(4)
-            if len(response_length_data) != 4:
-                return None
-            
-            response_length = int.from_bytes(response_length_data, byteorder='little')
-            
-            # 接收响应数据
-            response_data = sock.recv(response_length)
-            if len(response_data) != response_length:
+            response_data = recv_frame(sock)
+            if response_data is None:
                 return None
             
-            response_json = response_data.decode('utf-8')
-            return json.loads(response_json)
+            return json.loads(response_data.decode('utf-8'))
             
         except Exception as e:
             self.log(f"接收响应失败: {e}", "ERROR")
@@ -266,6 +773,698 @@ class IntegrationTester:
             self.log(f"DLL功能测试异常: {e}", "ERROR")
             return False
     
+    def test_log_sampler(self) -> bool:
+        """测试命令日志采样器（采样、限速、键数上限，服务器按指标命令名采样）"""
+        try:
+            self.log("测试日志采样器...")
+            
+            import logging
+            import ipc_server
+            from logging_setup import LogSampler
+            
+            sampler = LogSampler(sample_every=3)
+            decisions = [sampler.allow('ping') for _ in range(7)]
+            if decisions != [0, None, None, 2, None, None, 2]:
+                self.log(f"采样结果错误: {decisions}", "ERROR")
+                return False
+            
+            sampler = LogSampler(max_per_second=2)
+            decisions = [sampler.allow('ping') for _ in range(3)]
+            if decisions != [0, 0, None]:
+                self.log(f"限速结果错误: {decisions}", "ERROR")
+                return False
+            
+            sampler = LogSampler(max_keys=2)
+            for key in ('a', 'b', 'c'):
+                sampler.allow(key)
+            if list(sampler.states) != ['b', 'c']:
+                self.log(f"超过键数上限后未丢弃最早的键: {list(sampler.states)}", "ERROR")
+                return False
+            
+            # 任意未知命令名都计入同一个采样键
+            sampler = LogSampler()
+            server = ipc_server.IPCServer(command_log_sampler=sampler)
+            level, propagate = ipc_server.logger.level, ipc_server.logger.propagate
+            handler = logging.NullHandler()
+            ipc_server.logger.setLevel(logging.INFO)
+            ipc_server.logger.propagate = False
+            ipc_server.logger.addHandler(handler)
+            try:
+                responses = [server._execute_request({"command": f"no_such_command_{i}"}) for i in range(100)]
+                responses.append(server._execute_request({"command": "ping"}))
+            finally:
+                ipc_server.logger.removeHandler(handler)
+                ipc_server.logger.setLevel(level)
+                ipc_server.logger.propagate = propagate
+            
+            if any('error' not in response for response in responses[:-1]) or not responses[-1].get('success'):
+                self.log(f"命令响应错误: {responses[0]} / {responses[-1]}", "ERROR")
+                return False
+            if sorted(sampler.states) != ['ping', 'unknown']:
+                self.log(f"采样键错误: {sorted(sampler.states)[:5]}", "ERROR")
+                return False
+            
+            self.log("日志采样器测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"日志采样器测试异常: {e}", "ERROR")
+            return False
+    
+    def test_engine_paging(self) -> bool:
+        """测试引擎自己分页时的翻页（当前页取自引擎菜单，翻页键次数有上限，按当前页中的位置选词）"""
+        try:
+            self.log("测试引擎分页...")
+            
+            from rime_wrapper import RimeWrapper
+            
+            class PagedEngine:
+                """菜单只包含当前页的引擎，stuck时处理翻页键但不翻页"""
+                def __init__(self, pages: int, stuck: bool = False):
+                    self.pages = pages
+                    self.stuck = stuck
+                    self.page = 0
+                    self.page_keys = 0
+                
+                def process_key(self, session_id, key_code):
+                    if key_code in (RimeWrapper.PAGE_UP_KEY, RimeWrapper.PAGE_DOWN_KEY):
+                        self.page_keys += 1
+                        if not self.stuck:
+                            step = 1 if key_code == RimeWrapper.PAGE_DOWN_KEY else -1
+                            self.page = min(max(self.page + step, 0), self.pages - 1)
+                    return True
+                
+                def destroy_session(self, session_id):
+                    pass
+                
+                def select_candidate(self, session_id, index):
+                    # 引擎在当前页中选择
+                    return f"{self.page}-{index}"
+                
+                def get_context(self, session_id):
+                    return {
+                        'composition': {'preedit': 'yi'},
+                        'menu': {
+                            'candidates': [{'text': f"{self.page}-{i}"} for i in range(5)],
+                            'page_size': 5,
+                            'page_no': self.page,
+                            'is_last_page': self.page == self.pages - 1
+                        }
+                    }
+            
+            rime = RimeWrapper(backend='mock')
+            session_id = 1
+            
+            # 客户端直接发送翻页键后，page_down从引擎的当前页继续
+            rime.pyrime = PagedEngine(pages=4)
+            rime.process_key(RimeWrapper.PAGE_DOWN_KEY, session_id)
+            pages = [rime.page_down(session_id)['state']['page_no'],
+                     rime.page_up(session_id)['state']['page_no'],
+                     rime.get_page(99, session_id)['state']['page_no']]
+            if pages != [2, 1, 3]:
+                self.log(f"引擎分页翻页结果错误: {pages}", "ERROR")
+                return False
+            
+            # 候选词的index是当前页中的位置，选词时直接交给引擎
+            state = rime.get_page(1, session_id)['state']
+            index = state['candidates'][1]['index']
+            selected = rime.select_candidate(index, session_id).get('selected_text')
+            if index != 1 or selected != state['candidates'][1]['text']:
+                self.log(f"引擎分页时第{state['page_no'] + 1}页选择的候选词错误: index={index} {selected}", "ERROR")
+                return False
+            
+            # 引擎处理了翻页键但页码不变时停止发送
+            rime.pyrime = engine = PagedEngine(pages=4, stuck=True)
+            state = rime.get_page(3, session_id)['state']
+            if state['page_no'] != 0 or engine.page_keys != 1:
+                self.log(f"页码不变时未停止翻页: 第{state['page_no']}页，{engine.page_keys}次按键", "ERROR")
+                return False
+            
+            # 翻页键次数有上限
+            rime.pyrime = engine = PagedEngine(pages=10 ** 6)
+            state = rime.get_page(10 ** 6, session_id)['state']
+            if engine.page_keys != RimeWrapper.MAX_PAGE_KEYS or state['page_no'] != RimeWrapper.MAX_PAGE_KEYS:
+                self.log(f"翻页键次数超过上限: {engine.page_keys}", "ERROR")
+                return False
+            
+            self.log("引擎分页测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"引擎分页测试异常: {e}", "ERROR")
+            return False
+    
+    def test_state_cache(self) -> bool:
+        """测试模拟引擎下的状态缓存（未处理的按键直接返回缓存状态，处理了的按键使缓存失效）"""
+        try:
+            self.log("测试状态缓存...")
+            
+            from rime_wrapper import RimeWrapper
+            
+            rime = RimeWrapper(backend='mock')
+            session_id = rime.create_session()
+            
+            # 统计查询引擎上下文（重新构建状态）的次数
+            queries = []
+            get_context = rime.pyrime.get_context
+            def counting_get_context(sid):
+                queries.append(sid)
+                return get_context(sid)
+            rime.pyrime.get_context = counting_get_context
+            
+            try:
+                typed = rime.process_key(110, session_id)        # "n"，引擎处理
+                ignored = rime.process_key(49, session_id)       # "1"，模拟引擎不处理
+                cached = rime.get_current_state(session_id)
+                cached_queries = len(queries)
+                
+                extended = rime.process_key(105, session_id)     # "i"
+                erased = rime.process_key(65288, session_id)     # 退格
+                after_erase = rime.get_current_state(session_id)
+                final_queries = len(queries)
+            finally:
+                rime.destroy_session(session_id)
+            
+            if cached_queries != 1:
+                self.log(f"未处理的按键或get_state重新构建了状态: 查询引擎{cached_queries}次", "ERROR")
+                return False
+            if (ignored.get('processed') is not False or ignored.get('state') != typed['state']
+                    or ignored.get('version') != typed['version'] or cached.get('version') != typed['version']):
+                self.log(f"未处理的按键应返回缓存的状态: {typed} / {ignored} / {cached}", "ERROR")
+                return False
+            
+            if final_queries != 3:
+                self.log(f"处理了的按键没有使缓存失效: 查询引擎{final_queries}次", "ERROR")
+                return False
+            compositions = [r['state']['composition'] for r in (extended, erased, after_erase)]
+            versions = [r['version'] for r in (extended, erased, after_erase)]
+            base = typed['version']
+            if compositions != ["ni", "n", "n"] or versions != [base + 1, base + 2, base + 2]:
+                self.log(f"缓存失效后的状态错误: {compositions} {versions}", "ERROR")
+                return False
+            
+            self.log("状态缓存测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"状态缓存测试异常: {e}", "ERROR")
+            return False
+    
+    def test_delta_after_eviction(self) -> bool:
+        """测试会话被回收并重新创建后，之前的base_version不会匹配到新会话的状态"""
+        try:
+            self.log("测试会话回收后的增量状态...")
+            
+            import ipc_server
+            
+            # 会话池只有一个会话，使用另一个session_id时回收之前的会话
+            server = ipc_server.IPCServer(max_sessions=1, rime_backend='mock')
+            if not server._initialize():
+                self.log("服务器初始化失败", "ERROR")
+                return False
+            
+            def request(command: str, **params) -> Dict[str, Any]:
+                return server._execute_request({"command": command, "params": params})
+            
+            try:
+                before = request("process_key", session_id="a", key_code=110, delta=True)
+                request("process_key", session_id="b", key_code=121)
+                after = request("process_key", session_id="a", key_code=105, delta=True,
+                                base_version=before.get('version'))
+            finally:
+                server.session_manager.close()
+            
+            if not after.get('full') or after.get('state', {}).get('composition') != "i":
+                self.log(f"会话重新创建后应返回完整状态: {before} / {after}", "ERROR")
+                return False
+            if after['version'] <= before['version']:
+                self.log(f"会话重新创建后版本号没有递增: {before['version']} -> {after['version']}", "ERROR")
+                return False
+            
+            self.log("会话回收后的增量状态测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"会话回收后的增量状态测试异常: {e}", "ERROR")
+            return False
+    
+    def test_native_backend(self) -> bool:
+        """测试RimeWrapper的native后端（进程内通过ctypes调用librime_dll）"""
+        try:
+            self.log("测试native引擎后端...")
+            
+            from rime_wrapper import RimeWrapper
+            
+            rime = RimeWrapper(backend='native')
+            if not rime.is_initialized:
+                self.log("native后端初始化失败（librime_dll未编译？）", "ERROR")
+                return False
+            
+            session_id = rime.create_session()
+            try:
+                for char in "nihao":
+                    result = rime.process_key(ord(char), session_id)
+                candidates = result.get('state', {}).get('candidates', [])
+                if not candidates or candidates[0]['text'] != "你好":
+                    self.log(f"native后端候选词错误: {result}", "ERROR")
+                    return False
+                
+                result = rime.select_candidate(0, session_id)
+                if result.get('selected_text') != "你好" or result['state']['composition']:
+                    self.log(f"native后端选词错误: {result}", "ERROR")
+                    return False
+            finally:
+                rime.destroy_session(session_id)
+            
+            if 'error' not in rime.get_current_state(session_id):
+                self.log("已销毁的会话应返回错误", "ERROR")
+                return False
+            
+            self.log("native引擎后端测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"native引擎后端测试异常: {e}", "ERROR")
+            return False
+    
+    def test_offline_dictionary(self) -> bool:
+        """测试模拟后端的离线词典（*.dict.yaml解析、前缀补全和排序）"""
+        try:
+            self.log("测试离线词典...")
+            
+            import tempfile
+            from rime_wrapper import RimeWrapper
+            
+            with tempfile.TemporaryDirectory() as directory:
+                with open(os.path.join(directory, "test.dict.yaml"), 'w', encoding='utf-8') as f:
+                    f.write("# 测试词典\n---\nname: test\nversion: \"1.0\"\n"
+                            "import_tables:\n  - test.extra\n...\n\n"
+                            "你\tni\t100\n尼\tni\t10\n好\thao\t100\n你好\tni hao\t50\n"
+                            "你们\t\t80\n们\tmen\t100\n")
+                with open(os.path.join(directory, "test.extra.dict.yaml"), 'w', encoding='utf-8') as f:
+                    # 列顺序与默认不同
+                    f.write("---\nname: test.extra\ncolumns:\n  - code\n  - text\n  - weight\n...\n"
+                            "ni hao ma\t你好吗\t30\n")
+                
+                rime = RimeWrapper(backend='mock', dictionaries=[os.path.join(directory, "test.dict.yaml")])
+            
+            if not rime.is_initialized:
+                self.log("离线词典加载失败", "ERROR")
+                return False
+            
+            session_id = rime.create_session()
+            try:
+                expected = {
+                    # 编码完全匹配的词条在前，补全按权重排在后面（没有编码的"你们"由单字编码拼出）
+                    "ni": ["你", "尼", "你们", "你好", "你好吗"],
+                    "nih": ["你好", "你好吗"],
+                    "nihaom": ["你好吗"],
+                    "nix": []
+                }
+                for composition, texts in expected.items():
+                    rime.clear_composition(session_id)
+                    for char in composition:
+                        result = rime.process_key(ord(char), session_id)
+                    candidates = [candidate['text'] for candidate in result['state']['candidates']]
+                    if candidates != texts:
+                        self.log(f"输入 {composition} 的候选词错误: {candidates}", "ERROR")
+                        return False
+                
+                # 退格回到上一个前缀的候选词（包括经过词典中没有的前缀）
+                for _ in range(2):
+                    result = rime.process_key(65288, session_id)
+                candidates = [candidate['text'] for candidate in result['state']['candidates']]
+                if result['state']['composition'] != "n" or candidates != ["你", "你们", "你好", "你好吗", "尼"]:
+                    self.log(f"退格后的状态错误: {result['state']}", "ERROR")
+                    return False
+                result = rime.process_key(ord('i'), session_id)
+                candidates = [candidate['text'] for candidate in result['state']['candidates']]
+                if candidates != expected["ni"]:
+                    self.log(f"退格后重新输入的候选词错误: {candidates}", "ERROR")
+                    return False
+            finally:
+                rime.destroy_session(session_id)
+            
+            rime = RimeWrapper(backend='mock', dictionaries=["/nonexistent/missing.dict.yaml"])
+            if rime.is_initialized:
+                self.log("词典文件不存在时应初始化失败", "ERROR")
+                return False
+            
+            self.log("离线词典测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"离线词典测试异常: {e}", "ERROR")
+            return False
+    
+    def test_compiled_dictionary(self) -> bool:
+        """测试编译后的离线词典（rime_dict.py编译，RimeWrapper用mmap打开）"""
+        try:
+            self.log("测试编译后的离线词典...")
+            
+            import tempfile
+            from rime_wrapper import RimeWrapper
+            
+            with tempfile.TemporaryDirectory() as directory:
+                source = os.path.join(directory, "test.dict.yaml")
+                compiled = os.path.join(directory, "test.trie")
+                with open(source, 'w', encoding='utf-8') as f:
+                    f.write("---\nname: test\n...\n"
+                            "你\tni\t100\n尼\tni\t10\n你好\tni hao\t50\n你好吗\tni hao ma\t30\n")
+                
+                script = os.path.join(os.path.dirname(__file__), '..', 'python_component', 'rime_dict.py')
+                result = subprocess.run([sys.executable, script, source, "-o", compiled],
+                                        capture_output=True, text=True, timeout=30)
+                if result.returncode != 0 or not os.path.exists(compiled):
+                    self.log(f"编译词典失败: {result.stderr}", "ERROR")
+                    return False
+                
+                source_rime = RimeWrapper(backend='mock', dictionaries=[source])
+                compiled_rime = RimeWrapper(backend='mock', dictionaries=[compiled])
+                if not compiled_rime.is_initialized:
+                    self.log("编译后的词典加载失败", "ERROR")
+                    return False
+                
+                for composition in ("n", "ni", "nih", "nihaoma", "nix"):
+                    states = []
+                    for rime in (source_rime, compiled_rime):
+                        session_id = rime.create_session()
+                        for char in composition:
+                            state = rime.process_key(ord(char), session_id)['state']
+                        states.append(state['candidates'])
+                        rime.destroy_session(session_id)
+                    if states[0] != states[1]:
+                        self.log(f"输入 {composition} 时编译后词典的候选词不同: {states[1]}", "ERROR")
+                        return False
+                
+                compiled_rime.pyrime.dictionary.close()
+                
+                # 截断的文件、与*.dict.yaml混用都应初始化失败
+                with open(compiled, 'rb') as f:
+                    data = f.read()
+                with open(compiled, 'wb') as f:
+                    f.write(data[:len(data) // 2])
+                for dictionaries in ([compiled], [compiled, source]):
+                    if RimeWrapper(backend='mock', dictionaries=dictionaries).is_initialized:
+                        self.log(f"词典 {dictionaries} 应初始化失败", "ERROR")
+                        return False
+            
+            self.log("编译后的离线词典测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"编译后的离线词典测试异常: {e}", "ERROR")
+            return False
+    
+    def test_worker_pool(self) -> bool:
+        """测试多进程工作池（按会话分配、合并统计、工作进程停止响应时不阻塞、重启工作进程）"""
+        if not hasattr(socket, 'send_fds'):
+            self.log("当前平台不支持工作池，跳过测试")
+            return True
+        
+        port = self.server_port - 2
+        server_script = os.path.join(os.path.dirname(__file__), '..', 'python_component', 'ipc_server.py')
+        # 所有工作进程都初始化完成后才发出就绪通知
+        process, ready = start_server([
+            sys.executable, server_script, "--workers", "2", "--port", str(port), "--log-file", ""
+        ], timeout=30, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        
+        def connect() -> socket.socket:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(10)
+            sock.connect((self.server_host, port))
+            return sock
+        
+        def request(sock: socket.socket, command: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+            self._send_request(sock, {"command": command, "params": params or {}})
+            return self._receive_response(sock) or {}
+        
+        try:
+            self.log("测试多进程工作池...")
+            
+            if not ready:
+                self.log("工作池启动失败", "ERROR")
+                return False
+            
+            # 每个会话使用自己的连接，由前端交给会话所属的工作进程
+            workers = {}
+            for session_id in range(1, 7):
+                sock = connect()
+                try:
+                    for key_code in [110, 105]:
+                        response = request(sock, "process_key", {"key_code": key_code, "session_id": session_id})
+                    if response.get('state', {}).get('composition') != "ni":
+                        self.log(f"会话{session_id}处理按键失败: {response}", "ERROR")
+                        return False
+                    stats = request(sock, "stats")
+                    workers[session_id] = stats.get('worker')
+                finally:
+                    sock.close()
+            
+            if set(workers.values()) != {0, 1}:
+                self.log(f"会话没有分配到所有工作进程: {workers}", "ERROR")
+                return False
+            
+            sock = connect()
+            try:
+                stats = request(sock, "stats")
+                mine = stats.get('worker')
+                foreign = next(s for s, worker in workers.items() if worker != mine)
+                rejected = request(sock, "process_key", {"key_code": 110, "session_id": foreign})
+            finally:
+                sock.close()
+            # 属于另一个工作进程的会话被拒绝
+            if not rejected.get('error'):
+                self.log(f"跨工作进程的会话没有被拒绝: {rejected}", "ERROR")
+                return False
+            if (len(stats.get('workers', [])) != 2
+                    or stats['stats']['commands'].get('process_key', {}).get('count') != 12):
+                self.log(f"工作池统计错误: {stats}", "ERROR")
+                return False
+            
+            # 一个工作进程停止响应时，前端传递连接和其他工作进程等待工作池统计都不阻塞事件循环
+            stuck = stats['workers'][1]
+            stuck_session = next(s for s, worker in workers.items() if worker == stuck['index'])
+            live_session = next(s for s, worker in workers.items() if worker != stuck['index'])
+            os.kill(stuck['pid'], signal.SIGSTOP)
+            sockets = []
+            try:
+                # 第一帧接近MAX_INITIAL_BYTES，几个连接就能填满通往停止的工作进程的通道
+                for _ in range(10):
+                    sock = connect()
+                    sockets.append(sock)
+                    self._send_request(sock, {"command": "ping",
+                                              "params": {"session_id": stuck_session, "padding": "x" * 60000}})
+                
+                start = time.perf_counter()
+                ping_sock = connect()
+                sockets.append(ping_sock)
+                routed = request(ping_sock, "ping", {"session_id": live_session})
+                route_elapsed = time.perf_counter() - start
+                
+                # 前端收集统计时等待停止的工作进程超时，期间同一工作进程的其他连接照常响应
+                stats_sock = connect()
+                sockets.append(stats_sock)
+                self._send_request(stats_sock, {"command": "stats", "params": {"session_id": live_session}})
+                time.sleep(0.1)
+                start = time.perf_counter()
+                pong = request(ping_sock, "ping", {"session_id": live_session})
+                ping_elapsed = time.perf_counter() - start
+                pool_stats = self._receive_response(stats_sock) or {}
+                
+                # 前端等待停止的工作进程期间结束另一个工作进程，监督线程不等统计收集完成就重启它
+                victim = stats['workers'][0]
+                self._send_request(stats_sock, {"command": "stats", "params": {"session_id": live_session}})
+                time.sleep(0.1)
+                os.kill(victim['pid'], 9)
+                start = time.perf_counter()
+                deadline = start + 10
+                while True:
+                    sock = connect()
+                    sockets.append(sock)
+                    try:
+                        restarted = request(sock, "process_key", {"key_code": 110, "session_id": live_session})
+                    except OSError:
+                        restarted = {}
+                    if restarted.get('success') or time.perf_counter() > deadline:
+                        break
+                    time.sleep(0.05)
+                restart_elapsed = time.perf_counter() - start
+            finally:
+                os.kill(stuck['pid'], signal.SIGCONT)
+                for sock in sockets:
+                    sock.close()
+            
+            if not routed.get('success') or route_elapsed > 0.5:
+                self.log(f"工作进程停止响应时前端路由被阻塞: {route_elapsed:.2f}秒 {routed}", "ERROR")
+                return False
+            if not pong.get('success') or ping_elapsed > 0.5 or not pool_stats.get('success'):
+                self.log(f"等待工作池统计时工作进程被阻塞: {ping_elapsed:.2f}秒 {pong} / {pool_stats}", "ERROR")
+                return False
+            # 重启等待RESTART_BACKOFF_MIN（0.5秒），不应再等待统计收集超时（EXPORT_TIMEOUT）
+            if not restarted.get('success') or restart_elapsed > 1.2:
+                self.log(f"统计收集期间工作进程重启被推迟: {restart_elapsed:.2f}秒 {restarted}", "ERROR")
+                return False
+            print(f"  统计收集期间重启工作进程: {restart_elapsed * 1000:.0f}ms")
+            
+            # 被结束的工作进程由前端重启，会话重新可用
+            session_id = next(s for s, worker in workers.items() if worker == victim['index'])
+            deadline = time.time() + 10
+            while True:
+                sock = connect()
+                try:
+                    response = request(sock, "process_key", {"key_code": 110, "session_id": session_id})
+                    stats = request(sock, "stats")
+                finally:
+                    sock.close()
+                restarted = [w for w in stats.get('workers', []) if w['index'] == victim['index']]
+                if response.get('success') and restarted and restarted[0]['restarts'] == 1:
+                    break
+                if time.time() > deadline:
+                    self.log(f"工作进程没有重启: {stats}", "ERROR")
+                    return False
+                time.sleep(0.2)
+            
+            self.log("多进程工作池测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"多进程工作池测试异常: {e}", "ERROR")
+            return False
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    def test_startup_readiness(self) -> bool:
+        """测试就绪通知和启动阶段计时（--ready-fd、--startup-profile）"""
+        server_script = os.path.join(os.path.dirname(__file__), '..', 'python_component', 'ipc_server.py')
+        args = [sys.executable, server_script, "--asyncio", "--port", str(self.server_port - 3),
+                "--log-file", "", "--startup-profile"]
+        try:
+            self.log("测试就绪通知...")
+            
+            process, ready = start_server(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            try:
+                # 收到通知时已经开始监听
+                sock = socket.create_connection((self.server_host, self.server_port - 3), timeout=5) if ready else None
+                if sock:
+                    self._send_request(sock, {"command": "ping"})
+                    response = self._receive_response(sock)
+                    sock.close()
+            finally:
+                process.terminate()
+                _, stderr = process.communicate(timeout=10)
+            if not ready or not response or not response.get('success'):
+                self.log(f"服务器没有发出就绪通知: {stderr}", "ERROR")
+                return False
+            if not all(stage in stderr for stage in ("import", "dictionary", "listen", "total")):
+                self.log(f"启动阶段计时缺失: {stderr}", "ERROR")
+                return False
+            
+            # 启动失败时管道关闭，不必等到超时
+            started = time.time()
+            process, ready = start_server(args + ["--dict", "/nonexistent/missing.dict.yaml"], timeout=30,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            process.terminate()
+            process.wait(timeout=10)
+            if ready or time.time() - started > 10:
+                self.log("启动失败没有被及时发现", "ERROR")
+                return False
+            
+            self.log("就绪通知测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"就绪通知测试异常: {e}", "ERROR")
+            return False
+    
+    def test_local_transport(self, transport: str) -> bool:
+        """测试本机传输方式（unix/shm）的请求处理"""
+        from ipc_server import IPCClient
+        import shm_transport
+        
+        if not hasattr(socket, 'AF_UNIX') or (transport == 'shm' and not shm_transport.is_supported()):
+            self.log(f"当前平台不支持{transport}传输，跳过测试")
+            return True
+        
+        unix_path = f"/tmp/unity_rime_test_{os.getpid()}_{transport}.sock"
+        server_script = os.path.join(os.path.dirname(__file__), '..', 'python_component', 'ipc_server.py')
+        process, ready = start_server([
+            sys.executable, server_script, "--asyncio", "--transport", transport, "--unix-path", unix_path,
+            "--log-file", ""
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        client = IPCClient(transport=transport, unix_path=unix_path, pipelined=True, timeout=30)
+        
+        try:
+            self.log(f"测试{transport}传输...")
+            
+            if not ready or not client.connect():
+                self.log(f"无法连接{transport}服务器", "ERROR")
+                return False
+            
+            if not (client.send_request("ping") or {}).get('success'):
+                self.log(f"{transport}传输ping失败", "ERROR")
+                return False
+            for key_code in [110, 105]:
+                response = client.send_request("process_key", {"key_code": key_code}) or {}
+            if response.get('state', {}).get('composition') != "ni" or not response['state']['candidates']:
+                self.log(f"{transport}传输处理按键失败: {response}", "ERROR")
+                return False
+            
+            if transport == 'shm':
+                # 放不进环形缓冲区的响应换成错误响应，连接仍然可用
+                operations = [{"command": "get_state"}] * 12000
+                response = client.send_batch(operations, results="all") or {}
+                if response.get('success') is not False or 'error' not in response:
+                    self.log(f"过大的响应没有返回错误: {str(response)[:200]}", "ERROR")
+                    return False
+                if not (client.send_request("ping") or {}).get('success'):
+                    self.log("过大的响应之后连接不可用", "ERROR")
+                    return False
+                stats = (client.send_request("stats") or {}).get('stats', {})
+                if stats.get('queue_depth') != 1:
+                    self.log(f"队列深度统计错误: {stats.get('queue_depth')}", "ERROR")
+                    return False
+                
+                # 服务器停止读取时请求缓冲区写满，发送在超时后失败而不是一直自旋
+                padding = "x" * (shm_transport.MAX_MESSAGE_SIZE // 4)
+                os.kill(process.pid, signal.SIGSTOP)
+                try:
+                    client.timeout = 0.5
+                    start = time.perf_counter()
+                    futures = [client.submit("ping", {"padding": padding}) for _ in range(5)]
+                    elapsed = time.perf_counter() - start
+                finally:
+                    client.timeout = 30
+                    os.kill(process.pid, signal.SIGCONT)
+                failed = [f for f in futures if f.done() and f.exception() is not None]
+                errors = [f.exception() for f in failed]
+                if not errors or not all(isinstance(e, TimeoutError) for e in errors) or elapsed > 5:
+                    self.log(f"请求缓冲区已满时发送没有超时失败: {elapsed:.2f}秒 {errors}", "ERROR")
+                    return False
+                # 写入缓冲区的请求在服务器恢复后照常响应
+                responses = [f.result(10) for f in futures if f not in failed]
+                if not responses or not all(r.get('success') for r in responses):
+                    self.log(f"服务器恢复后请求没有响应: {responses}", "ERROR")
+                    return False
+            
+            self.log(f"{transport}传输测试成功")
+            return True
+            
+        except Exception as e:
+            self.log(f"{transport}传输测试异常: {e}", "ERROR")
+            return False
+        finally:
+            client.disconnect()
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
     def test_performance(self) -> bool:
         """性能测试"""
         try:
@@ -280,7 +1479,7 @@ class IntegrationTester:
             self.log(f"性能测试结果:")
             self.log(f"  Python模式: {python_performance:.2f} ms/操作")
             if dll_performance > 0:
-                self.log(f"  DLL模式: {dll_performance:.2f} ms/操作")
+                self.log(f"  DLL模式: {dll_performance:.4f} ms/操作")
             
             return True
             
@@ -319,10 +1518,30 @@ class IntegrationTester:
             return -1
     
     def _test_dll_performance(self) -> float:
-        """测试DLL性能"""
-        # 这里可以添加DLL性能测试代码
-        # 由于需要在Unity环境中运行，这里返回模拟值
-        return 0.5  # 假设DLL性能更好
+        """测试DLL性能（进程内通过ctypes调用librime_dll，按键序列与Python模式相同）"""
+        try:
+            from rime_native import NativeRime, RimeResult
+            
+            native = NativeRime()
+            session_id = native.create_session()
+            result = RimeResult()
+            
+            test_count = 100
+            start_time = time.perf_counter()
+            
+            for i in range(test_count):
+                native.lib.RimeProcessKey(session_id, 97 + (i % 26), ctypes.byref(result))
+                native.lib.RimeFreeResult(ctypes.byref(result))
+            
+            end_time = time.perf_counter()
+            native.destroy_session(session_id)
+            
+            total_time = (end_time - start_time) * 1000  # 转换为毫秒
+            return total_time / test_count
+            
+        except OSError as e:
+            self.log(f"DLL不可用，跳过DLL性能测试: {e}", "WARNING")
+            return -1
     
     def run_all_tests(self) -> bool:
         """运行所有测试"""
@@ -350,15 +1569,169 @@ class IntegrationTester:
                     all_passed = False
                 else:
                     self.test_results.append(("Python输入处理", True))
+                
+                # 测试4: 多客户端并发
+                if not self.test_python_concurrent_clients():
+                    self.test_results.append(("并发客户端测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("并发客户端测试", True))
+                
+                # 测试5: 会话隔离
+                if not self.test_python_session_isolation():
+                    self.test_results.append(("会话隔离测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("会话隔离测试", True))
+                
+                # 测试6: 批量命令
+                if not self.test_python_batch():
+                    self.test_results.append(("批量命令测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("批量命令测试", True))
+                
+                # 测试7: 流水线请求
+                if not self.test_python_pipelining():
+                    self.test_results.append(("流水线请求测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("流水线请求测试", True))
+                
+                # 测试8: 候选词翻页
+                if not self.test_python_paging():
+                    self.test_results.append(("候选词翻页测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("候选词翻页测试", True))
+                
+                # 测试9: 增量状态
+                if not self.test_python_delta():
+                    self.test_results.append(("增量状态测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("增量状态测试", True))
+                
+                # 测试10: 编解码器协商
+                if not self.test_python_codec():
+                    self.test_results.append(("编解码器协商测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("编解码器协商测试", True))
+                
+                # 测试11: 运行指标
+                if not self.test_python_stats():
+                    self.test_results.append(("运行指标测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("运行指标测试", True))
+                
+                # 测试12: 分阶段计时
+                if not self.test_python_trace():
+                    self.test_results.append(("分阶段计时测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("分阶段计时测试", True))
+                
+                # 测试13: 超长帧
+                if not self.test_python_oversized_frame():
+                    self.test_results.append(("超长帧测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("超长帧测试", True))
+                
+                # 测试14: 非对象请求
+                if not self.test_python_invalid_request():
+                    self.test_results.append(("非对象请求测试", False))
+                    all_passed = False
+                else:
+                    self.test_results.append(("非对象请求测试", True))
         
-        # 测试4: DLL功能
+        # 测试15: DLL功能
         if not self.test_dll_functionality():
             self.test_results.append(("DLL功能测试", False))
             all_passed = False
         else:
             self.test_results.append(("DLL功能测试", True))
         
-        # 测试5: 性能测试
+        # 测试16: 日志采样器
+        if not self.test_log_sampler():
+            self.test_results.append(("日志采样器测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("日志采样器测试", True))
+        
+        # 测试17: 引擎分页
+        if not self.test_engine_paging():
+            self.test_results.append(("引擎分页测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("引擎分页测试", True))
+        
+        # 测试18: 状态缓存
+        if not self.test_state_cache():
+            self.test_results.append(("状态缓存测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("状态缓存测试", True))
+        
+        # 测试19: 会话回收后的增量状态
+        if not self.test_delta_after_eviction():
+            self.test_results.append(("会话回收后的增量状态测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("会话回收后的增量状态测试", True))
+        
+        # 测试20: native引擎后端
+        if not self.test_native_backend():
+            self.test_results.append(("native引擎后端测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("native引擎后端测试", True))
+        
+        # 测试21: 离线词典
+        if not self.test_offline_dictionary():
+            self.test_results.append(("离线词典测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("离线词典测试", True))
+        
+        # 测试22: 编译后的离线词典
+        if not self.test_compiled_dictionary():
+            self.test_results.append(("编译后的离线词典测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("编译后的离线词典测试", True))
+        
+        # 测试23: 多进程工作池
+        if not self.test_worker_pool():
+            self.test_results.append(("多进程工作池测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("多进程工作池测试", True))
+        
+        # 测试24: 就绪通知与启动计时
+        if not self.test_startup_readiness():
+            self.test_results.append(("就绪通知测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("就绪通知测试", True))
+        
+        # 测试25: Unix域套接字传输
+        if not self.test_local_transport('unix'):
+            self.test_results.append(("Unix域套接字传输测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("Unix域套接字传输测试", True))
+        
+        # 测试26: 共享内存传输
+        if not self.test_local_transport('shm'):
+            self.test_results.append(("共享内存传输测试", False))
+            all_passed = False
+        else:
+            self.test_results.append(("共享内存传输测试", True))
+        
+        # 测试27: 性能测试
         if not self.test_performance():
             self.test_results.append(("性能测试", False))
             all_passed = False
@@ -133,6 +133,8 @@ namespace UnityRime
             try
             {
                 tcpClient = new TcpClient();
+                // 长度头和消息体分两次写入，关闭Nagle算法避免等待服务器的延迟确认
+                tcpClient.NoDelay = true;
                 
                 // 异步连接
                 var connectTask = tcpClient.ConnectAsync(serverHost, serverPort);